@@ -0,0 +1,37 @@
+import dspy
+
+# 要約を参照する場合の references の説明（条文そのものではないことをLMに伝える）
+SUMMARIZED_REFERENCES_DESC = "収集された情報源と引用番号（法令の条文は原文ではなく平易な要約）"
+
+
+class SummarizeArticle(dspy.Signature):
+    """あなたは日本の法令に精通し、条文を正確かつ分かりやすく言い換えることに定評のある専門家です。
+    下記の条文を、法令に詳しくない人にも分かる平易な日本語で要約してください。
+
+    要約にあたって次のルールを厳守すること
+    - 誰が（主体）、何を（義務・禁止・許可などの内容）、どのような場合に（要件・例外）を落とさないこと
+    - 準用・読替えや他の条への参照は、参照先の条番号を残したまま簡潔に述べること
+    - 条文にない内容を補ったり、解釈を加えたりしないこと
+    - 要約の文字数は80〜200文字程度とし、要約の文面のみ生成すること
+    """
+
+    title = dspy.InputField(desc="法令名と条名", format=str)
+    article = dspy.InputField(desc="条文", format=str)
+    summary = dspy.OutputField(desc="条文の平易な要約", format=str)
+
+
+class ArticleSummarizer(dspy.Module):
+    def __init__(self, lm, max_chars: int = 4096) -> None:
+        self.lm = lm
+        self.max_chars = max_chars
+        self.summarize = dspy.Predict(SummarizeArticle)
+
+    def forward(self, title: str, article: str) -> dspy.Prediction:
+        with dspy.settings.context(lm=self.lm):
+            result = self.summarize(title=title, article=article[: self.max_chars])
+        return dspy.Prediction(summary=result.summary)
+
+
+def with_summarized_references(signature_cls: type[dspy.Signature]) -> type[dspy.Signature]:
+    """references に条文の要約を渡す場合のシグネチャ"""
+    return signature_cls.with_updated_fields("references", desc=SUMMARIZED_REFERENCES_DESC)
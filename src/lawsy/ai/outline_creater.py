@@ -3,6 +3,7 @@ import re
 import dspy
 from pydantic import BaseModel
 
+from lawsy.ai.article_summarizer import with_summarized_references
 from lawsy.utils.logging import logger
 
 
@@ -172,9 +173,13 @@ class Outline(BaseModel):
 
 
 class OutlineCreater(dspy.Module):
-    def __init__(self, lm) -> None:
+    def __init__(self, lm, use_summaries: bool = False) -> None:
+        """
+        Args:
+            use_summaries: references の条文が原文ではなく要約（summarize-article-chunks で作成）の場合は True
+        """
         self.lm = lm
-        self.gen_outline = dspy.Predict(CreateOutline)
+        self.gen_outline = dspy.Predict(with_summarized_references(CreateOutline) if use_summaries else CreateOutline)
         self.fix_outline = dspy.Predict(FixOutline)
 
     @staticmethod
@@ -2,6 +2,7 @@ from typing import AsyncGenerator
 
 import dspy
 
+from lawsy.ai.article_summarizer import with_summarized_references
 from lawsy.ai.utils.stream_writer import StreamLineWriter
 
 
@@ -70,8 +71,14 @@ class StreamLeadWriter(StreamLineWriter):
 
 
 class StreamSectionWriter(StreamLineWriter):
-    def __init__(self, lm) -> None:
-        super().__init__(lm=lm, signature_cls=WriteSection)
+    def __init__(self, lm, use_summaries: bool = False) -> None:
+        """
+        Args:
+            use_summaries: references の条文が原文ではなく要約（summarize-article-chunks で作成）の場合は True
+        """
+        super().__init__(
+            lm=lm, signature_cls=with_summarized_references(WriteSection) if use_summaries else WriteSection
+        )
 
     async def __call__(self, query: str, references: str, section_outline: str) -> AsyncGenerator[str, None]:
         async for chunk in self.generate(
@@ -24,6 +24,8 @@ from lawsy.app.utils.history import Report
 from lawsy.app.utils.lm import load_lm
 from lawsy.app.utils.mindmap import draw_mindmap
 from lawsy.app.utils.preload import (
+    load_article_cross_references,
+    load_article_structure,
     load_text_encoder,
     load_vector_search_article_retriever,
 )
@@ -53,6 +55,18 @@ def construct_query_for_fusion(expanded_queries: list[str]) -> str:
     )
 
 
+def get_article_reference_text(result, use_summary: bool, max_chars: int = 1024) -> str:
+    """
+    条文の検索結果をアウトライン・セクションの作成に渡す本文
+    use_summary が True で要約（summarize-article-chunks で作成）があれば要約、なければ見出しを除いた条文
+    """
+    summary = result.meta.get("summary")
+    if use_summary and summary:
+        return summary
+    chunk_after_title = "\n".join(result.snippet.split("\n")[1:])
+    return chunk_after_title[:max_chars]
+
+
 async def write_section(section_placeholder, section_writer, query: str, references: str, section_outline: str):
     # section_placeholder.write_stream()
     text = ""
@@ -90,6 +104,25 @@ def create_research_page():
     lm_name = os.getenv("LAWSY_LM", "openai/gpt-4o")
     logger.info(f"using LM: {lm_name}")
     lm = load_lm(lm_name)
+    # 条文の代わりにオフラインで作成した要約を参照する
+    use_article_summaries = str(os.getenv("LAWSY_USE_ARTICLE_SUMMARIES", "False")).lower() in ("1", "true", "yes")
+    logger.info(f"using article summaries: {use_article_summaries}")
+    # 検索でヒットした条が参照している条（create-article-chunk-references で作成）もナレッジに加える
+    article_references = None
+    if str(os.getenv("LAWSY_USE_ARTICLE_REFERENCES", "False")).lower() in ("1", "true", "yes"):
+        article_references = load_article_cross_references()
+        if article_references is None:
+            logger.warning("LAWSY_USE_ARTICLE_REFERENCES is set but article_chunk_references.jsonl does not exist")
+    logger.info(f"using article references: {article_references is not None}")
+    # 検索でヒットした条の前後の条・項（neighbors）または同じ章・節の条（siblings）もナレッジに加える
+    article_structure = None
+    article_context_scope = os.getenv("LAWSY_ARTICLE_CONTEXT_SCOPE", "")
+    if article_context_scope:
+        assert article_context_scope in ("neighbors", "siblings"), article_context_scope
+        article_structure = load_article_structure()
+        if article_structure is None:
+            logger.warning("LAWSY_ARTICLE_CONTEXT_SCOPE is set but article_chunks.structure.json does not exist")
+    logger.info(f"using article context: {article_context_scope if article_structure is not None else None}")
 
     # サマリー専用LM（指定がなければ通常のLMを使用）
     summary_lm_name = os.getenv("LAWSY_VIOLATION_SUMMARY_LM", lm_name)
@@ -291,12 +324,26 @@ def create_research_page():
             with st.chat_message("assistant", avatar=logo):
                 st.write(content)
         messages.append({"role": "assistant", "content": content})
+    if article_references is not None:
+        num_hits = len(article_search_results)
+        article_search_results = vector_search_article_retriever.add_referenced_articles(
+            article_search_results, article_references
+        )
+        logger.info(f"added {len(article_search_results) - num_hits} referenced articles")
+    if article_structure is not None:
+        num_hits = len(article_search_results)
+        article_search_results = vector_search_article_retriever.add_context_articles(
+            article_search_results, article_structure, scope=article_context_scope
+        )
+        logger.info(f"added {len(article_search_results) - num_hits} context articles")
     # fusion by bi-encoder
     status.update(label="収集したナレッジのリランキング...", state="running")
-    url_to_articles = {result.url: result for result in article_search_results}
-    unique_article_search_results = list(url_to_articles.values())
+    # 条文は (rev_id, anchor) で重複を除く（文書のチャンクはURLを持たない）
+    key_to_articles = {(result.rev_id, result.anchor): result for result in article_search_results}
+    unique_article_search_results = list(key_to_articles.values())
+    article_urls = {result.url for result in unique_article_search_results if result.url}
     url_to_web_pages = {
-        result.url: result for result in web_search_results if result.url not in url_to_articles
+        result.url: result for result in web_search_results if result.url not in article_urls
     }  # 法令もURLをもつので除外
     unique_web_search_results = list(url_to_web_pages.values())
     rich_query = construct_query_for_fusion(expanded_queries=expanded_queries)
@@ -338,8 +385,7 @@ def create_research_page():
         if result.source_type == "article":
             if (result.rev_id, result.anchor) in seen:
                 continue
-            chunk_after_title = "\n".join(result.snippet.split("\n")[1:])
-            reference = f"[{i}] {result.title}\n{chunk_after_title[:1024]}"
+            reference = f"[{i}] {result.title}\n{get_article_reference_text(result, use_article_summaries)}"
             references.append(reference)
             total_length += len(reference)
             seen.add((result.rev_id, result.anchor))
@@ -356,7 +402,7 @@ def create_research_page():
 
     # create outline
     status.update(label="アウトラインの生成...", state="running")
-    outline_creater = OutlineCreater(lm=lm)
+    outline_creater = OutlineCreater(lm=lm, use_summaries=use_article_summaries)
     outline_creater_result = outline_creater(query=query, topics=query_expander_result.topics, references=references)
     content = "\n\n".join(
         [
@@ -403,7 +449,9 @@ def create_research_page():
         mindmap = outline.to_text()
         logger.info("mindmap :\n" + mindmap)
         draw_mindmap(mindmap)
-    stream_section_writers = [StreamSectionWriter(lm=lm) for _ in outline.section_outlines]
+    stream_section_writers = [
+        StreamSectionWriter(lm=lm, use_summaries=use_article_summaries) for _ in outline.section_outlines
+    ]
     tasks = []
     for section_box, section_outline, stream_section_writer in zip(
         section_boxes, outline.section_outlines, stream_section_writers
@@ -418,7 +466,10 @@ def create_research_page():
                 logger.warning(f"invalid ref_id: {ref_id}")
                 continue
             ref = id2reference[ref_id]
-            refs.append(f"[{ref_id}] " + ref.title + "\n" + ref.snippet)
+            if use_article_summaries and ref.source_type == "article":
+                refs.append(f"[{ref_id}] " + ref.title + "\n" + get_article_reference_text(ref, use_summary=True))
+            else:
+                refs.append(f"[{ref_id}] " + ref.title + "\n" + ref.snippet)
         refs = "\n\n".join(refs)
         tasks.append(write_section(section_box, stream_section_writer, query, refs, section_outline.to_text()))
 
@@ -1,12 +1,20 @@
 import re
 
 
+def get_url_html(result, style: str = "") -> str:
+    """参照元のリンク（URLを持たない文書の場合は空文字列）"""
+    if not result.url:
+        return ""
+    style_attr = f' style="{style}"' if style else ""
+    return f'<a href="{result.url}"{style_attr}>{result.url}</a><br>'
+
+
 def get_hiddenbox_ref_html(i, result):  # Reference部を畳んだ表示にする
     html = f"""
     <input type="checkbox" id="toggle{i}" style="display:none;">
     <label for="toggle{i}" class="toggle-label"><span>[{i}] {result.title}</span></label><br>
     <div class="toggle-box">
-    <a href="{result.url}" style="color: #0284C7;">{result.url}</a><br>
+    {get_url_html(result, style="color: #0284C7;")}
     {result.snippet.replace("\n", "<br>")}
     </div>
     """
@@ -18,7 +26,7 @@ def get_reference_tooltip_html(references):  # レポート本文中の参照[(
     for i, result in enumerate(references, start=1):
         tooltip = f"""
         [{i}] {result.title}<br>
-        <a href="{result.url}">{result.url}</a><br>
+        {get_url_html(result)}
         {result.snippet.replace("\n", "<br>")}
         """
         tooltips.append(tooltip)
@@ -1,11 +1,16 @@
-import json
 import os
+from collections.abc import Mapping
 from pathlib import Path
 
 import dotenv
 import streamlit as st
 
+from lawsy.chunker.cross_reference import CrossReferenceIndex
+from lawsy.chunker.store import is_chunk_store_stale, load_chunk_store
+from lawsy.chunker.structure import StructureIndex
+from lawsy.encoder.cache import open_embedding_cache
 from lawsy.encoder.me5 import ME5Instruct
+from lawsy.encoder.me5_onnx import ME5InstructOnnx
 from lawsy.encoder.openai import OpenAITextEmbedding
 from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
 from lawsy.utils.logging import logger
@@ -15,28 +20,38 @@ output_dir = Path(os.getenv("LAWSY_OUTPUT_DIR", "outputs"))
 
 
 @st.cache_resource
-def load_article_chunks() -> dict:
+def load_article_chunks() -> Mapping[tuple[str, str], dict]:
     with st.spinner("loading article chunks..."):
         logger.info("loading article chunks")
-        result = {}
-        with open(output_dir / "lawsy" / "article_chunks.jsonl") as fin:
-            for line in fin:
-                d = json.loads(line)
-                key = (d["file_name"], d["anchor"])
-                result[key] = d
-        return result
+        # チャンクストア（Arrow IPC）があればメモリマップで開き、なければJSONLを読み込む
+        chunk_store_file = output_dir / "lawsy" / "article_chunks.arrow"
+        jsonl_file = output_dir / "lawsy" / "article_chunks.jsonl"
+        if chunk_store_file.exists():
+            if not is_chunk_store_stale(chunk_store_file, jsonl_file):
+                return load_chunk_store(chunk_store_file)
+            # JSONL を作り直した後に変換していないチャンクストアは、インデックスと合わないため使わない
+            logger.warning(
+                f"{chunk_store_file} is older than {jsonl_file}. "
+                "Loading the JSONL instead; run create-article-chunk-store to update it."
+            )
+        return load_chunk_store(jsonl_file)
 
 
 @st.cache_resource
-def load_text_encoder(dim: int | None = None) -> ME5Instruct | OpenAITextEmbedding:
+def load_text_encoder(dim: int | None = None) -> ME5Instruct | ME5InstructOnnx | OpenAITextEmbedding:
     with st.spinner("loading text encoder..."):
         logger.info("loading text encoder...")
         model_name = os.getenv("LAWSY_ENCODER_MODEL_NAME")
         prefix = model_name.split("/")[0] if model_name is not None else None
+        # LAWSY_EMBEDDING_CACHE_DIR を設定した場合は、クエリーやWebページのエンベディングをキャッシュする
+        cache = open_embedding_cache()
         if model_name is None or prefix == "openai":
-            return OpenAITextEmbedding(dim=dim)
+            return OpenAITextEmbedding(dim=dim, cache=cache)
+        elif prefix == "onnx":
+            # torch を読み込まずに、int8 に量子化した ONNX モデルでクエリーをエンコードする
+            return ME5InstructOnnx(model_name.split("/", 1)[1], cache=cache)
         else:
-            return ME5Instruct()
+            return ME5Instruct(cache=cache)
 
 
 @st.cache_resource
@@ -44,3 +59,23 @@ def load_vector_search_article_retriever() -> FaissFlatArticleRetriever:
     with st.spinner("loading vector search article retriever..."):
         logger.info("loading vector search article retriever...")
         return FaissFlatArticleRetriever.load(output_dir / "lawsy" / "article_chunks_faiss")
+
+
+@st.cache_resource
+def load_article_cross_references() -> CrossReferenceIndex | None:
+    references_file = output_dir / "lawsy" / "article_chunk_references.jsonl"
+    if not references_file.exists():
+        return None
+    with st.spinner("loading article cross references..."):
+        logger.info("loading article cross references...")
+        return CrossReferenceIndex.load(references_file)
+
+
+@st.cache_resource
+def load_article_structure() -> StructureIndex | None:
+    structure_file = output_dir / "lawsy" / "article_chunks.structure.json"
+    if not structure_file.exists():
+        return None
+    with st.spinner("loading article structure..."):
+        logger.info("loading article structure...")
+        return StructureIndex.load(structure_file)
@@ -1,20 +1,10 @@
-from typing import Iterable
+from typing import Callable, Iterable
 
 from ja_law_parser.model import (
     Article,
     Chapter,
     Division,
     Item,
-    # Subitem1,
-    # Subitem2,
-    # Subitem3,
-    # Subitem4,
-    # Subitem5,
-    # Subitem6,
-    # Subitem7,
-    # Subitem8,
-    # Subitem9,
-    # Subitem10,
     Law,
     LawBody,
     MainProvision,
@@ -23,59 +13,79 @@ from ja_law_parser.model import (
     # Preamble,
     Part,
     Section,
+    Subitem1,
+    Subitem2,
+    Subitem3,
+    Subitem4,
+    Subitem5,
+    Subitem6,
+    Subitem7,
+    Subitem8,
+    Subitem9,
     Subsection,
     SupplProvision,
 )
 
 from lawsy.utils.logging import get_logger
 
+# チャンクの生成ロジックや出力形式を変更した場合はインクリメンタル更新の結果が変わるため、このバージョンを上げること
+CHUNKER_VERSION = "3"
+
+
+NEXT_CHILDREN_NAMES = {
+    Law: ["law_body"],
+    LawBody: ["enact_statement", "preamble", "main_provision", "suppl_provisions"],
+    MainProvision: ["parts", "chapters", "sections", "articles", "paragraphs"],
+    SupplProvision: ["chapters", "articles", "paragraphs"],
+    Part: ["chapters", "articles"],
+    Chapter: ["sections", "articles"],
+    Section: ["subsections", "divisions", "articles"],
+    Subsection: ["divisions", "articles"],
+    Division: ["articles"],
+    Article: ["paragraphs"],
+    Paragraph: ["items"],
+    Item: ["subitems"],
+    Subitem1: ["subitems2"],
+    Subitem2: ["subitems3"],
+    Subitem3: ["subitems4"],
+    Subitem4: ["subitems5"],
+    Subitem5: ["subitems6"],
+    Subitem6: ["subitems7"],
+    Subitem7: ["subitems8"],
+    Subitem8: ["subitems9"],
+    Subitem9: ["subitems10"],
+}
+
+
+def is_amendment_suppl_provision(node) -> bool:
+    # 改正法制番号付きの場合は無視
+    # https://laws.e-gov.go.jp/docs/law-data-basic/8ebd8bc-law-structure-and-xml/#%E3%81%9D%E3%81%AE1%E6%9C%AC%E5%89%87%E3%82%84%E9%99%84%E5%89%87%E3%81%AA%E3%81%A9
+    return type(node) is SupplProvision and getattr(node, "amend_law_num", None) is not None
+
+
+def iter_children(node) -> Iterable:
+    for name in NEXT_CHILDREN_NAMES[type(node)]:
+        child_or_children = getattr(node, name, None)
+        if not child_or_children:
+            continue
+        if isinstance(child_or_children, list):
+            yield from child_or_children
+        else:
+            yield child_or_children
 
-def list_article_paths(law: Law) -> list[list]:
-    next_children_names = {
-        Law: ["law_body"],
-        LawBody: ["enact_statement", "preamble", "main_provision", "suppl_provisions"],
-        MainProvision: ["parts", "chapters", "sections", "articles", "paragraphs"],
-        SupplProvision: ["chapters", "articles", "paragraphs"],
-        Part: ["chapters", "articles"],
-        Chapter: ["sections", "articles"],
-        Section: ["sub_sections", "divisions", "articles"],
-        Subsection: ["divisions", "articles"],
-        Division: ["articles"],
-        Article: ["paragraphs"],
-        Paragraph: ["items"],
-        Item: ["subitems"],
-        # Subitem1: ["subitems2"],
-        # Subitem2: ["subitems3"],
-        # Subitem3: ["subitems4"],
-        # Subitem4: ["subitems5"],
-        # Subitem5: ["subitems6"],
-        # Subitem6: ["subitems7"],
-        # Subitem7: ["subitems8"],
-        # Subitem8: ["subitems9"],
-        # Subitem9: ["subitems10"],
-    }
 
+def list_article_paths(law: Law) -> list[list]:
     def dfs(node, found_article_paths: list[list], cur_path: list):
         new_path = cur_path + [node]
         if type(node) is Article:
             found_article_paths.append(new_path)
             return
-        if type(node) not in next_children_names:
+        if type(node) not in NEXT_CHILDREN_NAMES:
             return
-        if type(node) is SupplProvision and getattr(node, "amend_law_num", None) is not None:
-            # 改正法制番号付きの場合は無視
-            # https://laws.e-gov.go.jp/docs/law-data-basic/8ebd8bc-law-structure-and-xml/#%E3%81%9D%E3%81%AE1%E6%9C%AC%E5%89%87%E3%82%84%E9%99%84%E5%89%87%E3%81%AA%E3%81%A9
+        if is_amendment_suppl_provision(node):
             return
-        children_names = next_children_names[type(node)]
-        for name in children_names:
-            child_or_children = getattr(node, name, None)
-            if not child_or_children:
-                continue
-            if isinstance(child_or_children, list):
-                for child in child_or_children:
-                    dfs(child, found_article_paths, new_path)
-            else:
-                dfs(child_or_children, found_article_paths, new_path)
+        for child in iter_children(node):
+            dfs(child, found_article_paths, new_path)
         return
 
     found_articles = []
@@ -125,22 +135,57 @@ def get_article_text(article: Article, indent=2) -> str:
     return "\n".join(lines)
 
 
+def get_article_path_node_symbol(node) -> str | None:
+    if type(node) is MainProvision:
+        return "Mp"
+    elif type(node) is SupplProvision:
+        return "Sp"
+    elif type(node) is Part:
+        return "Pa_" + node.num
+    elif type(node) is Chapter:
+        return "Ch_" + node.num
+    elif type(node) is Section:
+        return "Se_" + node.num
+    elif type(node) is Subsection:
+        return "Ss_" + node.num
+    elif type(node) is Division:
+        return "Di_" + node.num
+    elif type(node) is Article:
+        return "At_" + node.num
+    elif type(node) is Paragraph:
+        return "Pr_" + str(node.num)
+    elif type(node) is Item:
+        return "It_" + node.num
+    return None
+
+
+def get_article_path_node_text(node, depth: int) -> str | None:
+    """
+    get_article_path_string における祖先ノード1つ分の見出し行（Article以外）
+    """
+    if type(node) is LawBody:
+        return " " * depth + node.law_title.text  # type: ignore
+    elif type(node) is MainProvision:
+        return " " * depth + "本則"
+    elif type(node) is SupplProvision:
+        return " " * depth + "附則"
+    elif type(node) in [Part, Chapter, Section, Subsection, Division]:
+        return " " * depth + getattr(node, node.__class__.__name__.lower() + "_title").text
+    return None
+
+
 def get_article_path_string(article_path: list, start_node_type=LawBody, indent=2) -> str:
     start = [type(node) for node in article_path].index(start_node_type)
     article_path = article_path[start:]
     texts = []
     for i, node in enumerate(article_path):
-        if type(node) is LawBody:
-            texts.append(" " * indent * i + node.law_title.text)  # type: ignore
-        elif type(node) is MainProvision:
-            texts.append(" " * indent * i + "本則")
-        elif type(node) is SupplProvision:
-            texts.append(" " * indent * i + "附則")
-        elif type(node) in [Part, Chapter, Section, Subsection, Division]:
-            texts.append(" " * indent * i + getattr(node, node.__class__.__name__.lower() + "_title").text)
-        elif type(node) is Article:
+        if type(node) is Article:
             article_text = get_article_text(node, indent=indent)
             texts.extend([" " * indent * i + line for line in article_text.split("\n")])
+        else:
+            text = get_article_path_node_text(node, indent * i)
+            if text is not None:
+                texts.append(text)
     text = "\n".join(texts)
     return text
 
@@ -154,29 +199,8 @@ class ArticleChunker:
         """
         Mp-Pa_2-Ch_8-Se_2-Ss_3-At_327-Pr_1のような、法令ページで使用されているようなアンカー（フラグメント）を取得する
         """
-        symbols = []
-        for node in article_path:
-            if type(node) is MainProvision:
-                symbols.append("Mp")
-            elif type(node) is SupplProvision:
-                symbols.append("Sp")
-            elif type(node) is Part:
-                symbols.append("Pa_" + node.num)
-            elif type(node) is Chapter:
-                symbols.append("Ch_" + node.num)
-            elif type(node) is Section:
-                symbols.append("Se_" + node.num)
-            elif type(node) is Subsection:
-                symbols.append("Ss_" + node.num)
-            elif type(node) is Division:
-                symbols.append("Di_" + node.num)
-            elif type(node) is Article:
-                symbols.append("At_" + node.num)
-            elif type(node) is Paragraph:
-                symbols.append("Pr_" + str(node.num))
-            elif type(node) is Item:
-                symbols.append("It_" + node.num)
-        return "-".join(symbols)
+        symbols = [get_article_path_node_symbol(node) for node in article_path]
+        return "-".join([symbol for symbol in symbols if symbol is not None])
 
     def __call__(self, law: Law) -> Iterable[dict]:
         article_paths = list_article_paths(law)
@@ -194,3 +218,207 @@ class ArticleChunker:
                 logger = get_logger()
                 logger.warning(f"cannot create chunk ({anchor})")
                 logger.warning(traceback.format_exc())
+
+
+class _PathFrame:
+    """
+    走査中のノードと、その祖先までの見出しテキスト・アンカーのメモ
+    """
+
+    __slots__ = ("parent", "node", "level", "header", "anchor", "error")
+
+    def __init__(self, parent: "_PathFrame | None", node, level: int) -> None:
+        self.parent = parent
+        self.node = node
+        self.level = level  # LawBodyを0とした深さ（Lawは-1）
+        self.header: str | None = None  # 祖先を含む見出しテキスト（未計算の場合はNone）
+        self.anchor: str | None = None  # 祖先を含むアンカー（未計算の場合はNone）
+        self.error: Exception | None = None
+
+    def path(self) -> list:
+        nodes = []
+        frame = self
+        while frame is not None:
+            nodes.append(frame.node)
+            frame = frame.parent
+        return nodes[::-1]
+
+
+class MemoizedArticleChunker(ArticleChunker):
+    """
+    ArticleChunkerとバイト単位で同一のチャンクを生成するチャンカー
+
+    再帰ではなく明示的なスタックで木を走査し、祖先ノード（章・節など）の見出しテキストとアンカーは
+    ノードごとに1回だけ描画して子孫の条で使い回す。そのため、処理時間は出力サイズに対して線形になる。
+    """
+
+    def _get_anchor(self, frame: _PathFrame) -> str:
+        if frame.anchor is None:
+            parent_anchor = self._get_anchor(frame.parent) if frame.parent is not None else ""
+            symbol = get_article_path_node_symbol(frame.node)
+            if symbol is None:
+                frame.anchor = parent_anchor
+            elif parent_anchor:
+                frame.anchor = parent_anchor + "-" + symbol
+            else:
+                frame.anchor = symbol
+        return frame.anchor
+
+    def _get_header(self, frame: _PathFrame) -> str:
+        if frame.error is not None:
+            raise frame.error
+        if frame.header is None:
+            try:
+                parent_header = self._get_header(frame.parent) if frame.parent is not None else ""
+                line = None if frame.level < 0 else get_article_path_node_text(frame.node, self.indent * frame.level)
+            except Exception as e:
+                frame.error = e
+                raise
+            if line is None:
+                frame.header = parent_header
+            elif parent_header:
+                frame.header = parent_header + "\n" + line
+            else:
+                frame.header = line
+        return frame.header
+
+    def _render_article(self, frame: _PathFrame) -> str:
+        header = self._get_header(frame.parent) if frame.parent is not None else ""
+        prefix = " " * self.indent * frame.level
+        article_text = get_article_text(frame.node, indent=self.indent)
+        lines = [prefix + line for line in article_text.split("\n")]
+        if header:
+            lines.insert(0, header)
+        return "\n".join(lines)
+
+    def _create_chunks(self, frame: _PathFrame) -> list[dict]:
+        return [
+            {
+                "anchor": self._get_anchor(frame),
+                "article_path": frame.path(),
+                "chunk": self._render_article(frame),
+            }
+        ]
+
+    def __call__(self, law: Law) -> Iterable[dict]:
+        stack = [_PathFrame(None, law, -1)]
+        while stack:
+            frame = stack.pop()
+            node = frame.node
+            if type(node) is Article:
+                anchor = self._get_anchor(frame)
+                try:
+                    chunks = self._create_chunks(frame)
+                except Exception:
+                    import traceback
+
+                    logger = get_logger()
+                    logger.warning(f"cannot create chunk ({anchor})")
+                    logger.warning(traceback.format_exc())
+                    continue
+                yield from chunks
+                continue
+            if type(node) not in NEXT_CHILDREN_NAMES or is_amendment_suppl_provision(node):
+                continue
+            level = frame.level + 1
+            children = [_PathFrame(frame, child, level) for child in iter_children(node)]
+            stack.extend(reversed(children))
+
+
+class SubArticleChunker(MemoizedArticleChunker):
+    """
+    トークン数の上限を超える長い条を、項・号単位のウィンドウに分割するチャンカー
+
+    上限以内の条は MemoizedArticleChunker と同じチャンクを1つ生成する。
+    上限を超える条は項（1つの項で上限を超える場合はさらに号）を単位として、上限以内に収まるように
+    先頭から貪欲にまとめる。各ウィンドウには祖先の見出しと条の見出しを付け、アンカーはウィンドウの
+    先頭の項・号のもの（Mp-Ch_1-At_3-Pr_2, Mp-Ch_1-At_3-Pr_2-It_4 など）とする。
+    単位1つで上限を超える場合はそれ以上分割しない。
+    """
+
+    def __init__(self, indent: int = 2, max_tokens: int = 512, token_counter: Callable[[str], int] = len):
+        """
+        Args:
+            indent: インデント幅
+            max_tokens: 1チャンクあたりのトークン数の上限
+            token_counter: テキストのトークン数を数える関数（default: 文字数）
+        """
+        super().__init__(indent=indent)
+        assert max_tokens > 0
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+
+    def _list_units(self, paragraph: Paragraph, header_tokens: int) -> list[dict]:
+        """
+        項を分割の単位（項全体、または柱書と各号）に変換する
+        """
+        paragraph_symbol = get_article_path_node_symbol(paragraph)
+        paragraph_suffix = f" 第{paragraph.num}項"
+        lines = get_paragraph_text(paragraph, indent=self.indent).split("\n")
+        units = [{"symbol": paragraph_symbol, "title_suffix": paragraph_suffix, "lines": lines}]
+        if not paragraph.items or header_tokens + self.token_counter("\n".join(lines)) <= self.max_tokens:
+            return units
+        # get_paragraph_text と同じ行を、柱書と各号に分けて組み立てる
+        num_item_lines = sum(len(get_item_text(item).split("\n")) for item in paragraph.items)
+        units = [
+            {
+                "symbol": paragraph_symbol,
+                "title_suffix": paragraph_suffix,
+                "lines": lines[: len(lines) - num_item_lines],
+            }
+        ]
+        for item in paragraph.items:
+            item_lines = [" " * (self.indent + 1) + line for line in get_item_text(item).split("\n")]
+            units.append(
+                {
+                    "symbol": paragraph_symbol + "-" + get_article_path_node_symbol(item),  # type: ignore
+                    "title_suffix": paragraph_suffix + f"第{item.num}号",
+                    "lines": item_lines,
+                }
+            )
+        if not units[0]["lines"]:
+            units.pop(0)
+        return units
+
+    def _create_chunks(self, frame: _PathFrame) -> list[dict]:
+        chunks = super()._create_chunks(frame)
+        if self.token_counter(chunks[0]["chunk"]) <= self.max_tokens:
+            return chunks
+
+        article: Article = frame.node
+        anchor = chunks[0]["anchor"]
+        article_path = chunks[0]["article_path"]
+        prefix = " " * self.indent * frame.level
+        header = self._get_header(frame.parent) if frame.parent is not None else ""
+        article_title = article.article_title.text  # type: ignore
+        if article.article_caption:
+            article_title += " " + article.article_caption.text  # type: ignore
+        header = (header + "\n" if header else "") + prefix + article_title
+        header_tokens = self.token_counter(header + "\n")
+
+        units = []
+        for paragraph in article.paragraphs:
+            units.extend(self._list_units(paragraph, header_tokens))
+
+        windows: list[list[dict]] = []
+        window_tokens = 0
+        for unit in units:
+            unit_tokens = self.token_counter("\n".join(prefix + line for line in unit["lines"]))
+            if windows and header_tokens + window_tokens + 1 + unit_tokens <= self.max_tokens:
+                windows[-1].append(unit)
+                window_tokens += 1 + unit_tokens
+            else:
+                windows.append([unit])
+                window_tokens = unit_tokens
+
+        if len(windows) <= 1:
+            return chunks
+        return [
+            {
+                "anchor": anchor + "-" + window[0]["symbol"],
+                "article_path": article_path,
+                "chunk": "\n".join([header] + [prefix + line for unit in window for line in unit["lines"]]),
+                "title_suffix": window[0]["title_suffix"],
+            }
+            for window in windows
+        ]
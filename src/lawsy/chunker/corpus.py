@@ -0,0 +1,171 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from ja_law_parser.model import Law
+
+from lawsy.chunker.article_chunker import ArticleChunker, MemoizedArticleChunker, SubArticleChunker
+from lawsy.chunker.dedup import compute_chunk_hash
+from lawsy.data.xml_source import XmlSource
+
+CHUNK_STRATEGIES = ("article", "sub-article")
+# "model": ja_law_parser のモデルを構築してチャンク化する、"lxml": lxml で直接走査する高速版（strategy="article" のみ）
+XML_EXTRACTORS = ("model", "lxml")
+
+
+def create_chunker(indent: int = 2, strategy: str = "article", max_tokens: int = 512) -> ArticleChunker:
+    """
+    チャンク化の戦略に応じたチャンカーを作成する
+
+    Args:
+        indent: インデント幅
+        strategy: "article"（条単位）または "sub-article"（長い条を項・号単位に分割）
+        max_tokens: strategy="sub-article" の場合の1チャンクあたりのトークン数（文字数）の上限
+    """
+    if strategy == "article":
+        return MemoizedArticleChunker(indent=indent)
+    elif strategy == "sub-article":
+        return SubArticleChunker(indent=indent, max_tokens=max_tokens)
+    raise ValueError(f"unknown chunk strategy: {strategy} (expected one of {CHUNK_STRATEGIES})")
+
+
+def iter_article_chunk_records(law: Law, file_name: str, chunker: ArticleChunker) -> Iterator[dict]:
+    """
+    ArticleChunkerの出力をarticle_chunks.jsonlの1行に相当するレコードに変換する
+
+    レコードは file_name, anchor, title, chunk と、重複排除に使う正規化済み本文のハッシュ chunk_hash からなる。
+    """
+    law_title = law.law_body.law_title.text  # type: ignore
+    for chunk in chunker(law):
+        article = chunk["article_path"][-1]
+        if chunk["anchor"].find("Sp-") >= 0:
+            article_title = law_title + " 附則 " + article.article_title.text  # type: ignore
+        else:
+            article_title = law_title + " " + article.article_title.text  # type: ignore
+        article_title += chunk.get("title_suffix", "")
+        yield dict(
+            file_name=file_name,
+            anchor=chunk["anchor"],
+            title=article_title,
+            chunk=chunk["chunk"],
+            chunk_hash=compute_chunk_hash(chunk["chunk"]),
+        )
+
+
+def chunk_api_response(file_name: str, xml_content: bytes, chunker_options: dict | None = None) -> list[dict]:
+    """
+    e-Gov APIのレスポンス（DataRoot > ... > Law）をファイルを介さずにチャンク化する
+    """
+    from lawsy.parser.parser import parse_from_api_response
+
+    law = parse_from_api_response(xml_content)
+    chunker = create_chunker(**(chunker_options or {}))
+    return list(iter_article_chunk_records(law, file_name, chunker))
+
+
+def chunk_xml_file(
+    xml_file: Path | XmlSource,
+    chunker_options: dict | None = None,
+    extractor: str = "model",
+    law_cache_dir: Path | None = None,
+) -> list[dict]:
+    """
+    法令XML（ファイル、またはZIPアーカイブのメンバー）をチャンク化する
+
+    law_cache_dir を指定した場合、パース済みの Law モデルをXMLの内容のハッシュをキーとしてキャッシュし、
+    XMLが変わっていなければパースを省略する（extractor="model" のみ）。
+    """
+    source = xml_file if isinstance(xml_file, XmlSource) else XmlSource.from_file(xml_file)
+    if extractor == "lxml":
+        from lawsy.chunker.lxml_extractor import chunk_xml_bytes_lxml
+
+        chunker_options = chunker_options or {}
+        if chunker_options.get("strategy", "article") != "article":
+            raise ValueError("the lxml extractor supports only strategy='article'")
+        return chunk_xml_bytes_lxml(source.read_bytes(), source.stem, indent=chunker_options.get("indent", 2))
+    elif extractor != "model":
+        raise ValueError(f"unknown extractor: {extractor} (expected one of {XML_EXTRACTORS})")
+
+    from lawsy.parser.parser import parse_from_xml_bytes
+
+    if law_cache_dir is not None:
+        from lawsy.parser.law_cache import LawCache
+
+        law = LawCache(law_cache_dir).parse(source.read_bytes())
+    else:
+        law = parse_from_xml_bytes(source.read_bytes())
+    chunker = create_chunker(**(chunker_options or {}))
+    return list(iter_article_chunk_records(law, source.stem, chunker))
+
+
+def _map_in_order(fn: Callable, items: Iterable, workers: int, max_pending: int | None = None) -> Iterator:
+    """
+    items の各要素に fn を適用した結果を入力順に返す（workers > 1 の場合はプロセスプールで並列に処理する）
+
+    executor.map は入力をすべて読み出して一度に投入し、完了した結果を消費されるまで保持するため使わない。
+    投入済みで未消費の要素は max_pending（既定は workers * 2）件までに抑え、先頭の結果を取り出すごとに次を1件投入する。
+    これにより、入力（ダウンロードなど）と結果の消費側が遅い場合もメモリ使用量はコーパスの大きさによらない。
+    """
+    assert workers > 0
+    if workers == 1:
+        for item in items:
+            yield fn(item)
+        return
+    max_pending = max_pending or workers * 2
+    assert max_pending >= workers
+    iterator = iter(items)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future] = deque()
+        try:
+            for item in islice(iterator, max_pending):
+                pending.append(executor.submit(fn, item))
+            while pending:
+                result = pending.popleft().result()
+                # 消費側が結果を処理している間もワーカーが止まらないように、返す前に次を投入する
+                for item in islice(iterator, 1):
+                    pending.append(executor.submit(fn, item))
+                yield result
+        finally:
+            # 途中で止めた場合は、まだ始まっていない処理を取り消す
+            for future in pending:
+                future.cancel()
+
+
+def map_chunk_xml_files(
+    xml_files: Iterable[Path | XmlSource],
+    chunker_options: dict | None = None,
+    workers: int = 1,
+    extractor: str = "model",
+    law_cache_dir: Path | None = None,
+) -> Iterator[list[dict]]:
+    """
+    XMLファイル（またはZIPアーカイブのメンバー）ごとのチャンクレコードを入力と同じ順序で返す
+
+    workers > 1 の場合はプロセスプールでパース・チャンク化を並列に行う。
+    ZIPアーカイブのメンバーはワーカーにはメンバー名だけを渡し、各ワーカーがアーカイブから直接読み出す。
+    結果は完了順ではなく入力順に返すため、出力は workers の値によらず同一になる。
+    """
+    yield from _map_in_order(
+        partial(chunk_xml_file, chunker_options=chunker_options, extractor=extractor, law_cache_dir=law_cache_dir),
+        xml_files,
+        workers,
+    )
+
+
+def map_chunk_api_responses(
+    responses: Iterable[tuple[str, bytes]], chunker_options: dict | None = None, workers: int = 1
+) -> Iterator[list[dict]]:
+    """
+    (file_name, APIレスポンス) ごとのチャンクレコードを入力と同じ順序で返す
+
+    workers > 1 の場合も、入力は処理中の件数に応じて少しずつ読み出し、レスポンスを一度にすべては保持しない。
+    """
+    yield from _map_in_order(partial(_chunk_api_response_item, chunker_options=chunker_options), responses, workers)
+
+
+def _chunk_api_response_item(item: tuple[str, bytes], chunker_options: dict | None = None) -> list[dict]:
+    file_name, xml_content = item
+    return chunk_api_response(file_name, xml_content, chunker_options=chunker_options)
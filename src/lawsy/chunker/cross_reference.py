@@ -0,0 +1,338 @@
+"""
+条文間の参照関係（「第十四条第一項の規定により」「薬機法第二条」「法第十四条の規定を準用する」など）の抽出
+
+チャンクの本文から法令内・法令間の条の参照を取り出し、(file_name, anchor) をキーとする隣接リストとして保存する。
+検索時は、ヒットした条が参照している条をエンベディングや追加の検索なしに辞書引きで取得できる。
+"""
+
+import json
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from lawsy.chunker.document_chunker import is_document_file_name
+
+KANJI_DIGITS = {"〇": 0, "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+KANJI_UNITS = {"十": 10, "百": 100, "千": 1000}
+KANJI_NUMBER = "[〇一二三四五六七八九十百千]+"
+ERA_CODES = {"明治": 1, "大正": 2, "昭和": 3, "平成": 4, "令和": 5}
+# 法令番号から法令IDを組み立てられる種別（府省令は省庁コードを含むため対象外）
+LAW_NUMBER_TYPES = {"法律": "AC", "政令": "CO"}
+
+ARTICLE_REFERENCE_PATTERN = re.compile(
+    rf"(?:第(?P<article>{KANJI_NUMBER})条(?P<branch>(?:の{KANJI_NUMBER})*)|(?P<relative>前条|次条|同条))"
+    rf"(?:第(?P<paragraph>{KANJI_NUMBER})項)?"
+)
+# 条の参照の直前にあれば、参照先が他の法令であることを示す語尾（法令名・略称）
+LAW_PREFIX_PATTERN = re.compile(r"(?:法律|法|令|規則)$")
+LAW_NUMBER_PATTERN = re.compile(rf"(明治|大正|昭和|平成|令和)(元|{KANJI_NUMBER})年(法律|政令)第({KANJI_NUMBER})号$")
+# file_name から法令IDを取り出す（"335AC0000000145_20240401_..." または "薬機法_335AC0000000145_processed"）
+FILE_NAME_LAW_ID_PATTERN = re.compile(r"(?:^|_)(\d{3}[A-Z0-9]{2}\d{10})(?:_|$)")
+SELF_REFERENCES = ("この法律", "この政令", "この省令", "この府令", "この規則")
+MUTATIS_MUTANDIS = "準用"
+ENFORCEMENT_SUFFIXES = {"施行令": "令", "施行規則": "規則"}
+
+
+def kanji_to_int(text: str) -> int:
+    """漢数字（百四十五、千二十など）を整数に変換する"""
+    total = 0
+    digit = 0
+    for ch in text:
+        if ch in KANJI_DIGITS:
+            digit = digit * 10 + KANJI_DIGITS[ch]
+        else:
+            total += (digit or 1) * KANJI_UNITS[ch]
+            digit = 0
+    return total + digit
+
+
+def law_number_to_law_id(law_number: str) -> str | None:
+    """法律・政令の法令番号（昭和三十五年法律第百四十五号）を法令ID（335AC0000000145）に変換する"""
+    m = LAW_NUMBER_PATTERN.search(law_number)
+    if m is None:
+        return None
+    era, year, law_type, num = m.groups()
+    year_num = 1 if year == "元" else kanji_to_int(year)
+    return f"{ERA_CODES[era]}{year_num:02d}{LAW_NUMBER_TYPES[law_type]}{kanji_to_int(num):010d}"
+
+
+def is_kanji(ch: str) -> bool:
+    return "\u4e00" <= ch <= "\u9fff" or ch in "々〇"
+
+
+def get_law_id_from_file_name(file_name: str) -> str | None:
+    m = FILE_NAME_LAW_ID_PATTERN.search(file_name)
+    return m.group(1) if m is not None else None
+
+
+def parse_article_anchor(anchor: str) -> tuple[str, str | None] | None:
+    """
+    本則の条のアンカー（Mp-Ch_2-At_14_2、Mp-At_3-Pr_2 など）から (条番号, 項番号) を取り出す
+
+    附則の条は法令内の「第X条」の参照先にならないため None を返す
+    """
+    symbols = anchor.split("-")
+    if symbols[0] != "Mp":
+        return None
+    article = paragraph = None
+    for symbol in symbols:
+        if symbol.startswith("At_"):
+            article = symbol[3:]
+        elif symbol.startswith("Pr_"):
+            paragraph = symbol[3:]
+        elif symbol.startswith("It_"):
+            return None
+    if article is None:
+        return None
+    return article, paragraph
+
+
+@dataclass(frozen=True)
+class ArticleReference:
+    """条の参照（参照先のキーと種類）"""
+
+    file_name: str
+    anchor: str
+    kind: str  # "reference"（参照）| "mutatis_mutandis"（準用）
+
+
+class _LawArticles:
+    """1つの法令について、条番号・項番号から参照先のアンカーを引く索引"""
+
+    def __init__(self, file_name: str, title: str) -> None:
+        self.file_name = file_name
+        self.title = title
+        self.articles: list[str] = []  # 条番号（出現順）
+        self.anchors: dict[tuple[str, str | None], str] = {}
+
+    def add(self, anchor: str) -> None:
+        parsed = parse_article_anchor(anchor)
+        if parsed is None:
+            return
+        article, paragraph = parsed
+        if (article, None) not in self.anchors:
+            self.articles.append(article)
+            # 項単位に分割されたチャンクの場合は、条の先頭のチャンクを条の参照先とする
+            self.anchors[article, None] = anchor
+        if paragraph is not None:
+            self.anchors.setdefault((article, paragraph), anchor)
+
+    def resolve(self, article: str, paragraph: str | None) -> str | None:
+        return self.anchors.get((article, paragraph)) or self.anchors.get((article, None))
+
+    def relative(self, article: str, offset: int) -> str | None:
+        if article not in self.articles:
+            return None
+        i = self.articles.index(article) + offset
+        return self.articles[i] if 0 <= i < len(self.articles) else None
+
+
+class CrossReferenceExtractor:
+    """
+    チャンクの本文から条の参照を抽出し、参照先の (file_name, anchor) に解決する
+
+    参照先の法令は、法令番号（法律・政令）、法令名（チャンクの先頭行の法令名、または pharma の
+    "{略称}_{法令ID}_processed" 形式の file_name の略称）、施行令・施行規則の中の「法」「令」「規則」で解決する。
+    法令名のない「第X条」は同じ法令内の条、「前条」「次条」は同じ法令内の前後の条、「同条」は同じ文の直前の参照先とする。
+    解決できない参照（コーパスにない法令など）は無視する。
+    """
+
+    def __init__(self, records: Iterable[dict]) -> None:
+        self.laws: dict[str, _LawArticles] = {}
+        for record in records:
+            file_name = record["file_name"]
+            if is_document_file_name(file_name):
+                continue
+            if file_name not in self.laws:
+                # チャンクの先頭行は法令名（get_article_path_string が LawBody から描画する）
+                self.laws[file_name] = _LawArticles(file_name, record["chunk"].split("\n", 1)[0].strip())
+            self.laws[file_name].add(record["anchor"])
+
+        self.file_name_by_alias: dict[str, str] = {}
+        self.file_name_by_law_id: dict[str, str] = {}
+        for file_name, law in self.laws.items():
+            self.file_name_by_alias.setdefault(law.title, file_name)
+            law_id = get_law_id_from_file_name(file_name)
+            if law_id is not None:
+                self.file_name_by_law_id.setdefault(law_id, file_name)
+                short_name = file_name.split("_" + law_id)[0]
+                if short_name and short_name != file_name:
+                    self.file_name_by_alias.setdefault(short_name, file_name)
+        # 長い別名から順に照合する（「薬機法施行令」を「薬機法」より優先する）
+        self.alias_lengths = sorted({len(alias) for alias in self.file_name_by_alias}, reverse=True)
+        self.max_prefix_length = max(self.alias_lengths + [60])
+
+    def _resolve_law(self, before: str, source: _LawArticles | None, same_law: str | None) -> str | None:
+        """
+        条の参照の直前のテキストから参照先の法令の file_name を返す
+
+        法令名がない場合は source の file_name を返す。コーパスにない法令や、直前の参照先のない「同法」など
+        解決できない場合は None を返す。
+        """
+        m = LAW_NUMBER_PATTERN.search(before)
+        if m is not None:
+            law_id = law_number_to_law_id(m.group(0))
+            return self.file_name_by_law_id.get(law_id) if law_id is not None else None
+        for length in self.alias_lengths:
+            file_name = self.file_name_by_alias.get(before[-length:])
+            if file_name is not None:
+                return file_name
+        if before.endswith(("同法", "同令")):
+            return same_law
+        source_file_name = source.file_name if source is not None else None
+        if before.endswith(SELF_REFERENCES):
+            return source_file_name
+        if LAW_PREFIX_PATTERN.search(before) is None:
+            # 法令名のない「第X条」は同じ法令内の条
+            return source_file_name
+        if source is not None:
+            for suffix in ENFORCEMENT_SUFFIXES:
+                if not source.title.endswith(suffix):
+                    continue
+                # 施行令・施行規則の中の「法」「令」「規則」は、それぞれ本体の法律・施行令・施行規則を指す
+                base_title = source.title[: -len(suffix)]
+                abbreviations = {"法": base_title, **{v: base_title + k for k, v in ENFORCEMENT_SUFFIXES.items()}}
+                for abbreviation, title in abbreviations.items():
+                    rest = before[: -len(abbreviation)]
+                    if before.endswith(abbreviation) and (not rest or not is_kanji(rest[-1])):
+                        return self.file_name_by_alias.get(title)
+        # コーパスにない法令
+        return None
+
+    def extract(self, file_name: str, anchor: str, chunk: str) -> list[ArticleReference]:
+        """
+        チャンク1件の参照先を出現順に（重複と、チャンク自身の条への参照を除いて）返す
+        """
+        source = self.laws.get(file_name)
+        source_article = parse_article_anchor(anchor)
+        references: dict[tuple[str, str], str] = {}
+        for sentence in re.split(r"(?<=。)", chunk):
+            kind = "mutatis_mutandis" if MUTATIS_MUTANDIS in sentence else "reference"
+            last_law: str | None = None  # 同じ文で直前に参照された他の法令（「同法」用）
+            last_article: tuple[str, str] | None = None  # 同じ文で直前に参照された条（「同条」用）
+            range_start: tuple[str, str] | None = None
+            for m in ARTICLE_REFERENCE_PATTERN.finditer(sentence):
+                relative = m.group("relative")
+                if relative == "同条":
+                    if last_article is None:
+                        continue
+                    target_file_name, article = last_article
+                else:
+                    before = sentence[max(0, m.start() - self.max_prefix_length) : m.start()]
+                    resolved = self._resolve_law(before, source, last_law)
+                    if resolved is None or resolved not in self.laws:
+                        range_start = None
+                        continue
+                    target_file_name = resolved
+                    if relative is None:
+                        article = str(kanji_to_int(m.group("article")))
+                        for branch in m.group("branch").split("の")[1:]:
+                            article += f"_{kanji_to_int(branch)}"
+                    else:
+                        if source_article is None or target_file_name != file_name:
+                            continue
+                        relative_article = self.laws[file_name].relative(
+                            source_article[0], -1 if relative == "前条" else 1
+                        )
+                        if relative_article is None:
+                            continue
+                        article = relative_article
+                target = self.laws[target_file_name]
+                if target_file_name != file_name:
+                    last_law = target_file_name
+                last_article = (target_file_name, article)
+
+                # 「第十四条から第十六条まで」は範囲内のすべての条を参照先とする
+                following = sentence[m.end() :]
+                if range_start is not None and range_start[0] == target_file_name and following.startswith("まで"):
+                    if range_start[1] in target.articles and article in target.articles:
+                        start = target.articles.index(range_start[1])
+                        end = target.articles.index(article)
+                        for between in target.articles[start + 1 : end]:
+                            references.setdefault((target_file_name, target.anchors[between, None]), kind)
+                range_start = (target_file_name, article) if following.startswith("から") else None
+
+                if target_file_name == file_name and source_article is not None and article == source_article[0]:
+                    # 条の見出しや「前項」相当の自分自身の条への参照は除く
+                    continue
+                paragraph = str(kanji_to_int(m.group("paragraph"))) if m.group("paragraph") else None
+                target_anchor = target.resolve(article, paragraph)
+                if target_anchor is None:
+                    continue
+                references.setdefault((target_file_name, target_anchor), kind)
+        return [
+            ArticleReference(file_name=target_file_name, anchor=target_anchor, kind=kind)
+            for (target_file_name, target_anchor), kind in references.items()
+            if (target_file_name, target_anchor) != (file_name, anchor)
+        ]
+
+
+class CrossReferenceIndex:
+    """
+    (file_name, anchor) → 参照先のリスト の隣接リスト（逆引きの被参照リストを含む）
+    """
+
+    def __init__(self, references: dict[tuple[str, str], list[ArticleReference]] | None = None) -> None:
+        self.references = references if references is not None else {}
+        self.referenced_by: dict[tuple[str, str], list[ArticleReference]] = {}
+        for (file_name, anchor), targets in self.references.items():
+            for target in targets:
+                self.referenced_by.setdefault((target.file_name, target.anchor), []).append(
+                    ArticleReference(file_name=file_name, anchor=anchor, kind=target.kind)
+                )
+
+    @staticmethod
+    def build(records: Iterable[dict]) -> "CrossReferenceIndex":
+        """
+        チャンクレコードから参照関係を抽出する（参照先の解決のためレコードは2回走査する）
+        """
+        records = list(records) if not isinstance(records, list) else records
+        extractor = CrossReferenceExtractor(records)
+        references = {}
+        for record in records:
+            targets = extractor.extract(record["file_name"], record["anchor"], record["chunk"])
+            if targets:
+                references[record["file_name"], record["anchor"]] = targets
+        return CrossReferenceIndex(references)
+
+    def get_references(self, file_name: str, anchor: str) -> list[ArticleReference]:
+        return self.references.get((file_name, anchor), [])
+
+    def get_referenced_by(self, file_name: str, anchor: str) -> list[ArticleReference]:
+        return self.referenced_by.get((file_name, anchor), [])
+
+    def __len__(self) -> int:
+        return sum(len(targets) for targets in self.references.values())
+
+    def iter_edges(self) -> Iterator[tuple[str, str, ArticleReference]]:
+        for (file_name, anchor), targets in self.references.items():
+            for target in targets:
+                yield file_name, anchor, target
+
+    def save(self, path: Path | str) -> None:
+        """1行に1つの参照元（file_name, anchor, references）を持つJSONLとして保存する"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_file, "w") as fout:
+            for (file_name, anchor), targets in self.references.items():
+                record = {
+                    "file_name": file_name,
+                    "anchor": anchor,
+                    "references": [[target.file_name, target.anchor, target.kind] for target in targets],
+                }
+                print(json.dumps(record, ensure_ascii=False), file=fout)
+        tmp_file.replace(path)
+
+    @staticmethod
+    def load(path: Path | str) -> "CrossReferenceIndex":
+        references = {}
+        with open(path) as fin:
+            for line in fin:
+                d = json.loads(line)
+                references[d["file_name"], d["anchor"]] = [
+                    ArticleReference(file_name=file_name, anchor=anchor, kind=kind)
+                    for file_name, anchor, kind in d["references"]
+                ]
+        return CrossReferenceIndex(references)
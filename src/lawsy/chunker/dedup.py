@@ -0,0 +1,57 @@
+"""
+チャンク本文の正規化ハッシュによる重複排除
+
+改正前後の版で同じ条文が繰り返し現れるため、正規化した本文のハッシュ（chunk_hash）をチャンク化の時点で記録し、
+エンベディングは chunk_hash ごとに1回だけ計算する。
+"""
+
+import hashlib
+import re
+import unicodedata
+from datetime import date, datetime
+from typing import Sequence
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_chunk_text(text: str) -> str:
+    """
+    NFKC正規化し、空白（改行・インデントを含む）の連続を1つの半角スペースにまとめる
+    """
+    return _WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def compute_chunk_hash(text: str) -> str:
+    return hashlib.blake2b(normalize_chunk_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def parse_file_date(file_name: str) -> date | None:
+    """
+    {法令ID}_{施行日(yyyyMMdd)}_... 形式のファイル名から日付を取り出す（日付形式でない場合はNone）
+    """
+    parts = file_name.split("_")
+    if len(parts) < 2:
+        return None
+    try:
+        return datetime.strptime(parts[1], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def select_earliest_per_hash(file_names: Sequence[str], chunk_hashes: Sequence[str]) -> list[int]:
+    """
+    chunk_hash ごとに最も古い日付のファイルのチャンクを1つ選び、その位置を入力順で返す
+
+    日付を持たないファイル名（薬事法データなど）は日付付きのものより後として扱い、同順位の場合は先に現れたものを選ぶ。
+    """
+    assert len(file_names) == len(chunk_hashes)
+    file_dates: dict[str, date | None] = {}
+    selected: dict[str, tuple[tuple, int]] = {}
+    for i, (file_name, chunk_hash) in enumerate(zip(file_names, chunk_hashes)):
+        if file_name not in file_dates:
+            file_dates[file_name] = parse_file_date(file_name)
+        file_date = file_dates[file_name]
+        key = (file_date is None, file_date or date.min)
+        if chunk_hash not in selected or key < selected[chunk_hash][0]:
+            selected[chunk_hash] = (key, i)
+    return sorted(i for _, i in selected.values())
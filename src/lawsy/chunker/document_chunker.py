@@ -0,0 +1,133 @@
+"""
+法令XML以外の文書（通知・ガイダンス・PMDAの報告書などの Markdown / プレーンテキスト）のチャンク化
+
+見出しで区切った節を単位に、法令のチャンクと同じ形式（file_name, anchor, title, chunk, chunk_hash）の
+レコードを生成する。文書は行ごとに読み進め、節が閉じるたびにチャンクを出力する。
+"""
+
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from lawsy.chunker.dedup import compute_chunk_hash
+
+DOCUMENT_SUFFIXES = (".md", ".markdown", ".txt")
+# 法令のチャンク（ファイル名が法令IDから始まる）と区別するための file_name の接頭辞
+DOCUMENT_FILE_NAME_PREFIX = "doc:"
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+
+
+def is_document_file_name(file_name: str) -> bool:
+    return file_name.startswith(DOCUMENT_FILE_NAME_PREFIX)
+
+
+def get_document_file_name(path: Path, root: Path) -> str:
+    """入力ルートからの相対パス（拡張子なし）に接頭辞を付けたものを file_name とする"""
+    return DOCUMENT_FILE_NAME_PREFIX + path.relative_to(root).with_suffix("").as_posix().replace(".", "_")
+
+
+class DocumentChunker:
+    """
+    Markdown / プレーンテキストを見出し単位でチャンク化するチャンカー
+
+    Markdown の見出し（# ～ ######）ごとに節を作り、各チャンクには祖先の見出しを付ける。
+    アンカーは見出しの番号の列（Sec_2-1 など、最初の見出しより前の部分は Sec_0）とする。
+    max_tokens を超える節は段落（空行区切り）を単位として先頭から貪欲にまとめ、
+    2つ目以降のチャンクのアンカーには _Pt_2 のような接尾辞を付ける。
+    プレーンテキストは見出しを持たない1つの節として扱う。
+    """
+
+    def __init__(self, max_tokens: int = 512, markdown: bool = True) -> None:
+        """
+        Args:
+            max_tokens: 1チャンクあたりのトークン数（文字数）の上限
+            markdown: Markdown の見出しを解釈するかどうか
+        """
+        assert max_tokens > 0
+        self.max_tokens = max_tokens
+        self.markdown = markdown
+
+    def __call__(self, lines: Iterable[str]) -> Iterator[dict]:
+        """
+        Returns:
+            Iterator[dict]: anchor, headings（祖先の見出しのリスト、欠けた階層は空文字列）, chunk を持つチャンク
+        """
+        numbers: list[int] = []
+        headings: list[str] = []
+        body: list[str] = []
+        in_fence = False
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if self.markdown and FENCE_PATTERN.match(line):
+                in_fence = not in_fence
+            m = HEADING_PATTERN.match(line) if self.markdown and not in_fence else None
+            if m is None:
+                body.append(line)
+                continue
+            yield from self._create_chunks(numbers, headings, body)
+            level = len(m.group(1))
+            numbers = numbers[:level] + [0] * (level - len(numbers))
+            numbers[level - 1] += 1
+            headings = headings[: level - 1] + [""] * (level - 1 - len(headings)) + [m.group(2)]
+            body = []
+        yield from self._create_chunks(numbers, headings, body)
+
+    def _create_chunks(self, numbers: list[int], headings: list[str], body: list[str]) -> Iterator[dict]:
+        anchor = "Sec_" + ("-".join(str(number) for number in numbers) if numbers else "0")
+        header = [heading for heading in headings if heading]
+        paragraphs = []
+        paragraph: list[str] = []
+        for line in body + [""]:
+            if line.strip():
+                paragraph.append(line)
+            elif paragraph:
+                paragraphs.append("\n".join(paragraph))
+                paragraph = []
+        if not paragraphs:
+            return
+
+        windows: list[list[str]] = [[]]
+        size = sum(len(heading) + 1 for heading in header)
+        for paragraph_text in paragraphs:
+            if windows[-1] and size + len(paragraph_text) + 1 > self.max_tokens:
+                windows.append([])
+                size = sum(len(heading) + 1 for heading in header)
+            windows[-1].append(paragraph_text)
+            size += len(paragraph_text) + 1
+        for i, window in enumerate(windows):
+            yield {
+                "anchor": anchor if i == 0 else f"{anchor}_Pt_{i + 1}",
+                "headings": headings,
+                "chunk": "\n".join(header + window),
+            }
+
+
+def iter_document_chunk_records(path: Path, file_name: str, chunker: DocumentChunker) -> Iterator[dict]:
+    """
+    文書ファイルを読み進めながら article_chunks.jsonl と同じ形式のレコードを返す
+
+    タイトルは見出しを連結したものとする。# 見出しの下にない部分（プレーンテキストを含む）は、
+    先頭にファイル名を文書名として付ける。
+    """
+    with open(path, encoding="utf-8") as fin:
+        for chunk in chunker(fin):
+            headings = chunk["headings"]
+            title_parts = [heading for heading in headings if heading]
+            if not headings or not headings[0]:
+                title_parts = [path.stem] + title_parts
+            yield dict(
+                file_name=file_name,
+                anchor=chunk["anchor"],
+                title=" ".join(title_parts),
+                chunk=chunk["chunk"],
+                chunk_hash=compute_chunk_hash(chunk["chunk"]),
+            )
+
+
+def list_document_files(path: Path) -> list[Path]:
+    """入力パス（ファイルまたはディレクトリ）配下の文書ファイルをパスの順に返す"""
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    return sorted(file for file in path.glob("**/*") if file.is_file() and file.suffix.lower() in DOCUMENT_SUFFIXES)
@@ -0,0 +1,286 @@
+"""
+ja_law_parser のモデルを構築せずに、lxmlで法令XMLを直接走査して条単位のチャンクを作る高速版の抽出器
+
+MemoizedArticleChunker（strategy="article"）と同じ {anchor, chunk} を同じ順序で出力する。
+走査する子要素（NEXT_CHILDREN_NAMES に相当）とテキストの組み立て方はモデル側の挙動に合わせている。
+"""
+
+from pathlib import Path
+from typing import Iterator
+
+from lxml import etree
+
+from lawsy.chunker.dedup import compute_chunk_hash
+from lawsy.utils.logging import get_logger
+
+# NEXT_CHILDREN_NAMES のうち、条に至るまでの経路のタグ版
+NEXT_CHILDREN_TAGS = {
+    "Law": ["LawBody"],
+    "LawBody": ["EnactStatement", "Preamble", "MainProvision", "SupplProvision"],
+    "MainProvision": ["Part", "Chapter", "Section", "Article", "Paragraph"],
+    "SupplProvision": ["Chapter", "Article", "Paragraph"],
+    "Part": ["Chapter", "Article"],
+    "Chapter": ["Section", "Article"],
+    "Section": ["Subsection", "Division", "Article"],
+    "Subsection": ["Division", "Article"],
+    "Division": ["Article"],
+}
+NODE_SYMBOLS = {
+    "Part": "Pa_",
+    "Chapter": "Ch_",
+    "Section": "Se_",
+    "Subsection": "Ss_",
+    "Division": "Di_",
+    "Article": "At_",
+}
+
+
+def _child(elm: etree._Element, tag: str) -> etree._Element | None:
+    for child in elm.iterchildren(tag):
+        return child
+    return None
+
+
+def _simple_text(elm: etree._Element) -> str:
+    # Ruby, Sup, Sub（テキストが必須）
+    if elm.text is None:
+        raise ValueError(f"{elm.tag} has no text")
+    return elm.text
+
+
+def _join_contents(elm: etree._Element, handlers: dict) -> str:
+    texts = [elm.text or ""]
+    for child in elm.iterchildren():
+        handler = handlers.get(child.tag)
+        if handler is None:
+            raise NotImplementedError(f"tag: {child.tag} is not supported yet")
+        texts.append(handler(child))
+        if child.tail is not None:
+            texts.append(child.tail)
+    return "".join(texts)
+
+
+def _empty_text(elm: etree._Element) -> str:
+    return ""
+
+
+def _quote_struct_text(elm: etree._Element) -> str:
+    return _join_contents(elm, _QUOTE_STRUCT_HANDLERS)
+
+
+def _line_text(elm: etree._Element) -> str:
+    return _join_contents(elm, _LINE_HANDLERS)
+
+
+def sentence_text(elm: etree._Element) -> str:
+    """Sentence.text に相当"""
+    return _join_contents(elm, _SENTENCE_HANDLERS)
+
+
+def tagged_text(elm: etree._Element) -> str:
+    """TaggedText.text（条名・見出しなど）に相当"""
+    return _join_contents(elm, _TAGGED_TEXT_HANDLERS)
+
+
+_LINE_HANDLERS = {
+    "QuoteStruct": _quote_struct_text,
+    "ArithFormula": _empty_text,
+    "Ruby": _simple_text,
+    "Sup": _simple_text,
+    "Sub": _simple_text,
+}
+_SENTENCE_HANDLERS = dict(_LINE_HANDLERS, Line=_line_text)
+_TAGGED_TEXT_HANDLERS = {"Line": _line_text, "Ruby": _simple_text, "Sup": _simple_text, "Sub": _simple_text}
+_QUOTE_STRUCT_HANDLERS = {
+    "Sentence": sentence_text,
+    "ArithFormula": _empty_text,
+    # テキストを持たない要素
+    **{
+        tag: _empty_text
+        for tag in ["Item", "Paragraph", "List", "Fig", "FigStruct", "Table", "TableStruct", "AppdxTable"]
+    },
+}
+
+
+def _item_text(item: etree._Element) -> str:
+    # get_item_text に相当
+    texts = []
+    item_sentence = _child(item, "ItemSentence")
+    if item_sentence is None:
+        raise ValueError("Item has no ItemSentence")
+    for sentence in item_sentence.iterchildren("Sentence"):
+        texts.append(sentence_text(sentence))
+    for column in item_sentence.iterchildren("Column"):
+        for sentence in column.iterchildren("Sentence"):
+            texts.append(sentence_text(sentence))
+    item_title = _child(item, "ItemTitle")
+    if item_title is not None:
+        title = tagged_text(item_title)
+        if title:
+            return title + ". " + "  ".join(texts)
+    return "  ".join(texts)
+
+
+def _paragraph_text(paragraph: etree._Element, indent: int) -> str:
+    # get_paragraph_text に相当
+    texts = []
+    paragraph_caption = _child(paragraph, "ParagraphCaption")
+    if paragraph_caption is not None:
+        texts.append(tagged_text(paragraph_caption))
+    paragraph_sentence = _child(paragraph, "ParagraphSentence")
+    if paragraph_sentence is None:
+        raise ValueError("Paragraph has no ParagraphSentence")
+    for sentence in paragraph_sentence.iterchildren("Sentence"):
+        texts.append(sentence_text(sentence))
+    for item in paragraph.iterchildren("Item"):
+        texts.extend([" " * (indent + 1) + line for line in _item_text(item).split("\n")])
+    return "\n".join(texts)
+
+
+def get_article_title(article: etree._Element) -> str:
+    article_title = _child(article, "ArticleTitle")
+    if article_title is None:
+        raise ValueError("Article has no ArticleTitle")
+    return tagged_text(article_title)
+
+
+def _article_text(article: etree._Element, indent: int) -> str:
+    # get_article_text に相当
+    lines = []
+    article_caption = _child(article, "ArticleCaption")
+    if article_caption is not None:
+        lines.append(get_article_title(article) + " " + tagged_text(article_caption))
+    else:
+        lines.append(get_article_title(article))
+    for paragraph in article.iterchildren("Paragraph"):
+        lines.extend(_paragraph_text(paragraph, indent=indent).split("\n"))
+    return "\n".join(lines)
+
+
+def _node_header_line(elm: etree._Element, depth: int) -> str | None:
+    # get_article_path_node_text に相当
+    tag = elm.tag
+    if tag == "LawBody":
+        law_title = _child(elm, "LawTitle")
+        if law_title is None:
+            raise ValueError("LawBody has no LawTitle")
+        return " " * depth + tagged_text(law_title)
+    elif tag == "MainProvision":
+        return " " * depth + "本則"
+    elif tag == "SupplProvision":
+        return " " * depth + "附則"
+    elif tag in ("Part", "Chapter", "Section", "Subsection", "Division"):
+        title = _child(elm, tag + "Title")
+        if title is None:
+            raise ValueError(f"{tag} has no {tag}Title")
+        return " " * depth + tagged_text(title)
+    return None
+
+
+def _node_symbol(elm: etree._Element) -> str | None:
+    # get_article_path_node_symbol に相当
+    tag = elm.tag
+    if tag == "MainProvision":
+        return "Mp"
+    elif tag == "SupplProvision":
+        return "Sp"
+    elif tag in NODE_SYMBOLS:
+        num = elm.get("Num")
+        if num is None:
+            raise ValueError(f"{tag} has no Num")
+        return NODE_SYMBOLS[tag] + num
+    return None
+
+
+class LxmlArticleExtractor:
+    """
+    法令XML（Law要素）から MemoizedArticleChunker と同じ {anchor, article_title, chunk} を生成する
+    """
+
+    def __init__(self, indent: int = 2):
+        self.indent = indent
+
+    def __call__(self, law: etree._Element) -> Iterator[dict]:
+        assert law.tag == "Law"
+        # (要素, 深さ, 祖先を含むアンカー, 祖先を含む見出し or 見出しの作成時の例外)
+        stack: list[tuple[etree._Element, int, str, str | Exception]] = [(law, -1, "", "")]
+        while stack:
+            elm, level, anchor, header = stack.pop()
+            if elm.tag == "Article":
+                try:
+                    if isinstance(header, Exception):
+                        raise header
+                    prefix = " " * self.indent * level
+                    lines = [prefix + line for line in _article_text(elm, indent=self.indent).split("\n")]
+                    if header:
+                        lines.insert(0, header)
+                    chunk = {"anchor": anchor, "article_title": get_article_title(elm), "chunk": "\n".join(lines)}
+                except Exception:
+                    import traceback
+
+                    logger = get_logger()
+                    logger.warning(f"cannot create chunk ({anchor})")
+                    logger.warning(traceback.format_exc())
+                    continue
+                yield chunk
+                continue
+            tags = NEXT_CHILDREN_TAGS.get(elm.tag)
+            if tags is None:
+                continue
+            # 改正法制番号付きの附則は無視
+            if elm.tag == "SupplProvision" and elm.get("AmendLawNum") is not None:
+                continue
+            children = []
+            for tag in tags:
+                for child in elm.iterchildren(tag):
+                    child_level = level + 1
+                    symbol = _node_symbol(child)
+                    child_anchor = anchor if symbol is None else (anchor + "-" + symbol if anchor else symbol)
+                    child_header: str | Exception = header
+                    if not isinstance(header, Exception):
+                        try:
+                            line = _node_header_line(child, self.indent * child_level)
+                            if line is not None:
+                                child_header = header + "\n" + line if header else line
+                        except Exception as e:
+                            child_header = e
+                    children.append((child, child_level, child_anchor, child_header))
+            stack.extend(reversed(children))
+
+
+def iter_article_chunk_records_lxml(law: etree._Element, file_name: str, indent: int = 2) -> Iterator[dict]:
+    """
+    iter_article_chunk_records（strategy="article"）と同じレコードを lxml の走査だけで生成する
+    """
+    law_body = _child(law, "LawBody")
+    law_title_elm = _child(law_body, "LawTitle") if law_body is not None else None
+    if law_title_elm is None:
+        raise ValueError("Law has no LawTitle")
+    law_title = tagged_text(law_title_elm)
+    for chunk in LxmlArticleExtractor(indent=indent)(law):
+        if chunk["anchor"].find("Sp-") >= 0:
+            article_title = law_title + " 附則 " + chunk["article_title"]
+        else:
+            article_title = law_title + " " + chunk["article_title"]
+        yield dict(
+            file_name=file_name,
+            anchor=chunk["anchor"],
+            title=article_title,
+            chunk=chunk["chunk"],
+            chunk_hash=compute_chunk_hash(chunk["chunk"]),
+        )
+
+
+def chunk_xml_bytes_lxml(xml_content: bytes, file_name: str, indent: int = 2) -> list[dict]:
+    """
+    Law要素がルートのXML、またはe-Gov APIのレスポンス（DataRoot > ... > Law）をチャンク化する
+    """
+    law = etree.fromstring(xml_content)
+    if law.tag != "Law":
+        law = law.find(".//Law")
+        assert law is not None
+    return list(iter_article_chunk_records_lxml(law, file_name, indent=indent))
+
+
+def chunk_xml_file_lxml(xml_file: Path, indent: int = 2) -> list[dict]:
+    return chunk_xml_bytes_lxml(Path(xml_file).read_bytes(), Path(xml_file).stem, indent=indent)
@@ -0,0 +1,57 @@
+import json
+from pathlib import Path
+
+from lawsy.chunker.article_chunker import CHUNKER_VERSION
+
+
+def get_chunk_manifest_path(jsonl_file: Path) -> Path:
+    return jsonl_file.with_suffix(".manifest.json")
+
+
+def create_chunk_manifest(chunker_options: dict) -> dict:
+    """
+    article_chunks.jsonl の隣に置くマニフェスト
+
+    files には入力XMLのキー（相対パス、ZIPメンバーは "{アーカイブ}!{メンバー名}"）ごとに、
+    変更検出用の値（fingerprint）と、JSONL 内でのそのファイルのチャンク群の位置（バイトオフセット）を記録する。
+    jsonl には書き出した JSONL のサイズと更新時刻を記録し（save_chunk_manifest で設定）、
+    他のコマンドが JSONL を書き換えた場合にオフセットを使わないようにする。
+    """
+    return {"chunker_version": CHUNKER_VERSION, "chunker_options": chunker_options, "files": {}, "jsonl": None}
+
+
+def get_jsonl_stat(jsonl_file: Path) -> dict:
+    stat = jsonl_file.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_chunk_manifest(manifest_file: Path, jsonl_file: Path, chunker_options: dict) -> dict | None:
+    """
+    再利用可能なマニフェストを読み込む
+
+    マニフェストやJSONLが存在しない場合、チャンカーのバージョンや設定（インデント・分割戦略など）が異なる場合、
+    JSONL がマニフェストを書いたときのものではない場合（サイズか更新時刻が異なる）は None を返す（全件再構築）。
+    """
+    if not manifest_file.exists() or not jsonl_file.exists():
+        return None
+    with open(manifest_file) as fin:
+        manifest = json.load(fin)
+    if manifest.get("chunker_version") != CHUNKER_VERSION or manifest.get("chunker_options") != chunker_options:
+        return None
+    if manifest.get("jsonl") != get_jsonl_stat(jsonl_file):
+        return None
+    return manifest
+
+
+def remove_chunk_manifest(jsonl_file: Path) -> None:
+    """マニフェストを使わずに JSONL を書き出すコマンドで、古いマニフェストを削除する"""
+    get_chunk_manifest_path(jsonl_file).unlink(missing_ok=True)
+
+
+def save_chunk_manifest(manifest_file: Path, manifest: dict, jsonl_file: Path) -> None:
+    """jsonl_file（書き出し済みの JSONL）のサイズと更新時刻を記録してマニフェストを保存する"""
+    manifest["jsonl"] = get_jsonl_stat(jsonl_file)
+    tmp_file = manifest_file.with_suffix(manifest_file.suffix + ".tmp")
+    with open(tmp_file, "w") as fout:
+        json.dump(manifest, fout, ensure_ascii=False, indent=2)
+    tmp_file.replace(manifest_file)
@@ -0,0 +1,140 @@
+"""
+チャンク（file_name, anchor, title, chunk, chunk_hash）の列指向ストア
+
+Arrow IPC（.arrow）またはParquet（.parquet）で保存する。Arrow IPCの場合はメモリマップで開くため、
+読み込み時に本文をPythonオブジェクトへ展開せず、参照された行だけを変換する。
+"""
+
+from collections.abc import Iterable, Iterator, Mapping
+from pathlib import Path
+
+import pyarrow as pa
+
+CHUNK_STORE_SCHEMA = pa.schema(
+    [
+        ("file_name", pa.string()),
+        ("anchor", pa.string()),
+        ("title", pa.string()),
+        ("chunk", pa.string()),
+        ("chunk_hash", pa.string()),
+    ]
+)
+CHUNK_STORE_SUFFIXES = (".arrow", ".parquet")
+
+
+def write_chunk_store(records: Iterable[dict], path: Path, batch_size: int = 8192) -> int:
+    """
+    チャンクレコードを書き出す（拡張子が .parquet の場合はParquet、それ以外はArrow IPC）
+
+    Returns:
+        int: 書き出したレコード数
+    """
+    import pyarrow.parquet as pq
+
+    assert batch_size > 0
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_suffix(path.suffix + ".tmp")
+    if path.suffix == ".parquet":
+        writer = pq.ParquetWriter(tmp_file, CHUNK_STORE_SCHEMA)
+    else:
+        writer = pa.ipc.new_file(tmp_file, CHUNK_STORE_SCHEMA)
+
+    count = 0
+    with writer:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=CHUNK_STORE_SCHEMA))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=CHUNK_STORE_SCHEMA))
+            count += len(batch)
+    tmp_file.replace(path)
+    return count
+
+
+class ArrowChunkStore(Mapping):
+    """
+    (file_name, anchor) をキーとしてチャンクレコードを返す読み取り専用のストア
+
+    キーから行番号への索引は最初の参照時に file_name, anchor 列だけから作成する。
+    同じキーの行が複数ある場合は、JSONL を読み込んだ dict と同じく最後の行を返す（件数もキーの数とする）。
+    """
+
+    def __init__(self, table: pa.Table) -> None:
+        self.table = table
+        self._key_to_row: dict[tuple[str, str], int] | None = None
+
+    @staticmethod
+    def load(path: Path | str) -> "ArrowChunkStore":
+        path = Path(path)
+        if path.suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            table = pq.read_table(path, memory_map=True)
+        else:
+            table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        return ArrowChunkStore(table)
+
+    @property
+    def key_to_row(self) -> dict[tuple[str, str], int]:
+        if self._key_to_row is None:
+            file_names = self.table.column("file_name").to_pylist()
+            anchors = self.table.column("anchor").to_pylist()
+            self._key_to_row = {key: i for i, key in enumerate(zip(file_names, anchors))}
+        return self._key_to_row
+
+    def __getitem__(self, key: tuple[str, str]) -> dict:
+        return self.table.slice(self.key_to_row[key], 1).to_pylist()[0]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.key_to_row
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        return iter(self.key_to_row)
+
+    def __len__(self) -> int:
+        return len(self.key_to_row)
+
+    def take(self, keys: Iterable[tuple[str, str]], columns: list[str] | None = None) -> list[dict]:
+        """
+        複数のキーに対応するレコードをまとめて取得する（1件ずつ参照するよりも高速）
+        """
+        table = self.table if columns is None else self.table.select(columns)
+        rows = [self.key_to_row[key] for key in keys]
+        return table.take(pa.array(rows, type=pa.int64())).to_pylist()
+
+    def iter_records(self, batch_size: int = 8192) -> Iterator[dict]:
+        for batch in self.table.to_batches(max_chunksize=batch_size):
+            yield from batch.to_pylist()
+
+
+def is_chunk_store_stale(chunk_store_file: Path | str, jsonl_file: Path | str) -> bool:
+    """チャンクストアが元の article_chunks.jsonl よりも古い（JSONL を作り直した後に変換していない）場合は True"""
+    chunk_store_file = Path(chunk_store_file)
+    jsonl_file = Path(jsonl_file)
+    if not jsonl_file.exists():
+        return False
+    return chunk_store_file.stat().st_mtime_ns < jsonl_file.stat().st_mtime_ns
+
+
+def load_chunk_store(path: Path | str) -> Mapping[tuple[str, str], dict]:
+    """
+    チャンクを (file_name, anchor) → レコード の Mapping として読み込む
+
+    .arrow / .parquet の場合は ArrowChunkStore を、それ以外（article_chunks.jsonl）の場合は dict を返す。
+    """
+    import json
+
+    path = Path(path)
+    if path.suffix in CHUNK_STORE_SUFFIXES:
+        return ArrowChunkStore.load(path)
+    result = {}
+    with open(path) as fin:
+        for line in fin:
+            d = json.loads(line)
+            result[d["file_name"], d["anchor"]] = d
+    return result
@@ -0,0 +1,233 @@
+"""
+法令の構造（法令 → 編・章・節・款・目 → 条 → 項）の索引
+
+チャンクのアンカー（Mp-Ch_2-Se_1-At_3-Pr_2 など）と見出し行から木を復元し、各ノードについて
+配下のチャンクの範囲（法令ごとのチャンクの並びの区間）を記録する。検索時は、ヒットした条と同じ章の条や
+前後の項を、追加の検索なしに索引から取得できる。
+"""
+
+import json
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from lawsy.chunker.document_chunker import is_document_file_name
+
+# アンカーの記号のうち、見出し行を持つ構造ノード（本則・附則・編・章・節・款・目）の接頭辞
+STRUCTURE_SYMBOL_PREFIXES = ("Mp", "Sp", "Pa_", "Ch_", "Se_", "Ss_", "Di_")
+STRUCTURE_INDEX_VERSION = 1
+
+
+def is_structure_symbol(symbol: str) -> bool:
+    return symbol.startswith(STRUCTURE_SYMBOL_PREFIXES)
+
+
+def get_structure_index_path(jsonl_file: Path) -> Path:
+    return jsonl_file.with_suffix(".structure.json")
+
+
+@dataclass
+class StructureNode:
+    """
+    構造ノード（法令全体はアンカーが空文字列のノード）
+
+    Attributes:
+        anchor: ノードのアンカー（Mp-Ch_2 など）
+        title: 見出し（法令名、本則、章名など）
+        parent: 親ノードの番号（法令全体のノードは -1）
+        start: 配下の最初のチャンクの番号
+        end: 配下の最後のチャンクの次の番号
+    """
+
+    anchor: str
+    title: str
+    parent: int
+    start: int
+    end: int
+
+
+class _LawStructure:
+    """1つの法令のチャンクの並びと構造ノード"""
+
+    def __init__(self, title: str) -> None:
+        self.anchors: list[str] = []  # チャンクのアンカー（出現順）
+        self.chunk_parents: list[int] = []  # チャンクごとの直近の祖先ノード（条ノードを含む）の番号
+        self.nodes = [StructureNode(anchor="", title=title, parent=-1, start=0, end=0)]
+        self.node_index: dict[str, int] = {"": 0}
+        self.row_index: dict[str, int] = {}
+
+    def add(self, anchor: str, chunk: str) -> None:
+        row = len(self.anchors)
+        self.anchors.append(anchor)
+        self.row_index.setdefault(anchor, row)
+        # 見出し行は1行目が法令名、以降は構造ノードごとに1行（get_article_path_string と同じ順）
+        header_lines = chunk.split("\n")[1:]
+        parent = 0
+        node_anchor = ""
+        symbols = anchor.split("-")
+        num_structure_symbols = 0
+        for symbol in symbols:
+            node_anchor = node_anchor + "-" + symbol if node_anchor else symbol
+            if is_structure_symbol(symbol):
+                title_index = num_structure_symbols
+                num_structure_symbols += 1
+                title = header_lines[title_index].strip() if title_index < len(header_lines) else symbol
+            elif symbol.startswith("At_"):
+                # 条は見出しの次の行（条見出し、なければ条名）
+                title_index = num_structure_symbols
+                title = header_lines[title_index].strip() if title_index < len(header_lines) else symbol
+            else:
+                # 項・号（分割されたチャンク）はチャンク自体が葉になる
+                break
+            if node_anchor not in self.node_index:
+                self.node_index[node_anchor] = len(self.nodes)
+                self.nodes.append(StructureNode(anchor=node_anchor, title=title, parent=parent, start=row, end=row))
+            parent = self.node_index[node_anchor]
+        self.chunk_parents.append(parent)
+        # 祖先ノードの範囲を広げる
+        node_id = parent
+        while node_id >= 0:
+            self.nodes[node_id].end = row + 1
+            node_id = self.nodes[node_id].parent
+
+    def to_dict(self) -> dict:
+        return {
+            "anchors": self.anchors,
+            "chunk_parents": self.chunk_parents,
+            "nodes": [[node.anchor, node.title, node.parent, node.start, node.end] for node in self.nodes],
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> "_LawStructure":
+        law = _LawStructure("")
+        law.anchors = d["anchors"]
+        law.chunk_parents = d["chunk_parents"]
+        law.nodes = [StructureNode(*node) for node in d["nodes"]]
+        law.node_index = {node.anchor: i for i, node in enumerate(law.nodes)}
+        law.row_index = {}
+        for row, anchor in enumerate(law.anchors):
+            law.row_index.setdefault(anchor, row)
+        return law
+
+
+class StructureIndex:
+    """
+    (file_name, anchor) から、そのチャンクの祖先・兄弟・前後のチャンクを引く索引
+    """
+
+    def __init__(self) -> None:
+        self.laws: dict[str, _LawStructure] = {}
+
+    @staticmethod
+    def build(records: Iterable[dict]) -> "StructureIndex":
+        """
+        チャンクレコード（法令ごとに文書順に並んだもの）から索引を作成する（法令XML以外の文書は除く）
+        """
+        index = StructureIndex()
+        for record in records:
+            index.add(record["file_name"], record["anchor"], record["chunk"])
+        return index
+
+    @staticmethod
+    def build_from_jsonl(jsonl_file: Path) -> "StructureIndex":
+        """article_chunks.jsonl を1行ずつ読みながら索引を作成する"""
+        index = StructureIndex()
+        with open(jsonl_file) as fin:
+            for line in fin:
+                record = json.loads(line)
+                index.add(record["file_name"], record["anchor"], record["chunk"])
+        return index
+
+    def __len__(self) -> int:
+        return sum(len(law.anchors) for law in self.laws.values())
+
+    def add(self, file_name: str, anchor: str, chunk: str) -> None:
+        if is_document_file_name(file_name):
+            return
+        if file_name not in self.laws:
+            self.laws[file_name] = _LawStructure(chunk.split("\n", 1)[0].strip())
+        self.laws[file_name].add(anchor, chunk)
+
+    def _locate(self, file_name: str, anchor: str) -> tuple[_LawStructure, int] | None:
+        law = self.laws.get(file_name)
+        if law is None or anchor not in law.row_index:
+            return None
+        return law, law.row_index[anchor]
+
+    def get_path(self, file_name: str, anchor: str) -> list[StructureNode]:
+        """チャンクの祖先ノードを法令全体から順に返す"""
+        located = self._locate(file_name, anchor)
+        if located is None:
+            return []
+        law, row = located
+        path = []
+        node_id = law.chunk_parents[row]
+        while node_id >= 0:
+            path.append(law.nodes[node_id])
+            node_id = law.nodes[node_id].parent
+        return path[::-1]
+
+    def get_siblings(self, file_name: str, anchor: str, level: int = 1) -> list[str]:
+        """
+        チャンクと同じ祖先ノードの配下にあるチャンクのアンカーを文書順に返す（チャンク自身を含む）
+
+        Args:
+            level: 遡る祖先の段数（条単位のチャンクでは 1 で同じ章・節などの条、
+                項単位に分割されたチャンクでは 1 で同じ条の項、2 で同じ章・節などの条の項）
+        """
+        assert level > 0
+        located = self._locate(file_name, anchor)
+        if located is None:
+            return []
+        law, row = located
+        node_id = law.chunk_parents[row]
+        # 条単位のチャンクの直近の祖先は条ノード自身のため、条ノードは1段として数えない
+        if law.nodes[node_id].start == row and law.nodes[node_id].end == row + 1 and law.nodes[node_id].parent >= 0:
+            node_id = law.nodes[node_id].parent
+        for _ in range(level - 1):
+            if law.nodes[node_id].parent < 0:
+                break
+            node_id = law.nodes[node_id].parent
+        node = law.nodes[node_id]
+        return law.anchors[node.start : node.end]
+
+    def get_neighbors(self, file_name: str, anchor: str, before: int = 1, after: int = 1) -> list[str]:
+        """
+        チャンクの前後のチャンク（前の項・次の条など）のアンカーを文書順に返す（チャンク自身は含まない）
+
+        前後は同じ本則・附則の中に限る。
+        """
+        located = self._locate(file_name, anchor)
+        if located is None:
+            return []
+        law, row = located
+        path = self.get_path(file_name, anchor)
+        provision = path[1] if len(path) > 1 else path[0]
+        start = max(provision.start, row - before)
+        end = min(provision.end, row + after + 1)
+        return [law.anchors[i] for i in range(start, end) if i != row]
+
+    def save(self, path: Path | str) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_file, "w") as fout:
+            json.dump(
+                {
+                    "version": STRUCTURE_INDEX_VERSION,
+                    "laws": {file_name: law.to_dict() for file_name, law in self.laws.items()},
+                },
+                fout,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        tmp_file.replace(path)
+
+    @staticmethod
+    def load(path: Path | str) -> "StructureIndex":
+        with open(path) as fin:
+            data = json.load(fin)
+        assert data["version"] == STRUCTURE_INDEX_VERSION
+        index = StructureIndex()
+        index.laws = {file_name: _LawStructure.from_dict(law) for file_name, law in data["laws"].items()}
+        return index
@@ -0,0 +1,123 @@
+"""
+チャンクごとの平易な要約の保存と、ベクトルインデックスのメタデータへの反映
+
+要約はオフラインで一括生成し、正規化した本文のハッシュ（chunk_hash）をキーとして追記型のJSONLに保存する。
+本文が変わっていないチャンク（改正前後の版で同じ条文を含む）は保存済みの要約を使い回すため、
+作り直しで要約を生成するのは本文が変わったチャンクだけになる。
+"""
+
+import json
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from lawsy.chunker.dedup import compute_chunk_hash
+from lawsy.utils.logging import get_logger
+
+SUMMARY_FIELD = "summary"
+
+
+class ArticleSummaryStore:
+    """
+    chunk_hash → 要約 の追記型JSONL
+
+    要約は生成したそばから1行ずつ追記するため、途中で中断しても生成済みの要約は失われない。
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.summaries: dict[str, str] = {}
+        self._needs_newline = False
+        if self.path.exists():
+            with open(self.path) as fin:
+                for line in fin:
+                    self._needs_newline = not line.endswith("\n")
+                    try:
+                        d = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 中断時に書きかけになった最終行は読み飛ばす
+                        continue
+                    self.summaries[d["chunk_hash"]] = d["summary"]
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def __contains__(self, chunk_hash: str) -> bool:
+        return chunk_hash in self.summaries
+
+    def get(self, chunk_hash: str) -> str | None:
+        return self.summaries.get(chunk_hash)
+
+    def add(self, chunk_hash: str, summary: str) -> None:
+        self.summaries[chunk_hash] = summary
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as fout:
+            if self._needs_newline:
+                fout.write("\n")
+                self._needs_newline = False
+            print(json.dumps({"chunk_hash": chunk_hash, "summary": summary}, ensure_ascii=False), file=fout)
+
+
+def summarize_chunks(
+    records: Iterable[dict],
+    summarize: Callable[[str, str], str],
+    store: ArticleSummaryStore,
+    max_workers: int = 4,
+) -> int:
+    """
+    要約のないチャンクを要約してストアに追加する
+
+    Args:
+        records: title, chunk を持つレコード（インデックスのメタデータなど）
+        summarize: (タイトル, 本文) から要約を返す関数（スレッドから並行に呼ばれる）
+        max_workers: 同時に要約するチャンク数
+
+    Returns:
+        int: 新たに要約したチャンク数（失敗したものは含まず、次回の実行で再び対象になる）
+    """
+    assert max_workers > 0
+    logger = get_logger()
+    targets: dict[str, dict] = {}
+    for record in records:
+        chunk_hash = record.get("chunk_hash") or compute_chunk_hash(record["chunk"])
+        if chunk_hash not in store and chunk_hash not in targets:
+            targets[chunk_hash] = record
+    if not targets:
+        return 0
+
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(summarize, record["title"], record["chunk"]): chunk_hash
+            for chunk_hash, record in targets.items()
+        }
+        for future in as_completed(futures):
+            chunk_hash = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                logger.warning(f"cannot summarize {targets[chunk_hash]['title']}: {e}")
+                continue
+            if not summary or not summary.strip():
+                continue
+            store.add(chunk_hash, summary.strip())
+            count += 1
+    return count
+
+
+def attach_summaries(meta_data: list[dict], store: ArticleSummaryStore) -> int:
+    """
+    メタデータの各チャンクに、本文に対応する要約を summary として設定する（要約がないものは summary を除く）
+
+    Returns:
+        int: 要約を設定したチャンク数
+    """
+    count = 0
+    for meta in meta_data:
+        summary = store.get(meta.get("chunk_hash") or compute_chunk_hash(meta["chunk"]))
+        if summary is None:
+            meta.pop(SUMMARY_FIELD, None)
+            continue
+        meta[SUMMARY_FIELD] = summary
+        count += 1
+    return count
@@ -6,36 +6,160 @@ e-Gov APIから取得したXMLファイルをja_law_parserで処理可能な形
 """
 
 import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import List
+from typing import List, Optional, TextIO, Union
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from lawsy.data.xml_source import XmlSource, find_stem_collisions, list_xml_sources
+
+
+# DataRoot > ApplData > LawFullText > Law
+LAW_ELEMENT_PATH = ["DataRoot", "ApplData", "LawFullText", "Law"]
+
+# 属性値では &, <, > に加えて ET.tostring と同じくこれらの文字も文字参照にする
+ATTRIBUTE_ENTITIES = {'"': "&quot;", "\r": "&#13;", "\n": "&#10;", "\t": "&#09;"}
+
+
+class LawXmlStructureError(Exception):
+    """e-Gov APIのXMLが想定した構造でない場合のエラー"""
+
+
+def stream_law_element(source, fout: TextIO) -> Optional[str]:
+    """
+    e-Gov APIのXMLからLaw要素をiterparseで逐次読み出し、そのままfoutに書き出す
+
+    書き出し終えた要素は親から取り除くため、メモリ使用量は文書サイズではなく木の深さに比例する。
+    出力は ET.tostring(Law要素) と同一になる（空要素の "<Tag />"、属性のエスケープ、Law要素のtailを含む）。
+
+    Args:
+        source: 入力XMLファイルのパスまたはファイルオブジェクト
+        fout: 出力先（Law要素以下のXMLが書き込まれる）
+
+    Returns:
+        Optional[str]: ApplData > LawId の値（存在しない場合はNone）
+    """
+    law_id = None
+    stack: List[ET.Element] = []  # Law要素以下の開いている要素
+    tags: List[str] = []  # ルートからの開いている要素のタグ
+    matched_depth = 0  # LAW_ELEMENT_PATH のうち一致した深さ
+    open_tag: Optional[ET.Element] = None  # 開始タグの ">" が未出力の要素（空要素なら "<Tag />" にする）
+    pending_text: Optional[ET.Element] = None  # textが未出力の要素
+    pending_tail: Optional[ET.Element] = None  # tailが未出力の要素
+    law_element: Optional[ET.Element] = None  # 書き出し終えたLaw要素（tailが未出力）
+
+    def flush():
+        nonlocal open_tag, pending_text, pending_tail
+        # text/tailはその次のイベントの時点で確定している
+        if open_tag is not None:
+            fout.write(">")
+            open_tag = None
+        if pending_text is not None:
+            if pending_text.text:
+                fout.write(escape(pending_text.text))
+            pending_text = None
+        if pending_tail is not None:
+            if pending_tail.tail:
+                fout.write(escape(pending_tail.tail))
+            stack[-1].remove(pending_tail)
+            pending_tail = None
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if law_element is not None:
+            # Law要素のtailも ET.tostring と同様に書き出し、残りは読まない
+            if law_element.tail:
+                fout.write(escape(law_element.tail))
+            return law_id
+        if event == "start":
+            tags.append(elem.tag)
+            if not stack:
+                if tags == LAW_ELEMENT_PATH[: len(tags)]:
+                    matched_depth = max(matched_depth, len(tags))
+                elif len(tags) == 1:
+                    raise LawXmlStructureError(f"Expected DataRoot, got {elem.tag}")
+                if tags != LAW_ELEMENT_PATH:
+                    continue
+            flush()
+            attrs = "".join(f' {name}="{escape(value, ATTRIBUTE_ENTITIES)}"' for name, value in elem.attrib.items())
+            fout.write(f"<{elem.tag}{attrs}")
+            open_tag = elem
+            stack.append(elem)
+            pending_text = elem
+        else:
+            tags.pop()
+            if not stack:
+                if elem.tag == "LawId" and tags == LAW_ELEMENT_PATH[:2]:
+                    law_id = elem.text
+                # Law要素以外（ImageDataなど）は保持しない
+                elem.clear()
+                continue
+            if open_tag is elem and not elem.text:
+                fout.write(" />")
+                open_tag = None
+                pending_text = None
+            else:
+                flush()
+                fout.write(f"</{elem.tag}>")
+            stack.pop()
+            if not stack:
+                law_element = elem
+                continue
+            pending_tail = elem
+
+    if law_element is not None:
+        if law_element.tail:
+            fout.write(escape(law_element.tail))
+        return law_id
+    if matched_depth < 2:
+        raise LawXmlStructureError("ApplData element not found")
+    if matched_depth < 3:
+        raise LawXmlStructureError("LawFullText element not found")
+    raise LawXmlStructureError("Law element not found")
+
+
+def _process_file_in_worker(input_dir: str, output_dir: str, streaming: bool, input_file: XmlSource) -> tuple:
+    """プロセスプール用：1ファイルを処理し、結果と処理ログを返す"""
+    processor = EgovXmlProcessor(input_dir, output_dir, streaming=streaming)
+    success, result = processor.process_file(input_file)
+    return success, result, processor.processed_files, processor.error_files
+
+
+def _as_xml_source(input_file: Union[Path, XmlSource]) -> XmlSource:
+    if isinstance(input_file, XmlSource):
+        return input_file
+    return XmlSource.from_file(Path(input_file))
 
 
 class EgovXmlProcessor:
     """e-Gov API XMLファイルの前処理クラス"""
     
-    def __init__(self, input_dir: str, output_dir: str):
+    def __init__(self, input_dir: str, output_dir: str, streaming: bool = False):
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.streaming = streaming
         
         # 処理ログ
         self.processed_files = []
         self.error_files = []
     
-    def extract_law_xml(self, input_file: Path) -> tuple[bool, str]:
+    def extract_law_xml(self, input_file: Union[Path, XmlSource]) -> tuple[bool, str]:
         """
         e-Gov APIのXMLファイルからLaw要素を抽出
         
         Args:
-            input_file: 入力XMLファイルパス
+            input_file: 入力XMLファイルパス（またはZIPアーカイブのメンバー）
             
         Returns:
             tuple[bool, str]: (成功フラグ, エラーメッセージまたは出力ファイルパス)
         """
+        input_file = _as_xml_source(input_file)
         try:
             # XMLファイルを読み込み
-            tree = ET.parse(input_file)
+            with input_file.open() as fin:
+                tree = ET.parse(fin)
             root = tree.getroot()
             
             # DataRoot > ApplData > LawFullText > Law の構造を確認
@@ -90,10 +214,82 @@ class EgovXmlProcessor:
             self.error_files.append({"input_file": str(input_file), "error": error_msg})
             return False, error_msg
     
-    def process_all_files(self) -> dict:
+    def extract_law_xml_streaming(self, input_file: Union[Path, XmlSource]) -> tuple[bool, str]:
+        """
+        e-Gov APIのXMLファイルからLaw要素をストリーミングで抽出
+
+        extract_law_xml と同じ出力を、XML全体の木を構築せずに書き出す。
+
+        Args:
+            input_file: 入力XMLファイルパス（またはZIPアーカイブのメンバー）
+
+        Returns:
+            tuple[bool, str]: (成功フラグ, エラーメッセージまたは出力ファイルパス)
+        """
+        input_file = _as_xml_source(input_file)
+        output_filename = input_file.stem + "_processed.xml"
+        output_file = self.output_dir / output_filename
+        tmp_file = output_file.with_suffix(".xml.tmp")
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f, input_file.open() as fin:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                law_id = stream_law_element(fin, f)
+            tmp_file.replace(output_file)
+
+            # 処理成功をログに記録
+            self.processed_files.append({
+                "input_file": str(input_file),
+                "output_file": str(output_file),
+                "law_id": law_id if law_id is not None else "unknown"
+            })
+
+            return True, str(output_file)
+
+        except LawXmlStructureError as e:
+            tmp_file.unlink(missing_ok=True)
+            return False, str(e)
+
+        except ET.ParseError as e:
+            tmp_file.unlink(missing_ok=True)
+            error_msg = f"XML parse error: {str(e)}"
+            self.error_files.append({"input_file": str(input_file), "error": error_msg})
+            return False, error_msg
+
+        except Exception as e:
+            tmp_file.unlink(missing_ok=True)
+            error_msg = f"Unexpected error: {str(e)}"
+            self.error_files.append({"input_file": str(input_file), "error": error_msg})
+            return False, error_msg
+
+    def process_file(self, input_file: Union[Path, XmlSource]) -> tuple[bool, str]:
+        """設定（streaming）に応じた方式で1ファイルを処理"""
+        if self.streaming:
+            return self.extract_law_xml_streaming(input_file)
+        return self.extract_law_xml(input_file)
+
+    def _iter_process_results(self, xml_files: List[XmlSource], workers: int = 1):
+        """各ファイルの処理結果を入力順に返す（workers > 1 の場合はプロセスプールで並列処理）"""
+        if workers <= 1:
+            for xml_file in xml_files:
+                yield self.process_file(xml_file)
+            return
+        worker = partial(_process_file_in_worker, str(self.input_dir), str(self.output_dir), self.streaming)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for success, result, processed_files, error_files in executor.map(worker, xml_files):
+                self.processed_files.extend(processed_files)
+                self.error_files.extend(error_files)
+                yield success, result
+
+    def process_all_files(self, workers: int = 1) -> dict:
         """
-        入力ディレクトリ内の全XMLファイルを処理
+        入力ディレクトリ内の全XMLファイル（ZIPアーカイブ内のXMLを含む）を処理
+
+        ZIPアーカイブは展開せず、メンバーを直接読み出して処理する。
+        出力ファイル名（{stem}_processed.xml）が同じになる入力がある場合は、何も書き出さずに ValueError を送出する。
         
+        Args:
+            workers: 並列処理に使うプロセス数（1の場合は逐次処理）
+
         Returns:
             dict: 処理結果サマリー
         """
@@ -102,10 +298,18 @@ class EgovXmlProcessor:
         print(f"出力ディレクトリ: {self.output_dir}")
         
         # XMLファイルを検索
-        xml_files = list(self.input_dir.glob("*.xml"))
+        xml_files = list_xml_sources(self.input_dir, recursive=False)
         if not xml_files:
             print("XMLファイルが見つかりません")
             return {"total": 0, "success": 0, "error": 0}
+
+        # 後から処理したもので出力が上書きされないように、処理を始める前に確認する
+        collisions = find_stem_collisions(xml_files)
+        if collisions:
+            details = "; ".join(
+                f"{stem}: {', '.join(source.key for source in group)}" for stem, group in collisions.items()
+            )
+            raise ValueError(f"multiple inputs map to the same output file (<stem>_processed.xml): {details}")
         
         print(f"対象ファイル数: {len(xml_files)}")
         print()
@@ -113,9 +317,9 @@ class EgovXmlProcessor:
         success_count = 0
         error_count = 0
         
-        for xml_file in xml_files:
+        results = self._iter_process_results(xml_files, workers=workers)
+        for xml_file, (success, result) in zip(xml_files, results):
             print(f"処理中: {xml_file.name}")
-            success, result = self.extract_law_xml(xml_file)
             
             if success:
                 print(f"✓ 処理完了: {Path(result).name}")
@@ -160,13 +364,17 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description="e-Gov API XMLファイルの前処理")
-    parser.add_argument("input_dir", help="入力ディレクトリ")
+    parser.add_argument("input_dir", help="入力ディレクトリ（またはZIPアーカイブ）")
     parser.add_argument("output_dir", help="出力ディレクトリ")
+    parser.add_argument("--streaming", action="store_true",
+                       help="iterparseによるストリーミング抽出を使う（大きな法令でもメモリ使用量を抑える）")
+    parser.add_argument("--workers", "-w", type=int, default=1,
+                       help="並列処理に使うプロセス数 (default: 1)")
     
     args = parser.parse_args()
     
-    processor = EgovXmlProcessor(args.input_dir, args.output_dir)
-    result = processor.process_all_files()
+    processor = EgovXmlProcessor(args.input_dir, args.output_dir, streaming=args.streaming)
+    result = processor.process_all_files(workers=args.workers)
     
     if result["error"] > 0:
         print("\nエラーが発生したファイル:")
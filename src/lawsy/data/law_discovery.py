@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+関連法令の探索
+
+起点の法令から、本文中の法令番号による参照と、e-Govの法令名一覧上の施行令・施行規則を辿って
+関連法令の依存グラフを作り、深さと法令数の上限の範囲で閉包をダウンロードする
+"""
+
+import asyncio
+import json
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from lawsy.data.law_download_engine import AsyncLawDownloadEngine
+
+# 昭和三十五年法律第百四十五号、平成十六年厚生労働省令第百七十九号 など（e-Govの法令名一覧の LawNo と同じ表記）
+LAW_NUMBER_PATTERN = re.compile(
+    r"(?:明治|大正|昭和|平成|令和)[元一二三四五六七八九十]+年"
+    r"(?:法律|政令|勅令|[^\s、。，．（）「」年第]{1,12}?(?:省令|府令|規則|告示))"
+    r"第[一二三四五六七八九十百千]+号"
+)
+# 法令名が「{起点の法令名}施行令」のようになっているものを施行令・施行規則として辿る
+ENFORCEMENT_SUFFIX_PATTERN = re.compile(r"^施行(?:令|規則|規程|法)$")
+SHORT_NAME_MAX_LENGTH = 40
+
+
+def extract_law_numbers(text: str) -> List[str]:
+    """本文中の法令番号を出現順に（重複を除いて）取り出す"""
+    return list(dict.fromkeys(LAW_NUMBER_PATTERN.findall(text)))
+
+
+def get_law_category(law_id: str) -> str:
+    """法令IDの種別部分（例: 335AC0000000145 の AC）から PHARMA_LAWS と同じカテゴリ名を返す"""
+    law_type = law_id[3:5]
+    if law_type == "AC":
+        return "law"
+    if law_type == "CO":
+        return "cabinet_order"
+    if law_type.startswith("M"):
+        return "ordinance"
+    return "other"
+
+
+def create_law_info(law_id: str, law_name: str) -> Dict:
+    """法令名一覧の情報から PHARMA_LAWS と同じ形式の法令情報を作る"""
+    return {
+        "law_id": law_id,
+        "title": law_name,
+        # 保存ファイル名に使うため長すぎる法令名は切り詰める
+        "short_name": law_name[:SHORT_NAME_MAX_LENGTH],
+        "category": get_law_category(law_id),
+    }
+
+
+def extract_law_text(content: bytes) -> str:
+    """法令XMLの本文を連結して返す"""
+    return "".join(ET.fromstring(content).itertext())
+
+
+@dataclass
+class LawGraph:
+    """
+    関連法令の依存グラフ
+
+    Attributes:
+        nodes: 法令ID → 法令情報（PHARMA_LAWS と同じ形式に、起点からの深さ depth を加えたもの）
+        edges: (参照元の法令ID, 参照先の法令ID, 種類) のリスト。種類は "reference"（法令番号による参照）
+            または "enforcement"（施行令・施行規則）
+    """
+
+    nodes: Dict[str, Dict] = field(default_factory=dict)
+    edges: List[Tuple[str, str, str]] = field(default_factory=list)
+
+    def save(self, path: Path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"nodes": self.nodes, "edges": [list(edge) for edge in self.edges]}, f, ensure_ascii=False, indent=2
+            )
+
+    @staticmethod
+    def load(path: Path) -> "LawGraph":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return LawGraph(nodes=data["nodes"], edges=[tuple(edge) for edge in data["edges"]])  # type: ignore
+
+
+class RelatedLawCrawler:
+    """起点の法令から関連法令を幅優先で探索し、ダウンロードするクラス"""
+
+    def __init__(
+        self,
+        downloader,
+        max_depth: int = 2,
+        max_laws: int = 300,
+        requests_per_second: float = 1.0,
+        max_concurrency: int = 4,
+    ):
+        """
+        Args:
+            downloader: 法令の保存とダウンロードログの記録に使う PharmaLawDownloader
+            max_depth: 起点からの最大の深さ（0 の場合は起点のみ）
+            max_laws: グラフに含める法令数の上限（起点を含む）
+            requests_per_second: 秒間リクエスト数の上限
+            max_concurrency: 同時接続数の上限
+        """
+        assert max_depth >= 0 and max_laws > 0
+        self.downloader = downloader
+        self.max_depth = max_depth
+        self.max_laws = max_laws
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.law_list: List[Dict[str, str]] = []
+        self.laws_by_number: Dict[str, List[Dict[str, str]]] = {}
+
+    def fetch_law_list(self):
+        engine = AsyncLawDownloadEngine(
+            base_url=self.downloader.base_url,
+            requests_per_second=self.requests_per_second,
+            max_concurrency=self.max_concurrency,
+            timeout=self.downloader.timeout,
+        )
+        self.law_list = asyncio.run(engine.fetch_law_list())
+        self.laws_by_number = {}
+        for info in self.law_list:
+            self.laws_by_number.setdefault(info["law_no"], []).append(info)
+
+    def find_related_laws(self, law_info: Dict, text: str) -> List[Tuple[str, str, str]]:
+        """
+        法令の関連法令を探す
+
+        Returns:
+            List[Tuple[str, str, str]]: (法令ID, 法令名, 種類) のリスト
+        """
+        related = []
+        for info in self.law_list:
+            name = info["law_name"]
+            if name.startswith(law_info["title"]) and ENFORCEMENT_SUFFIX_PATTERN.match(name[len(law_info["title"]) :]):
+                related.append((info["law_id"], name, "enforcement"))
+        for law_number in extract_law_numbers(text):
+            for info in self.laws_by_number.get(law_number, []):
+                related.append((info["law_id"], info["law_name"], "reference"))
+        return [(law_id, name, kind) for law_id, name, kind in related if law_id != law_info["law_id"]]
+
+    def crawl(self, seeds: Dict[str, Dict]) -> Tuple[LawGraph, Dict[str, Tuple[bool, Optional[str]]]]:
+        """
+        起点の法令から関連法令を探索し、見つかった法令をダウンロードする
+
+        深さごとに、その深さの法令をまとめて非同期エンジンで並行ダウンロードし、
+        保存されたXMLから次の深さの法令を探す。変更のない法令は条件付きGETで再取得を省略する。
+
+        Args:
+            seeds: 法令キー → 法令情報（PHARMA_LAWSと同じ形式）
+
+        Returns:
+            Tuple[LawGraph, Dict]: 依存グラフと、法令IDごとのダウンロード結果
+        """
+        if not self.law_list:
+            self.fetch_law_list()
+
+        graph = LawGraph()
+        for law_info in seeds.values():
+            graph.nodes[law_info["law_id"]] = {**law_info, "depth": 0}
+        frontier = list(graph.nodes.keys())
+        results: Dict[str, Tuple[bool, Optional[str]]] = {}
+        for depth in range(self.max_depth + 1):
+            if not frontier:
+                break
+            print(f"深さ {depth}: {len(frontier)} 法令をダウンロード")
+            laws = {law_id: graph.nodes[law_id] for law_id in frontier}
+            results.update(
+                self.downloader.download_laws_async(
+                    laws, requests_per_second=self.requests_per_second, max_concurrency=self.max_concurrency
+                )
+            )
+            if depth == self.max_depth:
+                break
+
+            next_frontier = []
+            seen_edges: Set[Tuple[str, str, str]] = set(graph.edges)
+            for law_id in frontier:
+                law_info = graph.nodes[law_id]
+                file_path = self.downloader._get_law_file_path(law_id, law_info)
+                if not results[law_id][0] or not file_path.exists():
+                    continue
+                text = extract_law_text(file_path.read_bytes())
+                for related_id, related_name, kind in self.find_related_laws(law_info, text):
+                    if related_id not in graph.nodes:
+                        if len(graph.nodes) >= self.max_laws:
+                            continue
+                        graph.nodes[related_id] = {**create_law_info(related_id, related_name), "depth": depth + 1}
+                        next_frontier.append(related_id)
+                    edge = (law_id, related_id, kind)
+                    if edge not in seen_edges:
+                        seen_edges.add(edge)
+                        graph.edges.append(edge)
+            frontier = next_frontier
+        return graph, results
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+e-Gov法令APIの非同期ダウンロードエンジン
+
+トークンバケットによる秒間リクエスト数の制限と同時接続数の上限を守りつつ、
+ETag/Last-Modified（またはコンテンツハッシュ）を使って変更のない法令の取得を省略する
+"""
+
+import asyncio
+import hashlib
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+
+class TokenBucket:
+    """秒間リクエスト数を制限するトークンバケット"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: 1秒あたりに補充されるトークン数（= 許容する秒間リクエスト数）
+            capacity: バケットの容量（バースト可能なリクエスト数、default: 1）
+        """
+        assert rate > 0
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else 1.0
+        assert self.capacity >= 1
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """トークンを1つ取得（不足している場合は補充されるまで待機）"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class FetchResult:
+    """法令XML取得結果"""
+
+    law_id: str
+    status: str  # "updated" | "not_modified" | "unchanged" | "error"
+    content: Optional[bytes] = None
+    validator: Optional[Dict] = None  # 次回の条件付きGETに使う情報（etag, last_modified, sha256）
+    error: Optional[str] = None
+
+
+@dataclass
+class UpdateListResult:
+    """更新法令一覧（updatelawlists）の取得結果"""
+
+    date: str  # yyyyMMdd
+    law_ids: Optional[List[str]] = None
+    error: Optional[str] = None
+
+
+def parse_law_name_list(content: bytes) -> List[Dict[str, str]]:
+    """
+    法令一覧（lawlists, updatelawlists）のレスポンス（DataRoot > ApplData > LawNameListInfo）を読む
+
+    Returns:
+        List[Dict[str, str]]: LawNameListInfo ごとの law_id, law_name, law_no（法令番号）
+    """
+    root = ET.fromstring(content)
+    return [
+        {
+            "law_id": info.findtext("LawId") or "",
+            "law_name": info.findtext("LawName") or "",
+            "law_no": info.findtext("LawNo") or "",
+        }
+        for info in root.iterfind("./ApplData/LawNameListInfo")
+    ]
+
+
+def parse_update_law_list(content: bytes) -> List[str]:
+    """
+    updatelawlists APIのレスポンスから法令IDを取り出す
+
+    該当する法令がない日のレスポンスには LawNameListInfo が含まれないため、空のリストを返す
+    """
+    law_ids = []
+    for info in parse_law_name_list(content):
+        if info["law_id"] and info["law_id"] not in law_ids:
+            law_ids.append(info["law_id"])
+    return law_ids
+
+
+class AsyncLawDownloadEngine:
+    """e-Gov法令APIの非同期ダウンロードエンジン"""
+
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        base_url: str = "https://laws.e-gov.go.jp/api/1",
+        requests_per_second: float = 1.0,
+        max_concurrency: int = 4,
+        timeout: float = 30,
+        max_retries: int = 3,
+        backoff_factor: float = 1.0,
+    ):
+        assert max_concurrency > 0
+        self.base_url = base_url.rstrip("/")
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+    def create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+        )
+
+    async def get(
+        self,
+        client: httpx.AsyncClient,
+        bucket: TokenBucket,
+        semaphore: asyncio.Semaphore,
+        path: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        レート制限・同時接続数制限・リトライ付きのGET
+
+        リトライ対象のステータス（429, 5xx）の場合は指数バックオフで再試行し、
+        再試行もトークンを消費する。
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            async with semaphore:
+                response = await client.get(url, headers=headers)
+            if response.status_code not in self.RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            retry_after = response.headers.get("retry-after")
+            if retry_after is not None and retry_after.isdigit():
+                wait = float(retry_after)
+            else:
+                wait = self.backoff_factor * (2**attempt)
+            await asyncio.sleep(wait)
+        raise AssertionError("unreachable")
+
+    async def fetch_law(
+        self,
+        client: httpx.AsyncClient,
+        bucket: TokenBucket,
+        semaphore: asyncio.Semaphore,
+        law_id: str,
+        validator: Optional[Dict] = None,
+    ) -> FetchResult:
+        """
+        法令XMLを条件付きGETで取得
+
+        Args:
+            law_id: 法令ID
+            validator: 前回取得時の etag / last_modified / sha256
+
+        Returns:
+            FetchResult: 304 の場合は not_modified、内容のハッシュが前回と同じ場合は unchanged
+        """
+        validator = validator or {}
+        headers = {}
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+        try:
+            response = await self.get(client, bucket, semaphore, f"lawdata/{law_id}", headers=headers)
+            if response.status_code == 304:
+                return FetchResult(law_id=law_id, status="not_modified", validator=validator)
+            response.raise_for_status()
+
+            content_type = response.headers.get("content-type", "").lower()
+            if "xml" not in content_type:
+                return FetchResult(law_id=law_id, status="error", error=f"XMLではないレスポンス: {content_type}")
+
+            content = response.content
+            new_validator = {
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "sha256": hashlib.sha256(content).hexdigest(),
+            }
+            if new_validator["sha256"] == validator.get("sha256"):
+                return FetchResult(law_id=law_id, status="unchanged", validator=new_validator)
+            return FetchResult(law_id=law_id, status="updated", content=content, validator=new_validator)
+
+        except httpx.HTTPError as e:
+            return FetchResult(law_id=law_id, status="error", error=f"HTTP エラー: {str(e)}")
+
+    async def fetch_laws(self, requests: List[Tuple[str, Optional[Dict]]]) -> List[FetchResult]:
+        """
+        複数の法令XMLを並行して取得
+
+        Args:
+            requests: (法令ID, validator) のリスト
+
+        Returns:
+            List[FetchResult]: 入力と同じ順序の取得結果
+        """
+        bucket = TokenBucket(self.requests_per_second)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.create_client() as client:
+            return await asyncio.gather(
+                *[self.fetch_law(client, bucket, semaphore, law_id, validator) for law_id, validator in requests]
+            )
+
+    async def fetch_update_list(
+        self,
+        client: httpx.AsyncClient,
+        bucket: TokenBucket,
+        semaphore: asyncio.Semaphore,
+        date: str,
+    ) -> UpdateListResult:
+        """
+        指定日に更新された法令の一覧を取得
+
+        Args:
+            date: 日付（yyyyMMdd）
+        """
+        try:
+            response = await self.get(client, bucket, semaphore, f"updatelawlists/{date}")
+            response.raise_for_status()
+            return UpdateListResult(date=date, law_ids=parse_update_law_list(response.content))
+        except httpx.HTTPError as e:
+            return UpdateListResult(date=date, error=f"HTTP エラー: {str(e)}")
+        except ET.ParseError as e:
+            return UpdateListResult(date=date, error=f"XML パースエラー: {str(e)}")
+
+    async def fetch_update_lists(self, dates: List[str]) -> List[UpdateListResult]:
+        """
+        複数日の更新法令一覧を並行して取得
+
+        Returns:
+            List[UpdateListResult]: 入力と同じ順序の取得結果
+        """
+        bucket = TokenBucket(self.requests_per_second)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.create_client() as client:
+            return await asyncio.gather(*[self.fetch_update_list(client, bucket, semaphore, date) for date in dates])
+
+    async def fetch_law_list(self, category: int = 1) -> List[Dict[str, str]]:
+        """
+        法令名一覧（lawlists）を取得
+
+        Args:
+            category: 法令種別（1: 全法令, 2: 憲法・法律, 3: 政令・勅令, 4: 府省令・規則）
+
+        Raises:
+            httpx.HTTPError: 取得に失敗した場合
+        """
+        bucket = TokenBucket(self.requests_per_second)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.create_client() as client:
+            response = await self.get(client, bucket, semaphore, f"lawlists/{category}")
+            response.raise_for_status()
+            return parse_law_name_list(response.content)
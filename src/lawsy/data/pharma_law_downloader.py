@@ -5,9 +5,12 @@
 e-Gov法令APIから薬事関連法令を選択的にダウンロードする
 """
 
+import asyncio
+import hashlib
 import json
 import os
 import time
+from datetime import date, datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from urllib.parse import quote
@@ -16,6 +19,9 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from lawsy.data.law_discovery import LawGraph, RelatedLawCrawler
+from lawsy.data.law_download_engine import AsyncLawDownloadEngine
+
 
 class PharmaLawDownloader:
     """薬事関連法令のダウンロードクラス"""
@@ -54,10 +60,11 @@ class PharmaLawDownloader:
         }
     }
     
-    def __init__(self, output_dir: str = "./data/pharma_xml", timeout: int = 30):
+    def __init__(self, output_dir: str = "./data/pharma_xml", timeout: int = 30,
+                 base_url: str = "https://laws.e-gov.go.jp/api/1"):
         self.output_dir = Path(output_dir)
         self.timeout = timeout
-        self.base_url = "https://laws.e-gov.go.jp/api/1"
+        self.base_url = base_url
         
         # 出力ディレクトリを作成
         self.output_dir.mkdir(parents=True, exist_ok=True)
@@ -76,6 +83,8 @@ class PharmaLawDownloader:
         
         # ログファイルパス
         self.log_file = self.output_dir / "download_log.json"
+        # 関連法令の依存グラフ（discover_related_laws で作成）
+        self.graph_file = self.output_dir / "law_graph.json"
         self.download_log = self._load_log()
     
     def _load_log(self) -> Dict:
@@ -83,7 +92,7 @@ class PharmaLawDownloader:
         if self.log_file.exists():
             with open(self.log_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
-        return {"downloads": [], "last_update": None}
+        return {"downloads": [], "last_update": None, "validators": {}}
     
     def _save_log(self):
         """ダウンロードログを保存"""
@@ -113,31 +122,13 @@ class PharmaLawDownloader:
             if 'xml' not in content_type:
                 return False, f"XMLではないレスポンス: {content_type}"
             
-            # ファイル名を生成
-            filename = f"{law_info['short_name']}_{law_id}.xml"
-            safe_filename = filename.replace('/', '_').replace('\\', '_')
-            file_path = self.output_dir / safe_filename
-            
-            # XMLファイルを保存
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(response.text)
-            
-            # ダウンロード情報をログに記録
-            download_info = {
-                "law_id": law_id,
-                "title": law_info['title'],
-                "short_name": law_info['short_name'],
-                "category": law_info['category'],
-                "filename": safe_filename,
-                "file_path": str(file_path),
-                "download_time": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "file_size": len(response.text),
-                "status": "success"
+            file_path = self._save_law_xml(law_id, law_info, response.text)
+            self.download_log.setdefault("validators", {})[law_id] = {
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "sha256": hashlib.sha256(response.content).hexdigest(),
             }
             
-            self.download_log["downloads"].append(download_info)
-            self.download_log["last_update"] = download_info["download_time"]
-            
             print(f"✓ 保存完了: {file_path}")
             return True, None
             
@@ -150,6 +141,286 @@ class PharmaLawDownloader:
             print(f"✗ エラー: {error_msg}")
             return False, error_msg
     
+    def _get_law_file_path(self, law_id: str, law_info: Dict) -> Path:
+        """法令XMLの保存先パスを取得"""
+        filename = f"{law_info['short_name']}_{law_id}.xml"
+        safe_filename = filename.replace('/', '_').replace('\\', '_')
+        return self.output_dir / safe_filename
+
+    def _save_law_xml(self, law_id: str, law_info: Dict, text: str) -> Path:
+        """
+        法令XMLを保存し、ダウンロードログに記録
+
+        Returns:
+            Path: 保存先ファイルパス
+        """
+        file_path = self._get_law_file_path(law_id, law_info)
+
+        # XMLファイルを保存
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        # ダウンロード情報をログに記録
+        download_info = {
+            "law_id": law_id,
+            "title": law_info['title'],
+            "short_name": law_info['short_name'],
+            "category": law_info['category'],
+            "filename": file_path.name,
+            "file_path": str(file_path),
+            "download_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "file_size": len(text),
+            "status": "success"
+        }
+
+        self.download_log["downloads"].append(download_info)
+        self.download_log["last_update"] = download_info["download_time"]
+        return file_path
+
+    def _get_validator(self, law_id: str, law_info: Dict) -> Optional[Dict]:
+        """
+        条件付きGET用の情報（etag, last_modified, sha256）を取得
+
+        ログに記録がなくても保存済みのファイルがあれば、その内容のハッシュを使う
+        """
+        validator = self.download_log.get("validators", {}).get(law_id)
+        file_path = self._get_law_file_path(law_id, law_info)
+        if not file_path.exists():
+            # ファイルが消えている場合は必ず再取得する
+            return None
+        if validator is None:
+            validator = {"sha256": hashlib.sha256(file_path.read_bytes()).hexdigest()}
+        return validator
+
+    def download_laws_async(
+        self,
+        laws: Dict[str, Dict],
+        requests_per_second: float = 1.0,
+        max_concurrency: int = 4,
+    ) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """
+        非同期エンジンで複数の法令を並行ダウンロード
+
+        秒間リクエスト数と同時接続数の上限を守りつつ、条件付きGETで変更のない法令は
+        ファイルを書き換えずにスキップする（内容のハッシュで変更なしと判定した場合は、新しいETagなどだけを記録する）
+
+        Args:
+            laws: 法令キー → 法令情報（PHARMA_LAWSと同じ形式）
+            requests_per_second: 秒間リクエスト数の上限
+            max_concurrency: 同時接続数の上限
+
+        Returns:
+            Dict[str, Tuple[bool, Optional[str]]]: 各法令のダウンロード結果
+        """
+        engine = AsyncLawDownloadEngine(
+            base_url=self.base_url,
+            requests_per_second=requests_per_second,
+            max_concurrency=max_concurrency,
+            timeout=self.timeout,
+        )
+        keys = list(laws.keys())
+        requests = [
+            (laws[law_key]["law_id"], self._get_validator(laws[law_key]["law_id"], laws[law_key]))
+            for law_key in keys
+        ]
+        fetch_results = asyncio.run(engine.fetch_laws(requests))
+
+        results = {}
+        log_changed = False
+        for law_key, fetch_result in zip(keys, fetch_results):
+            law_info = laws[law_key]
+            law_id = law_info["law_id"]
+            if fetch_result.status == "updated":
+                assert fetch_result.content is not None
+                file_path = self._save_law_xml(law_id, law_info, fetch_result.content.decode("utf-8"))
+                self.download_log.setdefault("validators", {})[law_id] = fetch_result.validator
+                log_changed = True
+                print(f"✓ 保存完了: {file_path}")
+                results[law_key] = (True, None)
+            elif fetch_result.status in ("not_modified", "unchanged"):
+                # 内容は同じでもETagなどが新しくなった場合は、次回の条件付きGETで304になるように記録する
+                validators = self.download_log.setdefault("validators", {})
+                if fetch_result.status == "unchanged" and validators.get(law_id) != fetch_result.validator:
+                    validators[law_id] = fetch_result.validator
+                    log_changed = True
+                print(f"- 変更なし: {law_info['short_name']} ({law_id})")
+                results[law_key] = (True, None)
+            else:
+                print(f"✗ エラー: {law_info['short_name']} ({law_id}): {fetch_result.error}")
+                self.download_log["downloads"].append({
+                    "law_id": law_id,
+                    "short_name": law_info["short_name"],
+                    "download_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "status": "error",
+                    "error_message": fetch_result.error
+                })
+                log_changed = True
+                results[law_key] = (False, fetch_result.error)
+
+        # 変更がなければログも書き換えない
+        if log_changed:
+            self._save_log()
+        return results
+
+    def download_all_pharma_laws_async(
+        self, requests_per_second: float = 1.0, max_concurrency: int = 4
+    ) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """
+        全ての薬事関連法令を非同期エンジンでダウンロード
+
+        Args:
+            requests_per_second: 秒間リクエスト数の上限
+            max_concurrency: 同時接続数の上限
+
+        Returns:
+            Dict[str, Tuple[bool, Optional[str]]]: 各法令のダウンロード結果
+        """
+        print("=== 薬事関連法令XMLダウンロード開始（非同期） ===")
+        print(f"出力ディレクトリ: {self.output_dir}")
+        print(f"対象法令数: {len(self.PHARMA_LAWS)}")
+        print(f"秒間リクエスト数: {requests_per_second} / 同時接続数: {max_concurrency}")
+        print()
+
+        results = self.download_laws_async(
+            self.PHARMA_LAWS, requests_per_second=requests_per_second, max_concurrency=max_concurrency
+        )
+
+        print()
+        print("=== ダウンロード完了 ===")
+        success_count = sum(1 for success, _ in results.values() if success)
+        print(f"成功: {success_count}/{len(results)}")
+        return results
+
+    def sync_laws(
+        self,
+        laws: Optional[Dict[str, Dict]] = None,
+        until: Optional[date] = None,
+        requests_per_second: float = 1.0,
+        max_concurrency: int = 4,
+    ) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """
+        前回の同期以降に改正された法令だけをダウンロード（差分同期）
+
+        ダウンロードログの last_sync の日付から until までの各日について更新法令一覧（updatelawlists）を取得し、
+        対象法令のうち一覧に現れたものだけを取得する。取得した法令はログの syncs に記録され、
+        create-article-chunks のマニフェストによる差分チャンク化で再チャンク化される。
+        last_sync がない場合（初回）は全ての対象法令を取得する。
+        一覧の取得に失敗した日がある場合は last_sync を進めず、次回その日から再試行する。
+
+        Args:
+            laws: 法令キー → 法令情報（default: PHARMA_LAWS と探索済みの関連法令）
+            until: 同期する最終日（default: 今日）
+            requests_per_second: 秒間リクエスト数の上限
+            max_concurrency: 同時接続数の上限
+
+        Returns:
+            Dict[str, Tuple[bool, Optional[str]]]: 取得した各法令のダウンロード結果
+        """
+        laws = laws if laws is not None else self.get_target_laws()
+        until = until or date.today()
+        last_sync = self.download_log.get("last_sync")
+
+        if last_sync is None:
+            print("前回の同期記録がないため、全ての対象法令を取得します")
+            target_keys = list(laws.keys())
+            synced_until = until
+        else:
+            engine = AsyncLawDownloadEngine(
+                base_url=self.base_url,
+                requests_per_second=requests_per_second,
+                max_concurrency=max_concurrency,
+                timeout=self.timeout,
+            )
+            # 同日中の更新を取りこぼさないよう、前回の同期日も含めて問い合わせる
+            since = datetime.strptime(last_sync, "%Y%m%d").date()
+            dates = [(since + timedelta(days=i)).strftime("%Y%m%d") for i in range((until - since).days + 1)]
+            print(f"更新法令一覧を取得中: {last_sync} - {until.strftime('%Y%m%d')} ({len(dates)}日分)")
+            update_lists = asyncio.run(engine.fetch_update_lists(dates))
+            updated_law_ids = set()
+            synced_until = until
+            for update_list in update_lists:
+                if update_list.error is not None:
+                    print(f"✗ 更新法令一覧の取得エラー: {update_list.date}: {update_list.error}")
+                    synced_until = min(synced_until, datetime.strptime(update_list.date, "%Y%m%d").date())
+                    continue
+                assert update_list.law_ids is not None
+                updated_law_ids.update(update_list.law_ids)
+            target_keys = [law_key for law_key, law_info in laws.items() if law_info["law_id"] in updated_law_ids]
+
+        print(f"改正された対象法令数: {len(target_keys)}/{len(laws)}")
+        results = self.download_laws_async(
+            {law_key: laws[law_key] for law_key in target_keys},
+            requests_per_second=requests_per_second,
+            max_concurrency=max_concurrency,
+        )
+
+        # 再チャンク化の対象として、取得に成功した法令を記録する
+        synced_keys = [law_key for law_key in target_keys if results[law_key][0]]
+        self.download_log.setdefault("syncs", []).append({
+            "sync_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "since": last_sync,
+            "until": synced_until.strftime("%Y%m%d"),
+            "law_ids": [laws[law_key]["law_id"] for law_key in synced_keys],
+            "files": [self._get_law_file_path(laws[law_key]["law_id"], laws[law_key]).name for law_key in synced_keys],
+        })
+        if len(synced_keys) == len(target_keys):
+            self.download_log["last_sync"] = synced_until.strftime("%Y%m%d")
+        self._save_log()
+        return results
+
+    def get_target_laws(self) -> Dict[str, Dict]:
+        """
+        対象法令（PHARMA_LAWS と、discover_related_laws で見つかった関連法令）を返す
+
+        関連法令のキーは法令IDとする
+        """
+        laws = dict(self.PHARMA_LAWS)
+        if self.graph_file.exists():
+            seed_ids = {law_info["law_id"] for law_info in self.PHARMA_LAWS.values()}
+            for law_id, node in LawGraph.load(self.graph_file).nodes.items():
+                if law_id not in seed_ids:
+                    laws[law_id] = {key: value for key, value in node.items() if key != "depth"}
+        return laws
+
+    def discover_related_laws(
+        self,
+        max_depth: int = 2,
+        max_laws: int = 300,
+        requests_per_second: float = 1.0,
+        max_concurrency: int = 4,
+    ) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """
+        PHARMA_LAWS を起点に施行令・施行規則や参照先の法令を探索してダウンロード
+
+        見つかった法令と参照関係は law_graph.json に保存し、以降の差分同期（sync_laws）の対象にも含める
+
+        Args:
+            max_depth: 起点からの最大の深さ
+            max_laws: 法令数の上限（起点を含む）
+            requests_per_second: 秒間リクエスト数の上限
+            max_concurrency: 同時接続数の上限
+
+        Returns:
+            Dict[str, Tuple[bool, Optional[str]]]: 法令IDごとのダウンロード結果
+        """
+        print("=== 関連法令の探索開始 ===")
+        print(f"起点の法令数: {len(self.PHARMA_LAWS)} / 最大の深さ: {max_depth} / 法令数の上限: {max_laws}")
+        crawler = RelatedLawCrawler(
+            self,
+            max_depth=max_depth,
+            max_laws=max_laws,
+            requests_per_second=requests_per_second,
+            max_concurrency=max_concurrency,
+        )
+        graph, results = crawler.crawl(self.PHARMA_LAWS)
+        graph.save(self.graph_file)
+
+        print()
+        print("=== 関連法令の探索完了 ===")
+        success_count = sum(1 for success, _ in results.values() if success)
+        print(f"法令数: {len(graph.nodes)} / 参照関係: {len(graph.edges)} / 成功: {success_count}/{len(results)}")
+        return results
+
     def download_all_pharma_laws(self, delay: float = 1.0) -> Dict[str, Tuple[bool, Optional[str]]]:
         """
         全ての薬事関連法令をダウンロード
@@ -277,6 +548,20 @@ def main():
                        help="利用可能な法令リストを表示")
     parser.add_argument("--status", action="store_true",
                        help="ダウンロード状況を表示")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                       help="非同期エンジンで並行ダウンロード（変更のない法令はスキップ）")
+    parser.add_argument("--rate", type=float, default=1.0,
+                       help="非同期エンジンの秒間リクエスト数の上限 (default: 1.0)")
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                       help="非同期エンジンの同時接続数の上限 (default: 4)")
+    parser.add_argument("--discover", action="store_true",
+                       help="施行令・施行規則や参照先の法令を探索してダウンロード")
+    parser.add_argument("--max-depth", type=int, default=2,
+                       help="関連法令の探索の最大の深さ (default: 2)")
+    parser.add_argument("--max-laws", type=int, default=300,
+                       help="関連法令の探索で取得する法令数の上限 (default: 300)")
+    parser.add_argument("--sync", action="store_true",
+                       help="前回の同期以降に改正された法令のみダウンロード（e-Govの更新法令一覧を使う）")
     
     args = parser.parse_args()
     
@@ -316,6 +601,20 @@ def main():
             print(f"✓ {args.law} のダウンロードが完了しました")
         else:
             print(f"✗ {args.law} のダウンロードに失敗しました: {error}")
+    elif args.discover:
+        # 関連法令を探索してダウンロード
+        results = downloader.discover_related_laws(
+            max_depth=args.max_depth, max_laws=args.max_laws,
+            requests_per_second=args.rate, max_concurrency=args.max_concurrency
+        )
+    elif args.sync:
+        # 前回の同期以降に改正された法令のみダウンロード
+        results = downloader.sync_laws(requests_per_second=args.rate, max_concurrency=args.max_concurrency)
+    elif args.async_mode:
+        # 全ての薬事関連法令を非同期エンジンでダウンロード
+        results = downloader.download_all_pharma_laws_async(
+            requests_per_second=args.rate, max_concurrency=args.max_concurrency
+        )
     else:
         # 全ての薬事関連法令をダウンロード
         results = downloader.download_all_pharma_laws(delay=args.delay)
@@ -0,0 +1,180 @@
+"""
+法令XMLの入力元（ディレクトリ内のファイル、またはZIPアーカイブ内のメンバー）
+
+e-Govの一括ダウンロードのようなZIPアーカイブを展開せずに、メンバーを1つずつストリームで読み出す。
+"""
+
+import atexit
+import hashlib
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO
+
+ARCHIVE_SUFFIX = ".zip"
+MAX_OPEN_ARCHIVES = 8
+
+# 開いたままにするアーカイブ（最近使った順、上限を超えたものは閉じる）
+_open_archives: OrderedDict[str, zipfile.ZipFile] = OrderedDict()
+_open_archives_pid = os.getpid()
+_open_archives_lock = threading.Lock()
+
+
+def open_archive(path: Path | str) -> zipfile.ZipFile:
+    """
+    ZIPアーカイブを開く（プロセスごとに最近使った MAX_OPEN_ARCHIVES 件までを開いたままにして使い回す）
+    """
+    global _open_archives_pid
+    path = str(path)
+    with _open_archives_lock:
+        if _open_archives_pid != os.getpid():
+            # fork したワーカーが親のファイルオフセットを共有しないように、プロセスごとに開き直す
+            _close_all(_open_archives)
+            _open_archives_pid = os.getpid()
+        archive = _open_archives.get(path)
+        if archive is not None:
+            _open_archives.move_to_end(path)
+            return archive
+        archive = zipfile.ZipFile(path)
+        _open_archives[path] = archive
+        while len(_open_archives) > MAX_OPEN_ARCHIVES:
+            _, evicted = _open_archives.popitem(last=False)
+            evicted.close()
+        return archive
+
+
+def close_archives() -> None:
+    """開いたままにしているアーカイブをすべて閉じる"""
+    with _open_archives_lock:
+        _close_all(_open_archives)
+
+
+def _close_all(archives: OrderedDict[str, zipfile.ZipFile]) -> None:
+    while archives:
+        _, archive = archives.popitem()
+        archive.close()
+
+
+atexit.register(close_archives)
+
+
+@dataclass(frozen=True)
+class XmlSource:
+    """
+    法令XML1件分の入力元
+
+    Attributes:
+        key: 入力ルートからの相対パス（アーカイブ内のメンバーは "{アーカイブの相対パス}!{メンバー名}"）
+        path: XMLファイル、またはZIPアーカイブのパス
+        member: ZIPアーカイブ内のメンバー名（XMLファイルの場合はNone）
+        fingerprint: 変更検出用の値（ZIPメンバーはCRC32とサイズ、XMLファイルは読み出し時にSHA-256を計算する）
+    """
+
+    key: str
+    path: Path
+    member: str | None = None
+    fingerprint: str | None = None
+
+    @staticmethod
+    def from_file(path: Path, root: Path | None = None) -> "XmlSource":
+        path = Path(path)
+        key = path.relative_to(root).as_posix() if root is not None else path.name
+        return XmlSource(key=key, path=path)
+
+    @property
+    def name(self) -> str:
+        if self.member is None:
+            return self.path.name
+        return PurePosixPath(self.member).name
+
+    @property
+    def stem(self) -> str:
+        return PurePosixPath(self.name).stem
+
+    def open(self) -> BinaryIO:
+        if self.member is None:
+            return open(self.path, "rb")
+        return open_archive(self.path).open(self.member)  # type: ignore
+
+    def read_bytes(self) -> bytes:
+        with self.open() as fin:
+            return fin.read()
+
+    def compute_fingerprint(self, buffer_size: int = 1 << 20) -> str:
+        if self.fingerprint is not None:
+            return self.fingerprint
+        h = hashlib.sha256()
+        with self.open() as fin:
+            while True:
+                buf = fin.read(buffer_size)
+                if not buf:
+                    break
+                h.update(buf)
+        return h.hexdigest()
+
+    def __str__(self) -> str:
+        if self.member is None:
+            return str(self.path)
+        return f"{self.path}!{self.member}"
+
+
+def list_archive_sources(archive: Path, key_prefix: str | None = None) -> list[XmlSource]:
+    """
+    ZIPアーカイブ内のXMLメンバーを列挙する（中央ディレクトリを読むだけで展開はしない）
+    """
+    key_prefix = key_prefix if key_prefix is not None else archive.name
+    sources = []
+    for info in sorted(open_archive(archive).infolist(), key=lambda info: info.filename):
+        if info.is_dir() or not info.filename.lower().endswith(".xml"):
+            continue
+        sources.append(
+            XmlSource(
+                key=f"{key_prefix}!{info.filename}",
+                path=archive,
+                member=info.filename,
+                fingerprint=f"crc32:{info.CRC:08x}:{info.file_size}",
+            )
+        )
+    return sources
+
+
+def list_xml_sources(path: Path, recursive: bool = True) -> list[XmlSource]:
+    """
+    入力パス配下の法令XMLを列挙する
+
+    path がZIPアーカイブの場合はそのメンバーを、ディレクトリの場合は配下のXMLファイルと
+    ZIPアーカイブ（*.zip）のメンバーを、パス（とメンバー名）の順に返す。
+    """
+    path = Path(path)
+    if path.is_file():
+        if path.suffix.lower() == ARCHIVE_SUFFIX:
+            return list_archive_sources(path)
+        return [XmlSource.from_file(path, root=path.parent)]
+
+    pattern = "**/*" if recursive else "*"
+    sources = []
+    for file in sorted(path.glob(pattern)):
+        if not file.is_file():
+            continue
+        suffix = file.suffix.lower()
+        if suffix == ".xml":
+            sources.append(XmlSource.from_file(file, root=path))
+        elif suffix == ARCHIVE_SUFFIX:
+            sources.extend(list_archive_sources(file, key_prefix=file.relative_to(path).as_posix()))
+    return sources
+
+
+def find_stem_collisions(sources: list[XmlSource]) -> dict[str, list[XmlSource]]:
+    """
+    stem が同じ入力元を stem ごとにまとめて返す（衝突がなければ空）
+
+    別のアーカイブやディレクトリにある同名のXMLは、前処理の出力ファイル名（{stem}_processed.xml）や
+    チャンクの file_name が同じになり、区別できなくなる。
+    """
+    groups: dict[str, list[XmlSource]] = {}
+    for source in sources:
+        groups.setdefault(source.stem, []).append(source)
+    return {stem: group for stem, group in groups.items() if len(group) > 1}
@@ -0,0 +1,144 @@
+"""
+エンベディングAPIへの並行リクエスト
+
+バッチに分けたテキストを、同時に送るリクエスト数（in-flight）の上限つきで並行に送る。
+レート制限（HTTP 429）を受けた場合は、すべてのリクエストを待たせてから再送し、同時に送る数を半分に減らす。
+その後はリクエストが成功するたびに少しずつ元の上限まで戻す。
+"""
+
+import asyncio
+import random
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+
+from lawsy.encoder.batching import EmbeddingBatchPolicy, iter_batches
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """openai.RateLimitError や httpx.HTTPStatusError のような、ステータスコード 429 のエラーか"""
+    status_code = getattr(e, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(e, "response", None), "status_code", None)
+    return status_code == 429
+
+
+def get_retry_after(e: Exception) -> float | None:
+    """レスポンスの Retry-After ヘッダの秒数（ない場合は None）"""
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class AsyncEmbeddingStats:
+    num_requests: int = 0
+    num_rate_limited: int = 0
+    max_in_flight: int = 0
+
+
+class AsyncEmbeddingEngine:
+    def __init__(
+        self,
+        embed: Callable[[list[str]], Awaitable[npt.NDArray[np.float64]]],
+        batch_policy: EmbeddingBatchPolicy,
+        max_concurrency: int = 8,
+        max_retries: int = 8,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        """
+        Args:
+            embed: 1バッチのテキストのエンベディングを返すコルーチン関数
+            max_concurrency: 同時に送るリクエスト数の上限
+            max_retries: 1バッチあたりのレート制限による再送の上限（超えた場合はエラーを送出する）
+            initial_backoff: 1回目の再送までの待ち時間（秒、以降は2倍ずつ max_backoff まで増やす）
+        """
+        assert max_concurrency > 0 and max_retries >= 0
+        self.embed = embed
+        self.batch_policy = batch_policy
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.concurrency = max_concurrency
+        self.stats = AsyncEmbeddingStats()
+        self._in_flight = 0
+        self._resume_at = 0.0
+        self._num_succeeded = 0
+
+    async def get_embeddings(self, texts: list[str], token_counts: Sequence[int]) -> npt.NDArray[np.float64]:
+        """texts をバッチに分けて並行に計算し、入力と同じ順序のエンベディングを返す"""
+        assert len(texts) == len(token_counts)
+        self._condition = asyncio.Condition()
+        batches = list(iter_batches(token_counts, self.batch_policy))
+        if not batches:
+            return np.zeros((0, 0))
+        tasks = [asyncio.create_task(self._embed_batch(texts[start:end])) for start, end in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # 1つでも失敗した場合は残りのリクエストを取り消してから、最初のエラーを送出する
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return np.concatenate(results, axis=0)
+
+    async def _acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: self._in_flight < self.concurrency)
+                wait = self._resume_at - loop.time()
+                if wait <= 0:
+                    self._in_flight += 1
+                    self.stats.max_in_flight = max(self.stats.max_in_flight, self._in_flight)
+                    return
+            await asyncio.sleep(wait)
+
+    async def _release(self) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _backoff(self, e: Exception, attempt: int) -> None:
+        loop = asyncio.get_running_loop()
+        self.stats.num_rate_limited += 1
+        self.concurrency = max(1, self.concurrency // 2)
+        self._num_succeeded = 0
+        delay = get_retry_after(e)
+        if delay is None:
+            delay = min(self.max_backoff, self.initial_backoff * 2**attempt) * random.uniform(0.5, 1.0)
+        self._resume_at = max(self._resume_at, loop.time() + delay)
+
+    def _on_success(self) -> None:
+        # 上限を下げた後は、現在の上限と同じ数のリクエストが成功するごとに1ずつ戻す
+        self._num_succeeded += 1
+        if self.concurrency < self.max_concurrency and self._num_succeeded >= self.concurrency:
+            self.concurrency += 1
+            self._num_succeeded = 0
+
+    async def _embed_batch(self, texts: list[str]) -> npt.NDArray[np.float64]:
+        attempt = 0
+        while True:
+            await self._acquire()
+            try:
+                self.stats.num_requests += 1
+                result = await self.embed(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self._backoff(e, attempt)
+                attempt += 1
+            else:
+                self._on_success()
+                return result
+            finally:
+                await self._release()
@@ -0,0 +1,91 @@
+"""
+エンコーダに渡すテキストのバッチ分割
+
+エンベディングはテキストをまとめて渡すほどリクエストや推論の回数が減って速くなるが、
+プロバイダやモデルには1回に渡せる件数とトークン数の上限があるため、件数とトークン数の両方で区切る。
+"""
+
+from collections.abc import Callable, Iterator, Sequence
+from dataclasses import dataclass
+from typing import TypeVar
+
+import numpy as np
+import numpy.typing as npt
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class EmbeddingBatchPolicy:
+    """
+    1回のエンコーダ呼び出しに渡すテキストの上限
+
+    Attributes:
+        max_items: 1バッチの件数の上限
+        max_tokens: 1バッチのトークン数の上限
+        padded: True の場合、バッチのトークン数を「件数 × バッチ内の最長のトークン数」で数える
+            （パディングして推論するモデルで、計算量とメモリを抑えるための上限とする場合）
+        sort_by_length: True の場合、トークン数の順に並べ替えてからバッチに分ける
+            （長さの近いテキストが同じバッチに入るため、パディングに使う計算が減る）
+    """
+
+    max_items: int
+    max_tokens: int
+    padded: bool = False
+    sort_by_length: bool = False
+
+    def __post_init__(self) -> None:
+        assert self.max_items > 0 and self.max_tokens > 0
+
+
+def iter_batches(token_counts: Sequence[int], policy: EmbeddingBatchPolicy) -> Iterator[tuple[int, int]]:
+    """
+    各テキストのトークン数から、入力の順序を保ったバッチの範囲 (start, end) を返す
+
+    1件だけで max_tokens を超えるテキストは単独のバッチにする（切り詰めはエンコーダ側で行う）。
+    """
+    start = 0
+    total = 0
+    longest = 0
+    for i, num_tokens in enumerate(token_counts):
+        if i > start:
+            if policy.padded:
+                cost = (i - start + 1) * max(longest, num_tokens)
+            else:
+                cost = total + num_tokens
+            if i - start >= policy.max_items or cost > policy.max_tokens:
+                yield start, i
+                start = i
+                total = 0
+                longest = 0
+        total += num_tokens
+        longest = max(longest, num_tokens)
+    if start < len(token_counts):
+        yield start, len(token_counts)
+
+
+def embed_in_batches(
+    items: Sequence[T],
+    embed: Callable[[list[T]], npt.NDArray[np.float64]],
+    token_counts: Sequence[int],
+    policy: EmbeddingBatchPolicy,
+) -> npt.NDArray[np.float64]:
+    """
+    items（テキストやトークン化したもの）をバッチに分けて embed を呼び、入力と同じ順序のエンベディングを返す
+
+    policy.sort_by_length の場合はトークン数の順に並べ替えたバッチで計算し、結果を入力の順序に戻す。
+    """
+    assert len(items) == len(token_counts)
+    if policy.sort_by_length:
+        order = sorted(range(len(items)), key=lambda i: token_counts[i])
+        items = [items[i] for i in order]
+        token_counts = [token_counts[i] for i in order]
+    results = [embed(list(items[start:end])) for start, end in iter_batches(token_counts, policy)]
+    if not results:
+        return np.zeros((0, 0))
+    embeddings = np.concatenate(results, axis=0)
+    if policy.sort_by_length:
+        restored = np.empty_like(embeddings)
+        restored[order] = embeddings
+        return restored
+    return embeddings
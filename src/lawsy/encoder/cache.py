@@ -0,0 +1,219 @@
+"""
+エンベディングのディスクキャッシュ
+
+(モデル名, 指示文, テキスト) のハッシュをキーとしてエンベディングを SQLite に保存し、
+インデックスの作り直しや、同じクエリー・Webページのスニペットの再計算ではAPIの呼び出しや推論を省く。
+エンベディングは次元を切り詰める前のものを保存し、読み出した後に dim 次元に切り詰めるため、
+次元だけが異なる設定（text-embedding-3 の dim など）でも同じエントリーを使える。
+合計サイズが上限を超えた場合は、最後に使われた時刻が古いものから削除する。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+CACHE_FILE_NAME = "embeddings.sqlite3"
+DEFAULT_MAX_MB = 2048
+# 読み出しのたびに書き込みのトランザクションを開かないように、最後に使われた時刻はまとめて書き込む
+ACCESS_FLUSH_SECONDS = 60.0
+
+
+def make_cache_key(model_name: str, instruction: str, text: str) -> str:
+    data = "\0".join([model_name, instruction, text]).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    キー → エンベディング（float32）のキャッシュ
+
+    複数のスレッド（Streamlit のセッション）やプロセス（作成コマンドとアプリ）から同じファイルを共有できる。
+    読み出したエントリーの最後に使われた時刻はメモリに溜めておき、put_many、close、
+    または前回の書き込みから ACCESS_FLUSH_SECONDS 秒以上経った後の get_many でまとめて書き込む。
+    """
+
+    def __init__(self, path: Path | str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024) -> None:
+        assert max_bytes > 0
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending_access: dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, npt.NDArray[np.float32]]:
+        """キャッシュにあるキーのエンベディングを返す（返したものは最後に使われた時刻を更新する）"""
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # SQLite の変数の上限を超えないように分けて問い合わせる
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+            now = time.time()
+            for key in found:
+                self._pending_access[key] = now
+            if self._pending_access and time.monotonic() - self._last_flush >= ACCESS_FLUSH_SECONDS:
+                with self._transaction():
+                    self._flush_access()
+        self.hits += len(found)
+        self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, npt.NDArray]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            data = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, data, len(data), now))
+        with self._lock, self._transaction():
+            # 削除の対象を正しく選べるように、溜めておいた最後に使われた時刻を先に書き込む
+            self._flush_access()
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _flush_access(self) -> None:
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(last_access, key) for key, last_access in self._pending_access.items()],
+            )
+            self._pending_access.clear()
+        self._last_flush = time.monotonic()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 上限ぎりぎりで毎回削除しないように、上限の9割まで減らす
+        excess = total - int(self.max_bytes * 0.9)
+        keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_access"):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pending_access:
+                with self._transaction():
+                    self._flush_access()
+            self._conn.close()
+
+
+def open_embedding_cache(cache_dir: Path | str | None = None, max_mb: int | None = None) -> EmbeddingCache | None:
+    """
+    cache_dir（None の場合は環境変数 LAWSY_EMBEDDING_CACHE_DIR）のキャッシュを開く（どちらもない場合は None）
+
+    サイズの上限は max_mb、None の場合は環境変数 LAWSY_EMBEDDING_CACHE_MAX_MB（既定 2048MB）とする。
+    """
+    cache_dir = cache_dir or os.getenv("LAWSY_EMBEDDING_CACHE_DIR")
+    if not cache_dir:
+        return None
+    if max_mb is None:
+        max_mb = int(os.getenv("LAWSY_EMBEDDING_CACHE_MAX_MB", str(DEFAULT_MAX_MB)))
+    return EmbeddingCache(Path(cache_dir) / CACHE_FILE_NAME, max_bytes=max_mb * 1024 * 1024)
+
+
+def _split_cached(
+    cache: EmbeddingCache, texts: list[str], keys: list[str]
+) -> tuple[dict[str, npt.NDArray[np.float32]], list[str], list[str]]:
+    found = cache.get_many(keys)
+    missing = {key: text for key, text in zip(keys, texts) if key not in found}
+    return found, list(missing.keys()), list(missing.values())
+
+
+def _merge_cached(
+    cache: EmbeddingCache,
+    found: dict[str, npt.NDArray[np.float32]],
+    missing_keys: list[str],
+    embeddings: npt.NDArray,
+    keys: list[str],
+) -> npt.NDArray[np.float32]:
+    computed = {key: np.asarray(embedding, dtype=np.float32) for key, embedding in zip(missing_keys, embeddings)}
+    cache.put_many(computed)
+    found.update(computed)
+    return np.stack([found[key] for key in keys])
+
+
+def _truncate(embeddings: npt.NDArray, dim: int | None) -> npt.NDArray:
+    return embeddings if dim is None else embeddings[:, :dim]
+
+
+def embed_with_cache(
+    cache: EmbeddingCache | None,
+    texts: list[str],
+    keys: list[str],
+    embed: Callable[[list[str]], npt.NDArray],
+    dim: int | None = None,
+) -> npt.NDArray:
+    """
+    キャッシュにないテキスト（重複は1回）だけを embed で計算し、入力と同じ順序のエンベディングを返す
+
+    embed は次元を切り詰める前のエンベディングを返し、キャッシュにもそれを保存する。
+    dim を指定した場合は、返す前に先頭の dim 次元に切り詰める。
+    """
+    if cache is None or not texts:
+        return _truncate(embed(texts), dim)
+    found, missing_keys, missing_texts = _split_cached(cache, texts, keys)
+    embeddings = embed(missing_texts) if missing_texts else []
+    return _truncate(_merge_cached(cache, found, missing_keys, embeddings, keys), dim)
+
+
+async def aembed_with_cache(
+    cache: EmbeddingCache | None,
+    texts: list[str],
+    keys: list[str],
+    embed: Callable[[list[str]], Awaitable[npt.NDArray]],
+    dim: int | None = None,
+) -> npt.NDArray:
+    """embed_with_cache の非同期版"""
+    if cache is None or not texts:
+        return _truncate(await embed(texts), dim)
+    found, missing_keys, missing_texts = _split_cached(cache, texts, keys)
+    embeddings = await embed(missing_texts) if missing_texts else []
+    return _truncate(_merge_cached(cache, found, missing_keys, embeddings, keys), dim)
@@ -1,18 +1,47 @@
 import numpy as np
 import numpy.typing as npt
 
+from lawsy.encoder.batching import EmbeddingBatchPolicy, embed_in_batches
+from lawsy.encoder.cache import EmbeddingCache, embed_with_cache, make_cache_key
 from lawsy.utils.logging import logger
 
+MAX_LENGTH = 512
+
 
 class ME5Instruct:
+    # トークン数の順に並べて長さの近いテキストをまとめ、パディング込みのトークン数（件数 × 最長のトークン数）で
+    # 1回の推論の大きさを抑える（短いテキストは多く、長いテキストは少なくまとめる）
+    default_batch_policy = EmbeddingBatchPolicy(
+        max_items=128, max_tokens=32 * MAX_LENGTH, padded=True, sort_by_length=True
+    )
+
     def __init__(
         self,
         model_name: str = "intfloat/multilingual-e5-large-instruct",
         device: str | None = None,
+        batch_policy: EmbeddingBatchPolicy | None = None,
+        cache: EmbeddingCache | None = None,
+        num_threads: int | None = None,
+        num_interop_threads: int | None = None,
     ) -> None:
+        """
+        Args:
+            cache: エンベディングのキャッシュ（None の場合はキャッシュしない）
+            num_threads: CPUで推論する場合の演算内（intra-op）のスレッド数（None の場合は torch の既定値）
+            num_interop_threads: 演算間（inter-op）のスレッド数（None の場合は torch の既定値）
+        """
         import torch
         from transformers import AutoModel, AutoTokenizer
 
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        if num_interop_threads is not None:
+            try:
+                torch.set_num_interop_threads(num_interop_threads)
+            except RuntimeError as e:
+                # 並列の処理を一度でも実行した後は変更できない
+                logger.warning(f"cannot set the number of inter-op threads: {e}")
+        logger.info(f"threads: {torch.get_num_threads()} (intra-op), {torch.get_num_interop_threads()} (inter-op)")
         self.model_name = model_name
         if device is None:
             if torch.cuda.is_available():
@@ -23,6 +52,8 @@ class ME5Instruct:
                 device = "cpu"
         logger.info(f"device: {device}")
         self.device = device
+        self.batch_policy = batch_policy or self.default_batch_policy
+        self.cache = cache
         logger.info("loading tokenizer...")
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
         logger.info("loading model...")
@@ -40,15 +71,20 @@ class ME5Instruct:
         return f"Instruct: {task_description}\nQuery: {query}"
 
     def _get_embeddings(self, texts: list[str]) -> npt.NDArray[np.float64]:
+        if not texts:
+            return np.zeros((0, self.get_dimension()))
+        # トークン化は1回だけ行い、バッチごとにパディングする
+        input_ids = self.tokenizer(texts, max_length=MAX_LENGTH, truncation=True)["input_ids"]
+        return embed_in_batches(input_ids, self._forward, [len(ids) for ids in input_ids], self.batch_policy)
+
+    def _forward(self, input_ids: list[list[int]]) -> npt.NDArray[np.float64]:
         import torch
 
         def average_pool(last_hidden_states: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
             last_hidden = last_hidden_states.masked_fill(~attention_mask[..., None].bool(), 0.0)
             return last_hidden.sum(dim=1) / attention_mask.sum(dim=1)[..., None]
 
-        batch_dict = self.tokenizer(texts, max_length=512, padding=True, truncation=True, return_tensors="pt").to(
-            self.device
-        )
+        batch_dict = self.tokenizer.pad({"input_ids": input_ids}, padding=True, return_tensors="pt").to(self.device)
         with torch.inference_mode():
             outputs = self.model(**batch_dict)
             embeddings = average_pool(outputs.last_hidden_state, batch_dict["attention_mask"])  # type: ignore
@@ -56,11 +92,18 @@ class ME5Instruct:
             embeddings = embeddings.cpu()
         return embeddings.numpy()
 
+    def _get_cache_keys(self, texts: list[str], instruction: str) -> list[str]:
+        return [make_cache_key(self.get_name(), instruction, text) for text in texts]
+
     def get_query_embeddings(
         self, queries: list[str], task_description: str = "Given a query, return the relevant law documents."
     ) -> npt.NDArray[np.float64]:
-        queries = [self.get_detailed_instruct(task_description, query) for query in queries]
-        return self._get_embeddings(queries)
+        return embed_with_cache(
+            self.cache,
+            queries,
+            self._get_cache_keys(queries, task_description),
+            lambda texts: self._get_embeddings([self.get_detailed_instruct(task_description, text) for text in texts]),
+        )
 
     def get_document_embeddings(self, documents: list[str]) -> npt.NDArray[np.float64]:
-        return self._get_embeddings(documents)
+        return embed_with_cache(self.cache, documents, self._get_cache_keys(documents, ""), self._get_embeddings)
@@ -0,0 +1,222 @@
+"""
+multilingual-e5 の ONNX Runtime 版（CPU向け）
+
+ME5Instruct と同じモデルを、平均プーリングまで含めた ONNX に書き出し、重みを int8 に動的量子化して使う。
+推論には onnxruntime と tokenizers だけを使うため、torch と transformers を読み込まずに済み、
+アプリのプロセスあたりのメモリとクエリーのエンベディングの待ち時間が小さくなる。
+書き出し（export_me5_onnx）には torch, transformers, onnx が必要になる。
+
+multilingual-e5-large の float32 の重みは protobuf の上限（2GB）を超えるため、
+重みはモデルと同じディレクトリの外部データ（<モデルのファイル名>.data）に保存する。
+モデルを別の場所に移す場合は、.onnx と .data のファイルを一緒に移すこと。
+
+量子化したモデルのエンベディングは元のモデルとコサイン類似度がほぼ1になるため、
+元のモデルで作成したインデックスの検索にもそのまま使える。
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+from lawsy.encoder.batching import EmbeddingBatchPolicy, embed_in_batches
+from lawsy.encoder.cache import EmbeddingCache, embed_with_cache, make_cache_key
+from lawsy.encoder.me5 import MAX_LENGTH, ME5Instruct
+from lawsy.utils.logging import logger
+
+MODEL_FILE_NAME = "model.onnx"
+QUANTIZED_MODEL_FILE_NAME = "model_int8.onnx"
+TOKENIZER_FILE_NAME = "tokenizer.json"
+CONFIG_FILE_NAME = "lawsy_onnx.json"
+EXTERNAL_DATA_SUFFIX = ".data"
+
+
+def export_me5_onnx(
+    output_dir: Path,
+    model_name: str = "intfloat/multilingual-e5-large-instruct",
+    quantize: bool = True,
+    opset_version: int = 17,
+) -> Path:
+    """
+    モデルを平均プーリングまで含めた ONNX（入力 input_ids, attention_mask、出力 embedding）として書き出す
+
+    重みは外部データ（model.onnx.data）として保存する（protobuf の2GBの上限を超えるため）。
+    quantize=True の場合は、重みを int8 に動的量子化したモデルも書き出す。
+    モデルのほかに、推論に使う tokenizer.json と設定（次元・パディングのトークンID）を保存する。
+
+    Returns:
+        Path: 推論に使うモデルのファイル（quantize=True の場合は量子化したモデル）
+    """
+    import onnx
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    class AveragePooledModel(torch.nn.Module):
+        def __init__(self, model) -> None:
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+            last_hidden = self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+            last_hidden = last_hidden.masked_fill(~attention_mask[..., None].bool(), 0.0)
+            return last_hidden.sum(dim=1) / attention_mask.sum(dim=1)[..., None]
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    dummy = tokenizer(["query: 薬機法", "passage: 第一条 この法律は"], padding=True, return_tensors="pt")
+    model_file = output_dir / MODEL_FILE_NAME
+    logger.info(f"exporting {model_name} to {model_file}...")
+    # 2GBを超えるモデルは torch が重みをテンソルごとのファイルに分けて書き出すため、
+    # 一時ディレクトリに書き出してから、重みを1つの外部データのファイルにまとめて保存し直す
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        tmp_model_file = Path(tmp_dir) / MODEL_FILE_NAME
+        with torch.inference_mode():
+            torch.onnx.export(
+                AveragePooledModel(model),
+                (dummy["input_ids"], dummy["attention_mask"]),
+                str(tmp_model_file),
+                input_names=["input_ids", "attention_mask"],
+                output_names=["embedding"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "embedding": {0: "batch"},
+                },
+                opset_version=opset_version,
+            )
+        save_onnx_model_with_external_data(onnx.load(str(tmp_model_file)), model_file)
+    tokenizer.save_pretrained(output_dir)
+    config = {"model_name": model_name, "dim": model.config.hidden_size, "pad_token_id": tokenizer.pad_token_id}
+    with open(output_dir / CONFIG_FILE_NAME, "w") as fout:
+        json.dump(config, fout, indent=2)
+    if not quantize:
+        return model_file
+    return quantize_onnx_model(model_file, output_dir / QUANTIZED_MODEL_FILE_NAME)
+
+
+def save_onnx_model_with_external_data(model, model_file: Path) -> Path:
+    """重みを1つの外部データのファイル（<モデルのファイル名>.data）にまとめてモデルを保存する"""
+    import onnx
+
+    data_file = model_file.with_name(model_file.name + EXTERNAL_DATA_SUFFIX)
+    # 外部データは追記で書かれるため、前回の書き出しの残りを消しておく
+    data_file.unlink(missing_ok=True)
+    onnx.save_model(
+        model,
+        str(model_file),
+        save_as_external_data=True,
+        all_tensors_to_one_file=True,
+        location=data_file.name,
+    )
+    return model_file
+
+
+def quantize_onnx_model(model_file: Path, quantized_model_file: Path) -> Path:
+    """
+    重み（MatMul など）を int8 に動的量子化する（活性化は推論時に量子化する）
+
+    入力のモデルの外部データは同じディレクトリから読み込み、量子化したモデルの重みも外部データとして保存する。
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info(f"quantizing {model_file} to {quantized_model_file}...")
+    quantized_model_file.with_name(quantized_model_file.name + EXTERNAL_DATA_SUFFIX).unlink(missing_ok=True)
+    quantize_dynamic(
+        str(model_file), str(quantized_model_file), weight_type=QuantType.QInt8, use_external_data_format=True
+    )
+    return quantized_model_file
+
+
+class ME5InstructOnnx:
+    default_batch_policy = ME5Instruct.default_batch_policy
+
+    def __init__(
+        self,
+        model_dir: Path | str,
+        quantized: bool = True,
+        batch_policy: EmbeddingBatchPolicy | None = None,
+        cache: EmbeddingCache | None = None,
+        num_threads: int | None = None,
+        num_interop_threads: int | None = None,
+    ) -> None:
+        """
+        Args:
+            model_dir: export_me5_onnx で書き出したディレクトリ
+            quantized: int8 に量子化したモデルを使う場合は True
+            cache: エンベディングのキャッシュ（None の場合はキャッシュしない）
+            num_threads: 演算内（intra-op）のスレッド数（None の場合は onnxruntime の既定値）
+            num_interop_threads: 演算間（inter-op）のスレッド数（None の場合は onnxruntime の既定値）
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        with open(model_dir / CONFIG_FILE_NAME) as fin:
+            config = json.load(fin)
+        self.model_name = config["model_name"]
+        self.dim = config["dim"]
+        self.pad_token_id = config["pad_token_id"]
+        self.quantized = quantized
+        self.batch_policy = batch_policy or self.default_batch_policy
+        self.cache = cache
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE_NAME))
+        self.tokenizer.enable_truncation(MAX_LENGTH)
+        self.tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        if num_interop_threads is not None:
+            options.inter_op_num_threads = num_interop_threads
+        model_file = model_dir / (QUANTIZED_MODEL_FILE_NAME if quantized else MODEL_FILE_NAME)
+        logger.info(f"loading {model_file}...")
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        logger.info("ME5InstructOnnx is prepared")
+
+    def get_dimension(self) -> int:
+        return self.dim
+
+    def get_name(self) -> str:
+        return f"E5InstructONNX{'-int8' if self.quantized else ''}-{self.model_name}"
+
+    def get_detailed_instruct(self, task_description: str, query: str) -> str:
+        return f"Instruct: {task_description}\nQuery: {query}"
+
+    def _get_embeddings(self, texts: list[str]) -> npt.NDArray[np.float32]:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        input_ids = [encoding.ids for encoding in self.tokenizer.encode_batch(texts)]
+        return embed_in_batches(input_ids, self._forward, [len(ids) for ids in input_ids], self.batch_policy)
+
+    def _forward(self, input_ids: list[list[int]]) -> npt.NDArray[np.float32]:
+        length = max(len(ids) for ids in input_ids)
+        batch_input_ids = np.full((len(input_ids), length), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(input_ids), length), dtype=np.int64)
+        for i, ids in enumerate(input_ids):
+            batch_input_ids[i, : len(ids)] = ids
+            attention_mask[i, : len(ids)] = 1
+        (embeddings,) = self.session.run(
+            ["embedding"], {"input_ids": batch_input_ids, "attention_mask": attention_mask}
+        )
+        return embeddings
+
+    def _get_cache_keys(self, texts: list[str], instruction: str) -> list[str]:
+        return [make_cache_key(self.get_name(), instruction, text) for text in texts]
+
+    def get_query_embeddings(
+        self, queries: list[str], task_description: str = "Given a query, return the relevant law documents."
+    ) -> npt.NDArray[np.float32]:
+        return embed_with_cache(
+            self.cache,
+            queries,
+            self._get_cache_keys(queries, task_description),
+            lambda texts: self._get_embeddings([self.get_detailed_instruct(task_description, text) for text in texts]),
+        )
+
+    def get_document_embeddings(self, documents: list[str]) -> npt.NDArray[np.float32]:
+        return embed_with_cache(self.cache, documents, self._get_cache_keys(documents, ""), self._get_embeddings)
@@ -1,13 +1,41 @@
 import numpy as np
 import numpy.typing as npt
 
+from lawsy.encoder.async_engine import AsyncEmbeddingEngine
+from lawsy.encoder.batching import EmbeddingBatchPolicy, embed_in_batches
+from lawsy.encoder.cache import EmbeddingCache, aembed_with_cache, embed_with_cache, make_cache_key
+from lawsy.utils.logging import logger
+
+
+def _create_token_counter():
+    """
+    text-embedding-3 のトークン数を数える関数
+
+    tiktoken がない場合は UTF-8 のバイト数で数える（BPEのトークンは1バイト以上なので、実際のトークン数の上限になる）。
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return lambda text: len(text.encode("utf-8"))
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
 
 class OpenAITextEmbedding:
+    # embeddings API の1リクエストの上限は 2048 件・合計 300,000 トークン
+    default_batch_policy = EmbeddingBatchPolicy(max_items=2048, max_tokens=300_000)
+
     def __init__(
         self,
         model_name: str = "text-embedding-3-small",
         dim: int | None = None,
+        batch_policy: EmbeddingBatchPolicy | None = None,
+        cache: EmbeddingCache | None = None,
     ) -> None:
+        """
+        Args:
+            cache: エンベディングのキャッシュ（None の場合はキャッシュしない）
+        """
         from openai import OpenAI
 
         assert model_name in ("text-embedding-3-large", "text-embedding-3-small")
@@ -21,6 +49,9 @@ class OpenAITextEmbedding:
                 dim = 1536
         assert dim is not None
         self.dim = dim
+        self.batch_policy = batch_policy or self.default_batch_policy
+        self.count_tokens = _create_token_counter()
+        self.cache = cache
         self.client = OpenAI()
 
     def get_dimension(self) -> int:
@@ -32,17 +63,73 @@ class OpenAITextEmbedding:
     def get_detailed_instruct(self, task_description: str, query: str) -> str:
         return f"Instruct: {task_description}\nQuery: {query}"
 
-    def _get_embeddings(self, texts: list[str]) -> npt.NDArray[np.float64]:
-        texts = [text.replace("\n", " ")[:6000] for text in texts]
+    def _request_embeddings(self, texts: list[str]) -> npt.NDArray[np.float64]:
         response = self.client.embeddings.create(input=texts, model=self.model_name)
-        result = np.asarray([d.embedding for d in response.data])
-        return result[:, : self.dim]
+        return np.asarray([d.embedding for d in response.data])
+
+    def _prepare_texts(self, texts: list[str]) -> tuple[list[str], list[int]]:
+        texts = [text.replace("\n", " ")[:6000] for text in texts]
+        return texts, [self.count_tokens(text) for text in texts]
+
+    def _get_embeddings(self, texts: list[str]) -> npt.NDArray[np.float64]:
+        # 次元は切り詰めずに返す（キャッシュには切り詰める前のものを保存し、embed_with_cache で切り詰める）
+        if not texts:
+            return np.zeros((0, self.dim))
+        texts, token_counts = self._prepare_texts(texts)
+        return embed_in_batches(texts, self._request_embeddings, token_counts, self.batch_policy)
+
+    def _get_cache_keys(self, texts: list[str], instruction: str) -> list[str]:
+        return [make_cache_key(self.get_name(), instruction, text) for text in texts]
 
     def get_query_embeddings(
         self, queries: list[str], task_description: str = "Retrieve passages that answer the following query"
     ) -> npt.NDArray[np.float64]:
-        queries = [self.get_detailed_instruct(task_description, query) for query in queries]
-        return self._get_embeddings(queries)
+        return embed_with_cache(
+            self.cache,
+            queries,
+            self._get_cache_keys(queries, task_description),
+            lambda texts: self._get_embeddings([self.get_detailed_instruct(task_description, text) for text in texts]),
+            dim=self.dim,
+        )
 
     def get_document_embeddings(self, documents: list[str]) -> npt.NDArray[np.float64]:
-        return self._get_embeddings(documents)
+        return embed_with_cache(
+            self.cache, documents, self._get_cache_keys(documents, ""), self._get_embeddings, dim=self.dim
+        )
+
+    async def aget_document_embeddings(
+        self, documents: list[str], max_concurrency: int = 8
+    ) -> npt.NDArray[np.float64]:
+        """
+        get_document_embeddings の非同期版（バッチを最大 max_concurrency 件まで並行にリクエストする）
+
+        レート制限を受けた場合の再送は AsyncEmbeddingEngine が行うため、クライアント自体の再送は無効にする。
+        """
+        return await aembed_with_cache(
+            self.cache,
+            documents,
+            self._get_cache_keys(documents, ""),
+            lambda texts: self._aget_embeddings(texts, max_concurrency),
+            dim=self.dim,
+        )
+
+    async def _aget_embeddings(self, texts: list[str], max_concurrency: int) -> npt.NDArray[np.float64]:
+        from openai import AsyncOpenAI
+
+        if not texts:
+            return np.zeros((0, self.dim))
+        texts, token_counts = self._prepare_texts(texts)
+        async with AsyncOpenAI(max_retries=0) as client:
+
+            async def request_embeddings(batch: list[str]) -> npt.NDArray[np.float64]:
+                response = await client.embeddings.create(input=batch, model=self.model_name)
+                return np.asarray([d.embedding for d in response.data])
+
+            engine = AsyncEmbeddingEngine(request_embeddings, self.batch_policy, max_concurrency=max_concurrency)
+            embeddings = await engine.get_embeddings(texts, token_counts)
+        if engine.stats.num_rate_limited > 0:
+            logger.info(
+                f"rate limited {engine.stats.num_rate_limited} times in {engine.stats.num_requests} requests "
+                f"(concurrency: {engine.concurrency}/{max_concurrency})"
+            )
+        return embeddings
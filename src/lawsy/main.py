@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 import dotenv
@@ -7,46 +8,446 @@ dotenv.load_dotenv()
 app = typer.Typer()
 
 
+def create_text_encoder(
+    model_name: str,
+    max_batch_items: int | None = None,
+    max_batch_tokens: int | None = None,
+    embedding_cache_dir: Path | None = None,
+    num_threads: int | None = None,
+    num_interop_threads: int | None = None,
+):
+    """
+    "openai/text-embedding-3-small" や "multilingual-e5-large-instruct" のようなモデル名からエンコーダを作成する
+
+    "onnx/<ディレクトリ>" の場合は、export-onnx-encoder で書き出した int8 量子化の ONNX モデルを使う。
+    max_batch_items, max_batch_tokens を指定した場合は、エンコーダの既定のバッチの上限をその値で置き換える。
+    embedding_cache_dir を指定した場合は、計算したエンベディングをキャッシュし、同じテキストは計算し直さない。
+    num_threads, num_interop_threads はローカルのモデル（multilingual-e5）をCPUで推論する場合のスレッド数。
+    """
+    from dataclasses import replace
+
+    from lawsy.encoder.cache import open_embedding_cache
+
+    provider = model_name.split("/")[0]
+    if provider == "openai":
+        from lawsy.encoder.openai import OpenAITextEmbedding as encoder_cls
+    elif provider == "onnx":
+        from lawsy.encoder.me5_onnx import ME5InstructOnnx as encoder_cls
+    else:
+        from lawsy.encoder.me5 import ME5Instruct as encoder_cls
+
+        assert model_name == "multilingual-e5-large-instruct"
+    batch_policy = encoder_cls.default_batch_policy
+    if max_batch_items is not None:
+        batch_policy = replace(batch_policy, max_items=max_batch_items)
+    if max_batch_tokens is not None:
+        batch_policy = replace(batch_policy, max_tokens=max_batch_tokens)
+    cache = open_embedding_cache(embedding_cache_dir) if embedding_cache_dir is not None else None
+    if provider == "openai":
+        # OpenAIクラスはプレフィックスなしのモデル名を期待
+        actual_model_name = model_name.split("/")[1]
+        return encoder_cls(actual_model_name, batch_policy=batch_policy, cache=cache)
+    elif provider == "onnx":
+        return encoder_cls(
+            model_name.split("/", 1)[1],
+            batch_policy=batch_policy,
+            cache=cache,
+            num_threads=num_threads,
+            num_interop_threads=num_interop_threads,
+        )
+    else:
+        return encoder_cls(
+            batch_policy=batch_policy,
+            cache=cache,
+            num_threads=num_threads,
+            num_interop_threads=num_interop_threads,
+        )
+
+
+@app.command()
+def create_article_chunks(
+    xml_path: Path,
+    output_jsonl_file: Path,
+    workers: int = 1,
+    incremental: bool = True,
+    strategy: str = "article",
+    max_tokens: int = 512,
+    extractor: str = "model",
+    law_cache_dir: Path | None = None,
+) -> None:
+    """
+    法令XMLをチャンク化する
+
+    xml_path にはXMLファイルのディレクトリ（配下のZIPアーカイブも含む）、またはZIPアーカイブを指定できる。
+    ZIPアーカイブのメンバーは展開せずに直接読み出し、CRC32とサイズで変更を検出する。
+    strategy="sub-article" の場合、max_tokens（文字数）を超える長い条は項・号単位のチャンクに分割する。
+    extractor="lxml" の場合、ja_law_parser のモデルを構築せずに lxml で直接チャンク化する（出力は同一）。
+    law_cache_dir を指定した場合、パース済みの法令をキャッシュし、XMLが変わっていなければパースを省略する
+    （indent や strategy を変えてチャンク化し直す場合に速くなる）。
+    出力の隣には、法令の構造（章・節・条・項）の索引（article_chunks.structure.json）も作成する。
+    """
+    import json
+
+    from tqdm import tqdm
+
+    from lawsy.chunker.corpus import map_chunk_xml_files
+    from lawsy.chunker.manifest import (
+        create_chunk_manifest,
+        get_chunk_manifest_path,
+        load_chunk_manifest,
+        save_chunk_manifest,
+    )
+    from lawsy.chunker.structure import StructureIndex, get_structure_index_path
+    from lawsy.data.xml_source import list_xml_sources
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    assert workers > 0
+    chunker_options = {"indent": 2, "strategy": strategy, "max_tokens": max_tokens}
+    output_jsonl_file.parent.mkdir(parents=True, exist_ok=True)
+    manifest_file = get_chunk_manifest_path(output_jsonl_file)
+    structure_file = get_structure_index_path(output_jsonl_file)
+    old_manifest = load_chunk_manifest(manifest_file, output_jsonl_file, chunker_options) if incremental else None
+    old_entries = old_manifest["files"] if old_manifest is not None else {}
+
+    # 並列実行時も出力順が変わらないようにファイル順を固定する
+    xml_files = list_xml_sources(xml_path)
+    keys = [xml_file.key for xml_file in xml_files]
+    fingerprints = [xml_file.compute_fingerprint() for xml_file in xml_files]
+    changed_files = [
+        xml_file
+        for xml_file, key, fingerprint in zip(xml_files, keys, fingerprints)
+        if key not in old_entries or old_entries[key].get("fingerprint") != fingerprint
+    ]
+    removed_keys = set(old_entries.keys()) - set(keys)
+    if old_manifest is not None and not changed_files and not removed_keys:
+        logger.info(f"No changes in {len(xml_files)} files. {output_jsonl_file} is up to date.")
+        if not structure_file.exists():
+            StructureIndex.build_from_jsonl(output_jsonl_file).save(structure_file)
+        return
+
+    manifest = create_chunk_manifest(chunker_options)
+    count = 0
+    total_length = 0
+    tmp_file = output_jsonl_file.with_suffix(output_jsonl_file.suffix + ".tmp")
+    changed_records = map_chunk_xml_files(
+        changed_files,
+        chunker_options=chunker_options,
+        workers=workers,
+        extractor=extractor,
+        law_cache_dir=law_cache_dir,
+    )
+    with open(tmp_file, "wb") as fout, open(output_jsonl_file if old_entries else os.devnull, "rb") as fin:
+        for xml_file, key, fingerprint in tqdm(zip(xml_files, keys, fingerprints), total=len(xml_files)):
+            offset = fout.tell()
+            old_entry = old_entries.get(key)
+            if old_entry is not None and old_entry.get("fingerprint") == fingerprint:
+                # 変更のないファイルは既存のJSONLから該当範囲をそのままコピーする
+                fin.seek(old_entry["offset"])
+                fout.write(fin.read(old_entry["size"]))
+                num_chunks = old_entry["num_chunks"]
+                num_chars = old_entry["num_chars"]
+            else:
+                records = next(changed_records)
+                for record in records:
+                    fout.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                num_chunks = len(records)
+                num_chars = sum(len(record["chunk"]) for record in records)
+            manifest["files"][key] = {
+                "fingerprint": fingerprint,
+                "file_name": xml_file.stem,
+                "offset": offset,
+                "size": fout.tell() - offset,
+                "num_chunks": num_chunks,
+                "num_chars": num_chars,
+            }
+            count += num_chunks
+            total_length += num_chars
+    tmp_file.replace(output_jsonl_file)
+    save_chunk_manifest(manifest_file, manifest, output_jsonl_file)
+    structure = StructureIndex.build_from_jsonl(output_jsonl_file)
+    structure.save(structure_file)
+    logger.info(f"Saved structure index of {len(structure.laws)} laws to {structure_file}.")
+    logger.info(
+        f"Re-chunked {len(changed_files)} files, reused {len(xml_files) - len(changed_files)} files, "
+        f"removed {len(removed_keys)} files."
+    )
+    avg_length = total_length / count if count > 0 else 0
+    logger.info(f"Created {count} chunks (avg length: {avg_length}).")
+
+
 @app.command()
-def create_article_chunks(xml_dir: Path, output_jsonl_file: Path) -> None:
+def create_article_chunks_from_api(
+    output_jsonl_file: Path,
+    raw_archive_dir: Path | None = None,
+    workers: int = 1,
+    requests_per_second: float = 1.0,
+    max_concurrency: int = 4,
+    base_url: str = "https://laws.e-gov.go.jp/api/1",
+    strategy: str = "article",
+    max_tokens: int = 512,
+) -> None:
+    """
+    薬事関連法令をe-Gov APIから取得し、中間XMLファイルを介さずにチャンク化する
+
+    APIレスポンス → Lawモデル → ArticleChunker をメモリ上で1パスで処理する。
+    raw_archive_dir を指定した場合のみ、監査用にAPIレスポンスをそのまま保存する。
+    出力の隣には、法令の構造（章・節・条・項）の索引（article_chunks.structure.json）も作成する。
+    """
+    import asyncio
     import json
+    from collections import deque
+    from collections.abc import Iterator
 
     from tqdm import tqdm
 
-    from lawsy.chunker.article_chunker import ArticleChunker
-    from lawsy.parser.parser import parse_from_xml_file
+    from lawsy.chunker.corpus import map_chunk_api_responses
+    from lawsy.chunker.manifest import remove_chunk_manifest
+    from lawsy.chunker.structure import StructureIndex, get_structure_index_path
+    from lawsy.data.law_download_engine import AsyncLawDownloadEngine
+    from lawsy.data.pharma_law_downloader import PharmaLawDownloader
     from lawsy.utils.logging import get_logger
 
     logger = get_logger()
 
-    chunker = ArticleChunker(indent=2)
+    laws = list(PharmaLawDownloader.PHARMA_LAWS.values())
+    engine = AsyncLawDownloadEngine(
+        base_url=base_url, requests_per_second=requests_per_second, max_concurrency=max_concurrency
+    )
+    fetch_results = deque(zip(laws, asyncio.run(engine.fetch_laws([(law_info["law_id"], None) for law_info in laws]))))
+    num_fetched = 0
+
+    def iter_responses() -> Iterator[tuple[str, bytes]]:
+        # ワーカーに渡したレスポンスは手元に残さず、チャンク化が済んだものから解放する
+        nonlocal num_fetched
+        while fetch_results:
+            law_info, fetch_result = fetch_results.popleft()
+            if fetch_result.status != "updated":
+                logger.warning(f"cannot fetch {law_info['short_name']} ({law_info['law_id']}): {fetch_result.error}")
+                continue
+            assert fetch_result.content is not None
+            # 前処理済みXMLから作ったチャンクとキーが一致するようにファイル名を揃える
+            stem = f"{law_info['short_name']}_{law_info['law_id']}".replace("/", "_").replace("\\", "_")
+            if raw_archive_dir is not None:
+                raw_archive_dir.mkdir(parents=True, exist_ok=True)
+                (raw_archive_dir / f"{stem}.xml").write_bytes(fetch_result.content)
+            num_fetched += 1
+            yield stem + "_processed", fetch_result.content
+
     output_jsonl_file.parent.mkdir(parents=True, exist_ok=True)
+    chunker_options = {"indent": 2, "strategy": strategy, "max_tokens": max_tokens}
     count = 0
     total_length = 0
+    structure = StructureIndex()
     with open(output_jsonl_file, "w") as fout:
-        xml_files = list(xml_dir.glob("**/*.xml"))
-        for xml_file in tqdm(xml_files):
-            law = parse_from_xml_file(xml_file)
-            law_title = law.law_body.law_title.text  # type: ignore
-            for chunk in chunker(law):
-                article = chunk["article_path"][-1]
-                if chunk["anchor"].find("Sp-") >= 0:
-                    article_title = law_title + " 附則 " + article.article_title.text  # type: ignore
-                else:
-                    article_title = law_title + " " + article.article_title.text  # type: ignore
-                print(
-                    json.dumps(
-                        dict(
-                            file_name=xml_file.stem, anchor=chunk["anchor"], title=article_title, chunk=chunk["chunk"]
-                        ),
-                        ensure_ascii=False,
-                    ),
-                    file=fout,
-                )
+        for records in tqdm(
+            map_chunk_api_responses(iter_responses(), chunker_options=chunker_options, workers=workers),
+            total=len(laws),
+        ):
+            for record in records:
+                print(json.dumps(record, ensure_ascii=False), file=fout)
+                structure.add(record["file_name"], record["anchor"], record["chunk"])
                 count += 1
-                total_length += len(chunk["chunk"])
+                total_length += len(record["chunk"])
+    # create-article-chunks のマニフェストは別の入力から書いた JSONL を指しているため削除する
+    remove_chunk_manifest(output_jsonl_file)
+    structure.save(get_structure_index_path(output_jsonl_file))
     avg_length = total_length / count if count > 0 else 0
-    logger.info(f"Created {count} chunks (avg length: {avg_length}).")
+    logger.info(f"Created {count} chunks from {num_fetched}/{len(laws)} laws (avg length: {avg_length}).")
+
+
+@app.command()
+def bench_article_extractors(xml_dir: Path, repeat: int = 3, indent: int = 2) -> None:
+    """
+    法令XMLのチャンク化について、ja_law_parser のモデル経由と lxml の直接走査の処理時間を比較する
+    """
+    import time
+
+    from lawsy.chunker.corpus import XML_EXTRACTORS, chunk_xml_file
+    from lawsy.data.xml_source import list_xml_sources
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    assert repeat > 0
+    xml_files = list_xml_sources(xml_dir)
+    chunker_options = {"indent": indent, "strategy": "article"}
+    outputs = {}
+    elapsed = {}
+    for extractor in XML_EXTRACTORS:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[extractor] = [
+                chunk_xml_file(xml_file, chunker_options, extractor=extractor) for xml_file in xml_files
+            ]
+            best = min(best, time.perf_counter() - start)
+        elapsed[extractor] = best
+        num_chunks = sum(len(records) for records in outputs[extractor])
+        logger.info(
+            f"{extractor}: {best:.3f} sec for {len(xml_files)} files / {num_chunks} chunks "
+            f"({len(xml_files) / best:.1f} files/sec)"
+        )
+    if outputs["lxml"] != outputs["model"]:
+        logger.warning("outputs of the extractors differ")
+    logger.info(f"speedup (model / lxml): {elapsed['model'] / elapsed['lxml']:.1f}x")
+
+
+@app.command()
+def bench_ingest(
+    xml_path: Path,
+    output_json_file: Path,
+    repeat: int = 3,
+    scale: int = 1,
+    strategy: str = "article",
+    max_tokens: int = 512,
+    model_name: str | None = None,
+    dim: int = 256,
+    embed_sample: int = 256,
+    max_batch_items: int | None = None,
+    max_batch_tokens: int | None = None,
+    num_threads: int | None = None,
+    num_interop_threads: int | None = None,
+) -> None:
+    """
+    取り込みの段階（読み出し・パース・パスの列挙・描画・直列化・エンベディング・インデックス作成）ごとに
+    処理時間・スループット・メモリの最大確保量を計測し、JSONのレポートを出力する
+
+    scale > 1 の場合は入力XMLを複製した合成コーパスで計測する。
+    model_name を指定しない場合はエンベディングを計測せず、dim 次元の乱数ベクトルでインデックスを作成する。
+    エンベディングは repeat, scale によらず、重複を除いたチャンクの先頭 embed_sample 件について
+    キャッシュを使わずに1回だけ計測する（API の呼び出しの回数を抑えるため）。
+    max_batch_items などはエンコーダの設定（create_text_encoder を参照）で、レポートの encoder に記録する。
+    """
+    import json
+
+    from lawsy.data.xml_source import list_xml_sources
+    from lawsy.utils.ingest_bench import IngestBenchmark
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    sources = list_xml_sources(xml_path)
+    encoder_options = {
+        "max_batch_items": max_batch_items,
+        "max_batch_tokens": max_batch_tokens,
+        "num_threads": num_threads,
+        "num_interop_threads": num_interop_threads,
+    }
+    encoder = create_text_encoder(model_name, **encoder_options) if model_name is not None else None
+    benchmark = IngestBenchmark(
+        sources,
+        chunker_options={"indent": 2, "strategy": strategy, "max_tokens": max_tokens},
+        scale=scale,
+        repeat=repeat,
+        encoder=encoder,
+        dim=dim,
+        embed_sample=embed_sample,
+    )
+    report = benchmark.run()
+    if encoder is not None:
+        # エンコーダの設定ごとの embed の chunks/s を比べられるように、設定もレポートに含める
+        report["encoder"] = {"model_name": model_name, **encoder_options}
+    for stage in report["stages"]:
+        throughput = [f"{stage['laws_per_sec']:.1f} laws/s"]
+        if stage["chunks_per_sec"] is not None:
+            throughput.append(f"{stage['chunks_per_sec']:.1f} chunks/s")
+        if stage["mb_per_sec"] is not None:
+            throughput.append(f"{stage['mb_per_sec']:.2f} MB/s")
+        if stage["peak_traced_mb"] is not None:
+            throughput.append(f"peak traced {stage['peak_traced_mb']:.1f} MB")
+        logger.info(f"{stage['name']}: {stage['best_seconds']:.3f} sec ({', '.join(throughput)})")
+    logger.info(f"peak RSS of the process: {report['peak_rss_mb']:.1f} MB")
+    output_json_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_json_file, "w") as fout:
+        json.dump(report, fout, ensure_ascii=False, indent=2)
+    logger.info(f"Wrote a report of {report['num_laws']} laws / {report['num_chunks']} chunks to {output_json_file}.")
+
+
+@app.command()
+def create_document_chunks(input_path: Path, output_jsonl_file: Path, max_tokens: int = 512) -> None:
+    """
+    Markdown / プレーンテキストの文書（通知・ガイダンス・PMDAの報告書など）を見出し単位でチャンク化する
+
+    出力は article_chunks.jsonl と同じ形式で、embed-article-chunks --append と
+    add-article-chunk-vector-index で既存のエンベディングとインデックスに追加できる。
+    """
+    import json
+
+    from tqdm import tqdm
+
+    from lawsy.chunker.document_chunker import (
+        DocumentChunker,
+        get_document_file_name,
+        iter_document_chunk_records,
+        list_document_files,
+    )
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    root = input_path if input_path.is_dir() else input_path.parent
+    document_files = list_document_files(input_path)
+    markdown_chunker = DocumentChunker(max_tokens=max_tokens, markdown=True)
+    text_chunker = DocumentChunker(max_tokens=max_tokens, markdown=False)
+    output_jsonl_file.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    total_length = 0
+    with open(output_jsonl_file, "w") as fout:
+        for document_file in tqdm(document_files):
+            chunker = text_chunker if document_file.suffix.lower() == ".txt" else markdown_chunker
+            file_name = get_document_file_name(document_file, root)
+            for record in iter_document_chunk_records(document_file, file_name, chunker):
+                print(json.dumps(record, ensure_ascii=False), file=fout)
+                count += 1
+                total_length += len(record["chunk"])
+    avg_length = total_length / count if count > 0 else 0
+    logger.info(f"Created {count} chunks from {len(document_files)} documents (avg length: {avg_length}).")
+
+
+@app.command()
+def create_article_chunk_store(input_jsonl_file: Path, output_file: Path, batch_size: int = 8192) -> None:
+    """
+    article_chunks.jsonl を列指向のチャンクストア（.arrow: Arrow IPC / .parquet: Parquet）に変換する
+    """
+    import json
+
+    from lawsy.chunker.store import CHUNK_STORE_SUFFIXES, write_chunk_store
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    assert output_file.suffix in CHUNK_STORE_SUFFIXES, f"output_file must end with one of {CHUNK_STORE_SUFFIXES}"
+
+    def iter_records():
+        with open(input_jsonl_file) as fin:
+            for line in fin:
+                yield json.loads(line)
+
+    count = write_chunk_store(iter_records(), output_file, batch_size=batch_size)
+    logger.info(f"Wrote {count} chunks to {output_file}.")
+
+
+@app.command()
+def create_article_chunk_references(input_chunks_file: Path, output_jsonl_file: Path) -> None:
+    """
+    チャンクの本文から条の参照（法令内・法令間、準用を含む）を抽出し、(file_name, anchor) ごとの隣接リストを作成する
+
+    input_chunks_file には article_chunks.jsonl またはチャンクストア（.arrow / .parquet）を指定できる。
+    出力はベクトルインデックス（article_chunks_faiss）の隣に置き、検索時に参照先の条を辞書引きで取得するのに使う。
+    """
+    from lawsy.chunker.cross_reference import CrossReferenceIndex
+    from lawsy.chunker.store import ArrowChunkStore, load_chunk_store
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    chunks = load_chunk_store(input_chunks_file)
+    records = list(chunks.iter_records()) if isinstance(chunks, ArrowChunkStore) else list(chunks.values())
+    references = CrossReferenceIndex.build(records)
+    references.save(output_jsonl_file)
+    logger.info(f"Extracted {len(references)} references from {len(references.references)}/{len(records)} chunks.")
 
 
 @app.command()
@@ -55,115 +456,447 @@ def embed_article_chunks(
     output_parquet_file: Path,
     max_chars: int | None = 4096,
     model_name: str = "openai/text-embedding-3-small",
+    append: bool = False,
+    batch_size: int = 4096,
+    max_batch_items: int | None = None,
+    max_batch_tokens: int | None = None,
+    max_concurrency: int = 4,
+    embedding_cache_dir: Path | None = None,
+    num_threads: int | None = None,
+    num_interop_threads: int | None = None,
 ) -> None:
+    """
+    チャンクのエンベディングを計算する
+
+    正規化した本文が同じチャンク（chunk_hash が同じもの）は1回だけエンベディングを計算し、
+    すべてのキーに同じベクトルを出力する。
+    append=True の場合は既存の output_parquet_file の行を残し、まだエンベディングのないキー
+    （本文が変わったキーを含む）だけを計算して追記する。
+
+    チャンクを batch_size 件ずつまとめて、まだエンベディングのないテキストをエンコーダに渡し、エンコーダはそれを
+    件数（max_batch_items）とトークン数（max_batch_tokens）の上限で分けて計算する（未指定の場合はエンコーダの既定値）。
+    非同期のリクエストに対応したエンコーダ（OpenAI）では、分けたバッチを最大 max_concurrency 件まで並行に計算する。
+
+    計算済みのエンベディングは出力の横のチェックポイント（<output_parquet_file>.checkpoint）にも書き出し、
+    中断した場合は再実行すると計算済みのキーを読み込んで続きから計算する。
+    embedding_cache_dir を指定した場合は、以前に（別の出力の作成などで）計算したテキストのエンベディングを使い回す。
+    """
+    import asyncio
     import json
+    import time
+    from collections import Counter
 
     import pyarrow as pa
     import pyarrow.parquet as pq
     from tqdm import tqdm
 
-    provider = model_name.split("/")[0]
-    if provider == "openai":
-        from lawsy.encoder.openai import OpenAITextEmbedding
+    from lawsy.chunker.dedup import compute_chunk_hash
+    from lawsy.utils.embedding_checkpoint import EmbeddingCheckpoint, get_checkpoint_dir
+    from lawsy.utils.logging import get_logger
 
-        # OpenAIクラスはプレフィックスなしのモデル名を期待
-        actual_model_name = model_name.split("/")[1]
-        encoder = OpenAITextEmbedding(actual_model_name)
-    else:
-        from lawsy.encoder.me5 import ME5Instruct
+    logger = get_logger()
 
-        assert model_name == "multilingual-e5-large-instruct"
-        encoder = ME5Instruct()
+    assert batch_size > 0 and max_concurrency > 0
+    encoder = create_text_encoder(
+        model_name,
+        max_batch_items=max_batch_items,
+        max_batch_tokens=max_batch_tokens,
+        embedding_cache_dir=embedding_cache_dir,
+        num_threads=num_threads,
+        num_interop_threads=num_interop_threads,
+    )
 
-    schema = pa.schema([("file_name", pa.string()), ("anchor", pa.string()), ("embedding", pa.list_(pa.float32()))])
-    output_parquet_file.parent.mkdir(parents=True, exist_ok=True)
-    with pq.ParquetWriter(output_parquet_file, schema) as writer:
-        batch = []
-        batch_size = 512
+    def iter_texts():
         with open(input_jsonl_file, "r") as fin:
-            for line in tqdm(fin):
+            for line in fin:
                 d = json.loads(line)
                 text = d["chunk"]
                 if max_chars is not None:
                     text = text[:max_chars]
                 if text.strip() == "":
                     continue
-                embedding = encoder.get_document_embeddings([text])[0]
-                batch.append(
-                    (
-                        d["file_name"],
-                        d["anchor"],
-                        embedding.tolist(),
-                    )
-                )
-                if len(batch) >= batch_size:
-                    table = pa.Table.from_arrays(
-                        [pa.array([row[i] for row in batch], type=schema[i].type) for i in range(len(schema))],
-                        schema=schema,
-                    )
-                    writer.write_table(table)
-                    batch = []
-            if batch:
-                table = pa.Table.from_arrays(
-                    [pa.array([row[i] for row in batch], type=schema[i].type) for i in range(len(schema))],
-                    schema=schema,
-                )
-                writer.write_table(table)
+                chunk_hash = d.get("chunk_hash") or compute_chunk_hash(d["chunk"])
+                yield d["file_name"], d["anchor"], chunk_hash, text
+
+    # append の場合、既存の行のうち本文が変わったキーの行は捨てて計算し直す
+    existing_hashes = {}
+    if append and output_parquet_file.exists():
+        existing = pq.read_table(output_parquet_file, columns=["file_name", "anchor", "chunk_hash"])
+        existing_hashes = dict(
+            zip(
+                zip(existing.column("file_name").to_pylist(), existing.column("anchor").to_pylist()),
+                existing.column("chunk_hash").to_pylist(),
+            )
+        )
+        input_hashes = {(file_name, anchor): chunk_hash for file_name, anchor, chunk_hash, _ in iter_texts()}
+        iter_all_texts = iter_texts
+
+        def iter_texts():
+            for file_name, anchor, chunk_hash, text in iter_all_texts():
+                if existing_hashes.get((file_name, anchor)) != chunk_hash:
+                    yield file_name, anchor, chunk_hash, text
+
+    # 同じ chunk_hash のチャンクはエンベディングを1回だけ計算し、
+    # 以降の出現のために残りの出現回数が0になるまでエンベディングを保持する
+    remaining_counts = Counter(chunk_hash for _, _, chunk_hash, _ in iter_texts())
+    cached_embeddings = {}
+    num_chunks = 0
+    num_embedded = 0
+
+    schema = pa.schema(
+        [
+            ("file_name", pa.string()),
+            ("anchor", pa.string()),
+            ("chunk_hash", pa.string()),
+            ("embedding", pa.list_(pa.float32())),
+        ]
+    )
+    checkpoint = EmbeddingCheckpoint(
+        get_checkpoint_dir(output_parquet_file),
+        schema,
+        encoder_id=f"{encoder.get_name()}:{encoder.get_dimension()}:{max_chars}",
+    )
+    checkpointed = checkpoint.load()
+    checkpointed_embeddings = {chunk_hash: embedding for chunk_hash, embedding in checkpointed.values()}
+    if checkpointed:
+        logger.info(f"Resuming from a checkpoint of {len(checkpointed)} embedded chunks.")
+
+    embed_seconds = 0.0
+
+    def embed_texts(texts):
+        nonlocal embed_seconds
+        start = time.perf_counter()
+        if max_concurrency > 1 and hasattr(encoder, "aget_document_embeddings"):
+            embeddings = asyncio.run(encoder.aget_document_embeddings(texts, max_concurrency=max_concurrency))
+        else:
+            embeddings = encoder.get_document_embeddings(texts)
+        embed_seconds += time.perf_counter() - start
+        return embeddings
+
+    output_parquet_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = output_parquet_file.with_suffix(output_parquet_file.suffix + ".tmp")
+    with pq.ParquetWriter(tmp_file, schema) as writer:
+        if existing_hashes:
+            num_kept = 0
+            for record_batch in pq.ParquetFile(output_parquet_file).iter_batches(columns=schema.names):
+                keys = zip(record_batch.column("file_name").to_pylist(), record_batch.column("anchor").to_pylist())
+                mask = [
+                    key not in input_hashes or input_hashes[key] == chunk_hash
+                    for key, chunk_hash in zip(keys, record_batch.column("chunk_hash").to_pylist())
+                ]
+                kept = pa.Table.from_batches([record_batch]).filter(pa.array(mask)).cast(schema)
+                writer.write_table(kept)
+                num_kept += kept.num_rows
+            logger.info(f"Kept {num_kept} existing embeddings.")
+        rows = []
+        write_batch_size = 512
+
+        def write_rows():
+            table = pa.Table.from_arrays(
+                [pa.array([row[i] for row in rows], type=schema[i].type) for i in range(len(schema))],
+                schema=schema,
+            )
+            writer.write_table(table)
+            rows.clear()
+
+        pending = []
+        pending_texts = {}
+
+        def flush_pending():
+            nonlocal num_chunks, num_embedded
+            if pending_texts:
+                embeddings = embed_texts(list(pending_texts.values()))
+                for chunk_hash, embedding in zip(pending_texts.keys(), embeddings):
+                    cached_embeddings[chunk_hash] = embedding.tolist()
+                num_embedded += len(pending_texts)
+                pending_texts.clear()
+            checkpoint.write(
+                [
+                    (file_name, anchor, chunk_hash, cached_embeddings[chunk_hash])
+                    for file_name, anchor, chunk_hash in pending
+                    if checkpointed.get((file_name, anchor), (None,))[0] != chunk_hash
+                ]
+            )
+            for file_name, anchor, chunk_hash in pending:
+                embedding = cached_embeddings[chunk_hash]
+                remaining_counts[chunk_hash] -= 1
+                if remaining_counts[chunk_hash] <= 0:
+                    cached_embeddings.pop(chunk_hash)
+                num_chunks += 1
+                rows.append((file_name, anchor, chunk_hash, embedding))
+                if len(rows) >= write_batch_size:
+                    write_rows()
+            pending.clear()
+
+        with tqdm(total=remaining_counts.total()) as progress:
+            for file_name, anchor, chunk_hash, text in iter_texts():
+                if chunk_hash in checkpointed_embeddings:
+                    cached_embeddings[chunk_hash] = checkpointed_embeddings[chunk_hash]
+                elif chunk_hash not in cached_embeddings and chunk_hash not in pending_texts:
+                    pending_texts[chunk_hash] = text
+                pending.append((file_name, anchor, chunk_hash))
+                if len(pending) >= batch_size:
+                    flush_pending()
+                    progress.update(num_chunks - progress.n)
+            flush_pending()
+            progress.update(num_chunks - progress.n)
+        if rows:
+            write_rows()
+    tmp_file.replace(output_parquet_file)
+    checkpoint.remove()
+    logger.info(f"Embedded {num_embedded} distinct texts for {num_chunks} chunks.")
+    if num_embedded > 0 and embed_seconds > 0:
+        logger.info(f"Encoder throughput: {num_embedded / embed_seconds:.1f} chunks/s ({embed_seconds:.1f} sec)")
+
+
+@app.command()
+def export_onnx_encoder(
+    output_dir: Path,
+    model_name: str = "intfloat/multilingual-e5-large-instruct",
+    quantize: bool = True,
+) -> None:
+    """
+    multilingual-e5 を ONNX（quantize=True の場合は int8 に量子化したものも）として output_dir に書き出す
+
+    書き出したモデルは --model-name onnx/<output_dir>（アプリでは LAWSY_ENCODER_MODEL_NAME）で使う。
+    書き出したモデルと元のモデルのエンベディングのコサイン類似度を確認して表示する。
+    """
+    import numpy as np
+
+    from lawsy.encoder.me5 import ME5Instruct
+    from lawsy.encoder.me5_onnx import ME5InstructOnnx, export_me5_onnx
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    model_file = export_me5_onnx(output_dir, model_name=model_name, quantize=quantize)
+    logger.info(f"Exported {model_file}.")
+
+    texts = [
+        "薬局の開設に必要な許可",
+        "薬局は、その所在地の都道府県知事の許可を受けなければ、開設してはならない。",
+        "何人も、医薬品等の名称、製造方法、効能、効果又は性能に関して、虚偽又は誇大な記事を広告してはならない。",
+    ]
+    expected = ME5Instruct(model_name, device="cpu").get_document_embeddings(texts)
+    actual = ME5InstructOnnx(output_dir, quantized=quantize).get_document_embeddings(texts)
+    cossims = (expected * actual).sum(axis=1) / np.linalg.norm(expected, axis=1) / np.linalg.norm(actual, axis=1)
+    logger.info(f"Cosine similarity to {model_name}: min {cossims.min():.4f}, mean {cossims.mean():.4f}")
 
 
 @app.command()
 def create_article_chunk_vector_index(
     input_parquet_file: Path, input_chunks_file: Path, output_dir: Path, dim: int | None = None
 ) -> None:
-    import json
-    from datetime import datetime
+    """
+    エンベディングとチャンクからベクトルインデックスを作成する
 
+    input_chunks_file には article_chunks.jsonl またはチャンクストア（.arrow / .parquet）を指定できる。
+    """
     import numpy as np
-    import pandas as pd
     import pyarrow.parquet as pq
     from tqdm import tqdm
 
+    from lawsy.chunker.dedup import compute_chunk_hash, select_earliest_per_hash
+    from lawsy.chunker.store import ArrowChunkStore, load_chunk_store
     from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
 
     assert dim is None or dim > 0
 
     table = pq.read_table(input_parquet_file)
+    chunks = load_chunk_store(input_chunks_file)
+    # エンベディングには add-documents で追記した文書のチャンクなど、チャンクストアにないキーが含まれうる
+    keys = list(zip(table.column("file_name").to_pylist(), table.column("anchor").to_pylist()))
+    found = [i for i, key in enumerate(keys) if key in chunks]
+    if len(found) < len(keys):
+        missing = [key for key in keys if key not in chunks]
+        logger.warning(
+            f"Skipped {len(missing)} embeddings whose keys are not in {input_chunks_file} (e.g. {missing[:3]})."
+        )
+        table = table.take(found)
+        keys = [keys[i] for i in found]
     file_names = table.column("file_name").to_pylist()
-    anchors = table.column("anchor").to_pylist()
-    embeddings = np.stack(table.column("embedding").to_numpy())
+    embeddings = np.stack(table.column("embedding").to_numpy(zero_copy_only=False))
     if dim is None:
         dim = embeddings.shape[1]
     else:
         embeddings = embeddings[:, :dim]
-    chunks = {}
-    with open(input_chunks_file) as fin:
-        for line in tqdm(fin):
-            chunk = json.loads(line)
-            chunks[chunk["file_name"], chunk["anchor"]] = chunk
+    if isinstance(chunks, ArrowChunkStore):
+        meta_data = chunks.take(keys, columns=["file_name", "anchor", "title", "chunk"])
+    else:
+        meta_data = [
+            {
+                "file_name": file_name,
+                "anchor": anchor,
+                "title": chunks[file_name, anchor]["title"],
+                "chunk": chunks[file_name, anchor]["chunk"],
+            }
+            for file_name, anchor in tqdm(keys)
+        ]
     retriever = FaissFlatArticleRetriever.create(dim=dim)
-    meta_data = [
-        {
-            "file_name": file_name,
-            "anchor": anchor,
-            "title": chunks[file_name, anchor]["title"],
-            "chunk": chunks[file_name, anchor]["chunk"],
-        }
-        for file_name, anchor in zip(file_names, anchors)
-    ]
-    # 同一内容の条文は最も古い日時のみを残す
-    # 薬事法データの場合は日付形式ではないため、重複排除をスキップ
-    try:
-        df = pd.DataFrame(meta_data)
-        df["date"] = df["file_name"].apply(lambda file_name: datetime.strptime(file_name.split("_")[1], "%Y%m%d"))
-        index = df.sort_values("date")["chunk"].drop_duplicates().index
-        embeddings = embeddings[index]
-        meta_data = [meta_data[idx] for idx in index]
-    except ValueError:
-        # 日付形式でない場合（薬事法データなど）は重複排除をスキップ
-        pass
+    # 同一内容（chunk_hash が同じ）の条文は最も古い日時のもののみを残す
+    if "chunk_hash" in table.column_names:
+        chunk_hashes = table.column("chunk_hash").to_pylist()
+    else:
+        chunk_hashes = [compute_chunk_hash(meta["chunk"]) for meta in meta_data]
+    index = select_earliest_per_hash(file_names, chunk_hashes)
+    logger.info(f"Removed {len(meta_data) - len(index)} duplicated chunks.")
+    embeddings = embeddings[index]
+    meta_data = [meta_data[idx] for idx in index]
     retriever.add(embeddings, meta_data)
     retriever.save(output_dir)
 
 
+@app.command()
+def summarize_article_chunks(
+    index_dir: Path,
+    summaries_file: Path | None = None,
+    lm_name: str | None = None,
+    max_workers: int = 4,
+    max_chars: int = 4096,
+) -> None:
+    """
+    ベクトルインデックスのチャンクごとに平易な要約を生成し、メタデータ（meta.jsonl）の summary に保存する
+
+    要約は chunk_hash をキーとして summaries_file（デフォルトはインデックスの summaries.jsonl）に追記し、
+    保存済みの要約があるチャンクは生成しない。インデックスを作り直した後に再実行すると、本文が変わったチャンクだけを
+    要約してメタデータに反映する。LMは lm_name、なければ環境変数 LAWSY_SUMMARY_LM、LAWSY_LM の順に使う。
+    """
+    import json
+
+    from lawsy.ai.article_summarizer import ArticleSummarizer
+    from lawsy.app.utils.lm import load_lm
+    from lawsy.chunker.summary import ArticleSummaryStore, attach_summaries, summarize_chunks
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    meta_file = index_dir / "meta.jsonl"
+    with open(meta_file) as fin:
+        meta_data = [json.loads(line) for line in fin]
+    store = ArticleSummaryStore(summaries_file or index_dir / "summaries.jsonl")
+    lm_name = lm_name or os.getenv("LAWSY_SUMMARY_LM") or os.getenv("LAWSY_LM", "openai/gpt-4o-mini")
+    logger.info(f"using LM: {lm_name}")
+    summarizer = ArticleSummarizer(load_lm(lm_name), max_chars=max_chars)
+
+    def summarize(title: str, chunk: str) -> str:
+        return summarizer(title=title, article=chunk).summary
+
+    num_summarized = summarize_chunks(meta_data, summarize, store, max_workers=max_workers)
+    num_attached = attach_summaries(meta_data, store)
+    tmp_file = meta_file.with_suffix(meta_file.suffix + ".tmp")
+    with open(tmp_file, "w") as fout:
+        for meta in meta_data:
+            print(json.dumps(meta, ensure_ascii=False), file=fout)
+    tmp_file.replace(meta_file)
+    logger.info(f"Summarized {num_summarized} chunks. {num_attached}/{len(meta_data)} chunks have summaries.")
+
+
+@app.command()
+def build(
+    xml_path: Path,
+    output_dir: Path,
+    output_jsonl_file: Path | None = None,
+    model_name: str = "openai/text-embedding-3-small",
+    dim: int | None = None,
+    max_chars: int | None = 4096,
+    batch_size: int = 64,
+    queue_size: int = 4,
+    workers: int = 1,
+    strategy: str = "article",
+    max_tokens: int = 512,
+    extractor: str = "model",
+    law_cache_dir: Path | None = None,
+    embedding_cache_dir: Path | None = None,
+) -> None:
+    """
+    法令XMLのチャンク化・エンベディング・ベクトルインデックスの作成を1パスで行う
+
+    create-article-chunks → embed-article-chunks → create-article-chunk-vector-index と同じインデックスを、
+    中間ファイルを介さずに作成する。各段階は上限付きのキュー（queue_size バッチ）でつながっており、
+    メモリ使用量はコーパスの大きさではなく batch_size × queue_size で決まる。
+    output_jsonl_file を指定した場合は、チャンク（article_chunks.jsonl 形式）と構造の索引も書き出す。
+    embedding_cache_dir を指定した場合は、以前に計算したテキストのエンベディングを使い回す。
+    """
+    from lawsy.utils.logging import get_logger
+    from lawsy.utils.streaming_build import StreamingIndexBuilder
+
+    logger = get_logger()
+
+    builder = StreamingIndexBuilder(
+        create_text_encoder(model_name, embedding_cache_dir=embedding_cache_dir),
+        batch_size=batch_size,
+        queue_size=queue_size,
+        max_chars=max_chars,
+        dim=dim,
+        chunker_options={"indent": 2, "strategy": strategy, "max_tokens": max_tokens},
+        workers=workers,
+        extractor=extractor,
+        law_cache_dir=law_cache_dir,
+    )
+    stats = builder.build(xml_path, output_dir, output_jsonl_file=output_jsonl_file)
+    logger.info(
+        f"Indexed {stats.num_indexed} chunks from {stats.num_files} files "
+        f"({stats.num_chunks} chunks, removed {stats.num_duplicates} duplicated chunks) into {output_dir}."
+    )
+
+
+@app.command()
+def add_article_chunk_vector_index(input_parquet_file: Path, input_chunks_file: Path, index_dir: Path) -> None:
+    """
+    既存のベクトルインデックスに、まだ含まれていないチャンクを追加する
+
+    文書のチャンク（create-document-chunks）などをインデックス全体を作り直さずに追加するためのもの。
+    キー（file_name, anchor）がインデックスにあるチャンクと、インデックス内のチャンクと同じ内容
+    （chunk_hash が同じ）のチャンクは追加しない。本文が変わったチャンクを反映するには
+    create-article-chunk-vector-index で作り直すこと。
+    """
+    import numpy as np
+    import pyarrow.parquet as pq
+
+    from lawsy.chunker.dedup import compute_chunk_hash, select_earliest_per_hash
+    from lawsy.chunker.store import load_chunk_store
+    from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
+    from lawsy.utils.logging import get_logger
+
+    logger = get_logger()
+
+    retriever = FaissFlatArticleRetriever.load(index_dir)
+    indexed_hashes = {compute_chunk_hash(meta["chunk"]) for meta in retriever.meta_data}
+    table = pq.read_table(input_parquet_file)
+    file_names = table.column("file_name").to_pylist()
+    anchors = table.column("anchor").to_pylist()
+    chunks = load_chunk_store(input_chunks_file)
+    if "chunk_hash" in table.column_names:
+        chunk_hashes = table.column("chunk_hash").to_pylist()
+    else:
+        chunk_hashes = [compute_chunk_hash(chunks[key]["chunk"]) for key in zip(file_names, anchors)]
+    candidates = [
+        i
+        for i, (key, chunk_hash) in enumerate(zip(zip(file_names, anchors), chunk_hashes))
+        if key not in retriever.key_to_index and chunk_hash not in indexed_hashes and key in chunks
+    ]
+    index = [
+        candidates[i]
+        for i in select_earliest_per_hash([file_names[i] for i in candidates], [chunk_hashes[i] for i in candidates])
+    ]
+    if not index:
+        logger.info(f"No new chunks to add to {index_dir}.")
+        return
+    embeddings = np.stack(table.column("embedding").take(index).to_numpy(zero_copy_only=False))
+    embeddings = embeddings[:, : retriever.vector_dim].astype(np.float32)
+    meta_data = []
+    for i in index:
+        record = chunks[file_names[i], anchors[i]]
+        meta_data.append(
+            {"file_name": file_names[i], "anchor": anchors[i], "title": record["title"], "chunk": record["chunk"]}
+        )
+    retriever.add(embeddings, meta_data)
+    retriever.save(index_dir)
+    logger.info(f"Added {len(index)} chunks to {index_dir} ({len(retriever.meta_data)} chunks in total).")
+
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,100 @@
+"""
+パース済みの Law モデルのディスクキャッシュ
+
+チャンク化のパラメータ（indent, strategy, max_tokens）を変えて作り直す場合も、XMLが変わっていなければ
+ja_law_parser によるパースの結果は同じなので、XMLの内容のハッシュとパーサーのバージョンをキーとして
+pickle で保存しておき、次回からは読み込むだけにする。
+
+Law モデルは本文を lxml の要素のまま保持している（テキストは参照時に計算される）ため、
+要素はシリアライズしたXMLとして保存し、読み込み時に要素に戻す。
+キャッシュはローカルで作成したものだけを読む前提である（pickle のため、外部から受け取ったファイルは置かないこと）。
+"""
+
+import copyreg
+import hashlib
+import io
+import os
+import pickle
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from ja_law_parser.model import Law
+from lxml import etree
+
+# キャッシュの形式を変えた場合はこのバージョンを上げること
+LAW_CACHE_VERSION = "1"
+
+
+def _reduce_element(element: etree._Element):
+    return etree.fromstring, (etree.tostring(element, with_tail=False),)
+
+
+class _LawPickler(pickle.Pickler):
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[etree._Element] = _reduce_element
+
+
+def dump_law(law: Law) -> bytes:
+    buffer = io.BytesIO()
+    _LawPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(law)
+    return buffer.getvalue()
+
+
+def load_law(data: bytes) -> Law:
+    return pickle.loads(data)
+
+
+@lru_cache(maxsize=1)
+def get_parser_version() -> str:
+    """キャッシュのキーに含めるパーサー（ja_law_parser とそれが使う pydantic-xml）とキャッシュ形式のバージョン"""
+    versions = []
+    for package in ("ja-law-parser", "pydantic-xml", "lxml"):
+        try:
+            versions.append(f"{package}={version(package)}")
+        except PackageNotFoundError:
+            versions.append(f"{package}=unknown")
+    return ";".join(versions + [f"cache={LAW_CACHE_VERSION}"])
+
+
+def compute_content_hash(xml_content: bytes) -> str:
+    return hashlib.blake2b(xml_content, digest_size=16).hexdigest()
+
+
+class LawCache:
+    """
+    XMLの内容のハッシュ → パース済みの Law モデルのディスクキャッシュ
+
+    パーサーのバージョンごとにサブディレクトリを分けるため、ja_law_parser を更新すると古いキャッシュは使われない。
+    書き込みは一時ファイルからの置き換えで行うため、並列のワーカーが同じキャッシュを共有できる。
+    """
+
+    def __init__(self, cache_dir: Path | str) -> None:
+        parser_key = hashlib.blake2b(get_parser_version().encode("utf-8"), digest_size=8).hexdigest()
+        self.cache_dir = Path(cache_dir) / parser_key
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, content_hash: str) -> Path:
+        return self.cache_dir / content_hash[:2] / f"{content_hash}.pkl"
+
+    def parse(self, xml_content: bytes) -> Law:
+        """キャッシュがあれば読み込み、なければパースしてキャッシュに保存する"""
+        from lawsy.parser.parser import parse_from_xml_bytes
+
+        path = self.get_path(compute_content_hash(xml_content))
+        if path.exists():
+            try:
+                law = load_law(path.read_bytes())
+                self.hits += 1
+                return law
+            except Exception:
+                # 書き込み途中のファイルや壊れたファイルはパースし直して上書きする
+                pass
+        self.misses += 1
+        law = parse_from_xml_bytes(xml_content)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_suffix(f".{os.getpid()}.{id(law)}.tmp")
+        tmp_file.write_bytes(dump_law(law))
+        tmp_file.replace(path)
+        return law
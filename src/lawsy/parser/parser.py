@@ -5,7 +5,7 @@ from ja_law_parser.model import Law
 from ja_law_parser.parser import LawParser
 
 
-def parse_from_api_response(xml_content: str) -> Law:
+def parse_from_api_response(xml_content: str | bytes) -> Law:
     parser = LawParser()
     # ja_law_parserはXMLフォーマットに準拠しており、Lawタグ配下を取り出して与える必要がある。
     tree = ET.fromstring(xml_content)
@@ -19,3 +19,17 @@ def parse_from_xml_file(xml_file: Path | str) -> Law:
     parser = LawParser()
     parsed = parser.parse(xml_file)
     return parsed
+
+
+def parse_from_xml_bytes(xml_content: bytes) -> Law:
+    """
+    Law要素がルートのXML（前処理済みのファイルや一括ダウンロードのファイル）、
+    またはe-Gov APIのレスポンス（DataRoot > ... > Law）をパースする
+    """
+    import io
+
+    _, root = next(ET.iterparse(io.BytesIO(xml_content), events=("start",)))
+    if root.tag != "Law":
+        return parse_from_api_response(xml_content)
+    parser = LawParser()
+    return parser.parse_from(xml_content)
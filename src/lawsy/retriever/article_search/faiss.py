@@ -1,11 +1,51 @@
+from collections.abc import Iterable
 from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
 
+from lawsy.chunker.cross_reference import CrossReferenceIndex
+from lawsy.chunker.document_chunker import is_document_file_name
+from lawsy.chunker.structure import StructureIndex
 from lawsy.retriever.search_result import ArticleSearchResult
 
 
+def create_article_search_result(meta: dict, score: float | None) -> ArticleSearchResult:
+    if is_document_file_name(meta["file_name"]):
+        # 法令XML以外の文書（通知・ガイダンスなど）は参照先のURLを持たないため、URLは空にする
+        rev_id = law_id = meta["file_name"]
+        url = ""
+    else:
+        rev_id = meta["file_name"].split(".")[0]
+        law_id = rev_id.split("_")[0]
+        url = f"https://laws.e-gov.go.jp/law/{law_id}#{meta['anchor']}"
+    return ArticleSearchResult(
+        law_id=law_id,
+        rev_id=rev_id,
+        title=meta["title"],
+        snippet=meta["chunk"],
+        score=score,
+        anchor=meta["anchor"],
+        url=url,
+        meta=meta,
+    )
+
+
+def _extend_unique(
+    results: list[ArticleSearchResult], additions: Iterable[list[ArticleSearchResult]]
+) -> list[ArticleSearchResult]:
+    """results の後ろに、additions のうちキー（file_name, anchor）が重複しないものを加えたリストを返す"""
+    extended = list(results)
+    seen = {(result.meta["file_name"], result.anchor) for result in results}
+    for added in additions:
+        for result in added:
+            key = (result.meta["file_name"], result.anchor)
+            if key not in seen:
+                seen.add(key)
+                extended.append(result)
+    return extended
+
+
 class FaissFlatArticleRetriever:
     def __init__(
         self,
@@ -42,36 +82,108 @@ class FaissFlatArticleRetriever:
         i = self.key_to_index[key]
         return self.index.reconstruct(i)  # type: ignore
 
+    def get_article(self, file_name: str, anchor: str) -> ArticleSearchResult | None:
+        i = self.key_to_index.get((file_name, anchor))
+        if i is None:
+            return None
+        return create_article_search_result(self.meta_data[i], None)
+
+    def get_referenced_articles(
+        self, article: ArticleSearchResult, references: CrossReferenceIndex, include_referenced_by: bool = False
+    ) -> list[ArticleSearchResult]:
+        """
+        検索結果の条が参照している条（include_referenced_by=True の場合は、その条を参照している条も）を返す
+
+        参照関係は create-article-chunk-references で作成した隣接リストから引くため、追加の検索は行わない。
+        """
+        file_name, anchor = article.meta["file_name"], article.anchor
+        targets = references.get_references(file_name, anchor)
+        if include_referenced_by:
+            targets = targets + references.get_referenced_by(file_name, anchor)
+        results = []
+        for target in targets:
+            result = self.get_article(target.file_name, target.anchor)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def add_referenced_articles(
+        self, results: list[ArticleSearchResult], references: CrossReferenceIndex, max_per_article: int = 3
+    ) -> list[ArticleSearchResult]:
+        """
+        検索結果に、各条が参照している条（検索結果にないもの、1件あたり max_per_article 件まで）を加えて返す
+
+        加えた条は score を持たず、検索結果の後ろに並ぶ（順位はその後のリランキングで決める）。
+        """
+        return _extend_unique(
+            results, (self.get_referenced_articles(result, references)[:max_per_article] for result in results)
+        )
+
+    def get_context_articles(
+        self,
+        article: ArticleSearchResult,
+        structure: StructureIndex,
+        scope: str = "neighbors",
+        window: int = 1,
+        level: int = 1,
+    ) -> list[ArticleSearchResult]:
+        """
+        検索結果の条の周辺の条・項を、法令の構造の索引から文書順に返す（検索結果自身は含まない）
+
+        scope="neighbors" の場合は前後 window 個のチャンク（前の項・次の条など）、
+        scope="siblings" の場合は level 段上の祖先（章・節・条）の配下のチャンクを返す。
+        周辺のチャンクはインデックスのメタデータから辞書引きで取得するため、追加の検索は行わない。
+        """
+        file_name, anchor = article.meta["file_name"], article.anchor
+        if scope == "neighbors":
+            anchors = structure.get_neighbors(file_name, anchor, before=window, after=window)
+        elif scope == "siblings":
+            anchors = [a for a in structure.get_siblings(file_name, anchor, level=level) if a != anchor]
+        else:
+            raise ValueError(f"unknown scope: {scope}")
+        results = []
+        for context_anchor in anchors:
+            result = self.get_article(file_name, context_anchor)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def add_context_articles(
+        self,
+        results: list[ArticleSearchResult],
+        structure: StructureIndex,
+        scope: str = "neighbors",
+        window: int = 1,
+        max_per_article: int = 3,
+    ) -> list[ArticleSearchResult]:
+        """
+        検索結果に、各条の周辺の条・項（get_context_articles、検索結果にないもの、1件あたり max_per_article 件まで）を
+        加えて返す
+
+        加えた条は score を持たず、検索結果の後ろに並ぶ（順位はその後のリランキングで決める）。
+        """
+        return _extend_unique(
+            results,
+            (
+                self.get_context_articles(result, structure, scope=scope, window=window)[:max_per_article]
+                for result in results
+            ),
+        )
+
     def search(self, vec: npt.NDArray[np.float64], k: int) -> list[ArticleSearchResult]:
         vec = vec[: self.vector_dim]
         vec = vec / np.linalg.norm(vec)
         cossims, indexs = self.index.search(vec.reshape(1, -1), k=k)  # type: ignore
         results = []
         for i, cossim in zip(indexs[0], cossims[0]):
-            meta = self.meta_data[i]
-            rev_id = meta["file_name"].split(".")[0]
-            law_id = rev_id.split("_")[0]
-            title = meta["title"]
-            chunk = meta["chunk"]
-            anchor = meta["anchor"]
-            url = f"https://laws.e-gov.go.jp/law/{law_id}#{anchor}"
-            result = ArticleSearchResult(
-                law_id=law_id,
-                rev_id=rev_id,
-                title=title,
-                snippet=chunk,
-                score=cossim,
-                anchor=anchor,
-                url=url,
-                meta=meta,
-            )
-            results.append(result)
+            results.append(create_article_search_result(self.meta_data[i], cossim))
         return results
 
     def add(self, vectors: npt.NDArray[np.float32], meta_data: list[dict]) -> None:
         self.index.add(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))  # type: ignore
+        offset = len(self.meta_data)
         self.meta_data.extend(meta_data)
-        self.key_to_index.update({(meta["file_name"], meta["anchor"]): meta for meta in meta_data})
+        self.key_to_index.update({(meta["file_name"], meta["anchor"]): offset + i for i, meta in enumerate(meta_data)})
 
     def save(self, path: Path | str) -> None:
         import json
@@ -96,6 +208,50 @@ class FaissFlatArticleRetriever:
         return FaissFlatArticleRetriever(path=path)
 
 
+class FaissFlatIndexWriter:
+    """
+    FaissFlatArticleRetriever.load で読めるインデックスを、メタデータをメモリに保持せずに書き出すライター
+
+    add したメタデータはその場で meta.jsonl に追記し、close で index.faiss を書き出して出力ディレクトリに置く。
+    close の前に失敗した場合（abort）は既存のインデックスを残したまま一時ファイルを削除する。
+    """
+
+    def __init__(self, path: Path | str, dim: int) -> None:
+        import faiss
+
+        assert dim > 0
+        self.path = Path(path)
+        assert not self.path.exists() or self.path.is_dir()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index = faiss.IndexFlat(dim, faiss.METRIC_INNER_PRODUCT)
+        self.tmp_meta_file = self.path / "meta.jsonl.tmp"
+        self.fout = open(self.tmp_meta_file, "w")
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    def add(self, vectors: npt.NDArray[np.float32], meta_data: list[dict]) -> None:
+        import json
+
+        assert len(vectors) == len(meta_data)
+        self.index.add(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))  # type: ignore
+        for record in meta_data:
+            print(json.dumps(record, ensure_ascii=False), file=self.fout)
+
+    def close(self) -> None:
+        import faiss
+
+        self.fout.close()
+        tmp_index_file = self.path / "index.faiss.tmp"
+        faiss.write_index(self.index, str(tmp_index_file), faiss.IO_FLAG_MMAP)
+        tmp_index_file.replace(self.path / "index.faiss")
+        self.tmp_meta_file.replace(self.path / "meta.jsonl")
+
+    def abort(self) -> None:
+        self.fout.close()
+        self.tmp_meta_file.unlink(missing_ok=True)
+
+
 class FaissHNSWArticleRetriever:
     def __init__(
         self,
@@ -133,24 +289,7 @@ class FaissHNSWArticleRetriever:
         cossims, indexs = self.index.search(vec.reshape(1, -1), k=k)  # type: ignore
         results = []
         for i, cossim in zip(indexs[0], cossims[0]):
-            meta = self.meta_data[i]
-            rev_id = meta["file_name"].split(".")[0]
-            law_id = rev_id.split("_")[0]
-            title = meta["title"]
-            chunk = meta["chunk"]
-            anchor = meta["anchor"]
-            url = f"https://laws.e-gov.go.jp/law/{law_id}#{anchor}"
-            result = ArticleSearchResult(
-                law_id=law_id,
-                rev_id=rev_id,
-                title=title,
-                snippet=chunk,
-                score=cossim,
-                anchor=anchor,
-                url=url,
-                meta=meta,
-            )
-            results.append(result)
+            results.append(create_article_search_result(self.meta_data[i], cossim))
         return results
 
     def add(self, vectors: npt.NDArray[np.float32], meta_data: list[dict]) -> None:
@@ -0,0 +1,88 @@
+"""
+embed-article-chunks のチェックポイント
+
+計算したエンベディングは最後に出力のParquetへまとめて置き換えるため、途中で中断すると計算済みの分が失われる。
+そこで、エンコーダに渡したまとまりごとに計算済みの行（file_name, anchor, chunk_hash, embedding）を
+part ファイルとしてチェックポイントのディレクトリに書き出し、再実行時は本文（chunk_hash）が同じキーの
+エンベディングを読み込んで、残りのキーだけを計算する。出力を置き換えた後にチェックポイントは削除する。
+"""
+
+import json
+import shutil
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CHECKPOINT_META_FILE = "checkpoint.json"
+
+
+def get_checkpoint_dir(output_parquet_file: Path) -> Path:
+    return output_parquet_file.with_suffix(output_parquet_file.suffix + ".checkpoint")
+
+
+class EmbeddingCheckpoint:
+    """
+    計算済みのエンベディングの行を part-XXXXX.parquet として保存するディレクトリ
+
+    エンコーダ（名前と次元）が異なるチェックポイントは使わずに削除する。
+    """
+
+    def __init__(self, path: Path, schema: pa.Schema, encoder_id: str) -> None:
+        self.path = path
+        self.schema = schema
+        self.encoder_id = encoder_id
+        self.num_parts = 0
+
+    def _get_part_path(self, i: int) -> Path:
+        return self.path / f"part-{i:05d}.parquet"
+
+    def load(self) -> dict[tuple[str, str], tuple[str, list[float]]]:
+        """
+        チェックポイントを読み込む
+
+        Returns:
+            dict[tuple[str, str], tuple[str, list[float]]]: (file_name, anchor) → (chunk_hash, embedding)
+        """
+        meta_file = self.path / CHECKPOINT_META_FILE
+        if not meta_file.exists():
+            self.remove()
+            return {}
+        with open(meta_file) as fin:
+            if json.load(fin).get("encoder_id") != self.encoder_id:
+                self.remove()
+                return {}
+        rows = {}
+        while self._get_part_path(self.num_parts).exists():
+            table = pq.read_table(self._get_part_path(self.num_parts), columns=self.schema.names)
+            for file_name, anchor, chunk_hash, embedding in zip(
+                *(table.column(name).to_pylist() for name in self.schema.names)
+            ):
+                rows[(file_name, anchor)] = (chunk_hash, embedding)
+            self.num_parts += 1
+        return rows
+
+    def write(self, rows: list[tuple]) -> None:
+        """(file_name, anchor, chunk_hash, embedding) の行を新しい part ファイルとして書き出す"""
+        if not rows:
+            return
+        meta_file = self.path / CHECKPOINT_META_FILE
+        if not meta_file.exists():
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(meta_file, "w") as fout:
+                json.dump({"encoder_id": self.encoder_id}, fout)
+        table = pa.Table.from_arrays(
+            [pa.array([row[i] for row in rows], type=self.schema[i].type) for i in range(len(self.schema))],
+            schema=self.schema,
+        )
+        # 書き込み途中で中断した part ファイルを読まないように、一時ファイルから置き換える
+        part_path = self._get_part_path(self.num_parts)
+        tmp_file = part_path.with_suffix(".tmp")
+        pq.write_table(table, tmp_file)
+        tmp_file.replace(part_path)
+        self.num_parts += 1
+
+    def remove(self) -> None:
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.num_parts = 0
@@ -0,0 +1,238 @@
+"""
+取り込み（チャンク化 → エンベディング → ベクトルインデックス）の段階別ベンチマーク
+
+XMLの読み出し、パース、条のパスの列挙、チャンクの描画、JSONへの直列化、エンベディング、FAISSインデックスの
+作成を段階ごとに計測し、処理時間・スループット（laws/s, chunks/s, MB/s）・段階ごとのメモリの最大確保量と
+プロセスの最大RSSを返す。
+取り込みの最適化を入れる前後で同じ入力に対して実行し、結果のJSONを比較するのに使う。
+"""
+
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+
+from lawsy.chunker.article_chunker import list_article_paths
+from lawsy.chunker.corpus import create_chunker, iter_article_chunk_records
+from lawsy.data.xml_source import XmlSource
+
+
+def get_peak_rss_mb() -> float:
+    """プロセスの最大RSS（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux ではキロバイト、macOS ではバイト単位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+@dataclass
+class StageResult:
+    """
+    1段階分の計測結果
+
+    Attributes:
+        seconds: 繰り返しごとの処理時間
+        num_laws: 処理した法令数
+        num_chunks: 処理したチャンク数（チャンクを扱わない段階では 0）
+        num_bytes: 処理したバイト数（入力XMLまたは出力JSONL、扱わない段階では 0）
+        peak_traced_mb: 段階の実行中に確保したメモリの最大量（tracemalloc、計測しない段階では None）
+    """
+
+    name: str
+    seconds: list[float] = field(default_factory=list)
+    num_laws: int = 0
+    num_chunks: int = 0
+    num_bytes: int = 0
+    peak_traced_mb: float | None = None
+
+    def to_dict(self) -> dict:
+        best = min(self.seconds)
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "best_seconds": best,
+            "median_seconds": statistics.median(self.seconds),
+            "num_laws": self.num_laws,
+            "num_chunks": self.num_chunks,
+            "num_bytes": self.num_bytes,
+            "laws_per_sec": self.num_laws / best if best > 0 else None,
+            "chunks_per_sec": self.num_chunks / best if self.num_chunks and best > 0 else None,
+            "mb_per_sec": self.num_bytes / 1024 / 1024 / best if self.num_bytes and best > 0 else None,
+            "peak_traced_mb": self.peak_traced_mb,
+        }
+
+
+class IngestBenchmark:
+    """
+    法令XMLの集合に対して取り込みの各段階を順に計測するベンチマーク
+
+    各段階は repeat 回実行して処理時間を記録し、最後の実行の出力を次の段階の入力とする。
+    処理時間とは別に、tracemalloc を有効にしてもう1回実行し、段階ごとのメモリの最大確保量を記録する。
+    scale > 1 の場合は入力XMLを scale 倍に複製した合成コーパス（file_name に _s{i} を付ける）で計測する。
+    encoder を指定しない場合はエンベディングの段階を省略し、乱数のベクトル（dim 次元）でインデックスを作成する。
+
+    エンベディングは API の呼び出し（課金）やモデルの推論が重いため、重複を除いたチャンクから先頭の
+    embed_sample 件だけを、キャッシュを使わずに1回だけ計算する（メモリの計測もしない）。
+    インデックスは、そのベクトルを全チャンクの件数まで繰り返したもので作成する。
+    標本が空（入力にチャンクがない、または embed_sample=0）の場合はエンベディングの段階を省略し、
+    エンコーダの次元の乱数のベクトルでインデックスを作成する。
+    """
+
+    def __init__(
+        self,
+        sources: list[XmlSource],
+        chunker_options: dict | None = None,
+        scale: int = 1,
+        repeat: int = 3,
+        encoder=None,
+        dim: int = 256,
+        max_chars: int | None = 4096,
+        embed_sample: int = 256,
+        seed: int = 0,
+    ) -> None:
+        assert scale > 0 and repeat > 0 and dim > 0 and embed_sample >= 0
+        self.sources = sources
+        self.chunker_options = chunker_options or {}
+        self.scale = scale
+        self.repeat = repeat
+        self.encoder = encoder
+        self.dim = dim
+        self.max_chars = max_chars
+        self.embed_sample = embed_sample
+        self.seed = seed
+        self.results: list[StageResult] = []
+
+    def _measure(self, result: StageResult, fn: Callable, repeat: int | None = None, trace: bool = True):
+        output = None
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            output = fn()
+            result.seconds.append(time.perf_counter() - start)
+        if trace:
+            # tracemalloc は処理を遅くするため、処理時間の計測とは別に実行する
+            tracemalloc.start()
+            try:
+                fn()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            result.peak_traced_mb = peak / 1024 / 1024
+        self.results.append(result)
+        return output
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        # キャッシュに当たると計算の時間を計測できないため、計測中はキャッシュを外す
+        cache = getattr(self.encoder, "cache", None)
+        if cache is not None:
+            self.encoder.cache = None
+        try:
+            return np.asarray(self.encoder.get_document_embeddings(texts), dtype=np.float32)
+        finally:
+            if cache is not None:
+                self.encoder.cache = cache
+
+    def run(self) -> dict:
+        from lawsy.parser.parser import parse_from_xml_bytes
+        from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
+
+        self.results = []
+
+        # 読み出しは元のXMLのみを計測し、合成コーパスはメモリ上で複製する
+        contents = self._measure(
+            StageResult("read", num_laws=len(self.sources)),
+            lambda: [(source.stem, source.read_bytes()) for source in self.sources],
+        )
+        self.results[-1].num_bytes = sum(len(content) for _, content in contents)
+        if self.scale > 1:
+            contents = [(f"{stem}_s{i}", content) for i in range(self.scale) for stem, content in contents]
+        num_laws = len(contents)
+        num_xml_bytes = sum(len(content) for _, content in contents)
+
+        laws = self._measure(
+            StageResult("parse", num_laws=num_laws, num_bytes=num_xml_bytes),
+            lambda: [(stem, parse_from_xml_bytes(content)) for stem, content in contents],
+        )
+        num_paths = self._measure(
+            StageResult("list_paths", num_laws=num_laws),
+            lambda: sum(len(list_article_paths(law)) for _, law in laws),
+        )
+
+        def render() -> list[dict]:
+            chunker = create_chunker(**self.chunker_options)
+            return [record for stem, law in laws for record in iter_article_chunk_records(law, stem, chunker)]
+
+        records = self._measure(StageResult("render", num_laws=num_laws), render)
+        num_chunks = len(records)
+        self.results[-1].num_chunks = num_chunks
+
+        lines = self._measure(
+            StageResult("serialize", num_laws=num_laws, num_chunks=num_chunks),
+            lambda: [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records],
+        )
+        self.results[-1].num_bytes = sum(len(line) for line in lines)
+
+        sample: dict[str, str] = {}
+        if self.encoder is not None:
+            # 合成コーパスのチャンクは元のチャンクと同じテキストのため、重複を除いてから標本を取る
+            for record in records:
+                if len(sample) >= self.embed_sample:
+                    break
+                sample.setdefault(
+                    record["chunk"][: self.max_chars] if self.max_chars else record["chunk"], record["file_name"]
+                )
+        texts = list(sample)
+        if texts:
+            embeddings = self._measure(
+                StageResult("embed", num_laws=len(set(sample.values())), num_chunks=len(texts)),
+                lambda: self._embed(texts),
+                repeat=1,
+                trace=False,
+            )
+            embeddings = np.resize(embeddings.reshape(len(texts), -1), (num_chunks, embeddings.size // len(texts)))
+        else:
+            dim = self.encoder.get_dimension() if self.encoder is not None else self.dim
+            rng = np.random.default_rng(self.seed)
+            embeddings = rng.standard_normal((num_chunks, dim)).astype(np.float32)
+
+        meta_data = [
+            {"file_name": r["file_name"], "anchor": r["anchor"], "title": r["title"], "chunk": r["chunk"]}
+            for r in records
+        ]
+
+        def index():
+            retriever = FaissFlatArticleRetriever.create(dim=embeddings.shape[1])
+            retriever.add(embeddings, meta_data)
+            return retriever
+
+        self._measure(StageResult("index", num_laws=num_laws, num_chunks=num_chunks), index)
+
+        return {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "processor": platform.processor(),
+            },
+            "options": {
+                "num_sources": len(self.sources),
+                "scale": self.scale,
+                "repeat": self.repeat,
+                "chunker_options": self.chunker_options,
+                "encoder": self.encoder.get_name() if self.encoder is not None else None,
+                "dim": int(embeddings.shape[1]),
+                "max_chars": self.max_chars,
+                "embed_sample": self.embed_sample if self.encoder is not None else None,
+            },
+            "num_laws": num_laws,
+            "num_articles": num_paths,
+            "num_chunks": num_chunks,
+            "stages": [result.to_dict() for result in self.results],
+            "peak_rss_mb": get_peak_rss_mb(),
+        }
@@ -0,0 +1,264 @@
+"""
+法令XMLからベクトルインデックスまでを1パスで作成するストリーミングパイプライン
+
+チャンク化 → エンベディング → インデックスへの追加の各段階をスレッドで動かし、段階の間を上限付きのキューで
+つなぐ。下流が詰まると上流の put が待つため（バックプレッシャー）、メモリ上に保持するチャンクとエンベディングは
+batch_size × queue_size 程度に抑えられ、コーパスの大きさによらない（workers > 1 の場合も、ワーカーに投入済みで
+未消費のファイルは workers * 2 件まで）。エンベディングの計算はパースと並行して進む。
+"""
+
+import json
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from lawsy.chunker.corpus import map_chunk_xml_files
+from lawsy.chunker.dedup import parse_file_date
+from lawsy.chunker.manifest import remove_chunk_manifest
+from lawsy.chunker.structure import StructureIndex, get_structure_index_path
+from lawsy.data.xml_source import XmlSource, list_xml_sources
+from lawsy.retriever.article_search.faiss import FaissFlatIndexWriter
+
+_END = object()
+
+
+def sort_sources_by_file_date(sources: list[XmlSource]) -> list[XmlSource]:
+    """
+    ファイル名の日付が古い順に並べる（日付を持たないものは後ろ、同順位は入力順）
+
+    先に現れた chunk_hash を残すだけで select_earliest_per_hash と同じチャンクが選ばれるようにするためのもの。
+    """
+
+    def key(source: XmlSource) -> tuple:
+        file_date = parse_file_date(source.stem)
+        return (file_date is None, file_date or date.min)
+
+    return sorted(sources, key=key)
+
+
+@dataclass
+class StreamingBuildStats:
+    num_files: int = 0
+    num_chunks: int = 0
+    num_duplicates: int = 0
+    num_indexed: int = 0
+    max_queued_batches: int = 0
+
+
+class _Stage(threading.Thread):
+    """上流のキューから取り出した要素を処理して下流のキューに入れるスレッド（例外は呼び出し側で再送出する）"""
+
+    def __init__(self, name: str, target: Callable[[], None], stop: threading.Event) -> None:
+        super().__init__(name=name, daemon=True)
+        self._target_fn = target
+        self.stop = stop
+        self.error: BaseException | None = None
+
+    def run(self) -> None:
+        try:
+            self._target_fn()
+        except BaseException as e:
+            self.error = e
+            self.stop.set()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> None:
+    """キューに空きができるまで待つ（他の段階が失敗した場合は中断する）"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+class StreamingIndexBuilder:
+    """
+    XMLのチャンク化・エンベディング・インデックスの作成を上限付きのキューでつないで並行に行うビルダー
+
+    同じ内容（chunk_hash が同じ）のチャンクは、ファイル名の日付が最も古いものだけをエンベディング・インデックスに
+    渡す（create-article-chunk-vector-index と同じ選び方）。
+    """
+
+    def __init__(
+        self,
+        encoder,
+        batch_size: int = 64,
+        queue_size: int = 4,
+        max_chars: int | None = 4096,
+        dim: int | None = None,
+        chunker_options: dict | None = None,
+        workers: int = 1,
+        extractor: str = "model",
+        law_cache_dir: Path | None = None,
+    ) -> None:
+        """
+        Args:
+            encoder: get_document_embeddings を持つエンコーダ
+            batch_size: エンコーダに1回で渡すチャンク数
+            queue_size: 段階の間のキューに溜めるバッチ数の上限
+            max_chars: エンベディングに使う本文の文字数の上限
+            dim: インデックスの次元（エンベディングの先頭 dim 次元を使う、None の場合はエンベディングの次元）
+            law_cache_dir: パース済みの法令のキャッシュのディレクトリ（None の場合はキャッシュしない）
+        """
+        assert batch_size > 0 and queue_size > 0
+        assert dim is None or dim > 0
+        self.encoder = encoder
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.max_chars = max_chars
+        self.dim = dim
+        self.chunker_options = chunker_options
+        self.workers = workers
+        self.extractor = extractor
+        self.law_cache_dir = law_cache_dir
+        self.stats = StreamingBuildStats()
+
+    def iter_record_batches(
+        self, sources: list[XmlSource], on_record: Callable[[dict], None] | None = None
+    ) -> Iterator[list[dict]]:
+        """重複を除いたチャンクレコードを batch_size ごとに返す（on_record には重複を含むすべてのレコードを渡す）"""
+        seen_hashes: set[str] = set()
+        batch: list[dict] = []
+        for records in map_chunk_xml_files(
+            sources,
+            chunker_options=self.chunker_options,
+            workers=self.workers,
+            extractor=self.extractor,
+            law_cache_dir=self.law_cache_dir,
+        ):
+            self.stats.num_files += 1
+            for record in records:
+                self.stats.num_chunks += 1
+                if on_record is not None:
+                    on_record(record)
+                if record["chunk"].strip() == "":
+                    continue
+                if record["chunk_hash"] in seen_hashes:
+                    self.stats.num_duplicates += 1
+                    continue
+                seen_hashes.add(record["chunk_hash"])
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _embed(self, records: list[dict]) -> np.ndarray:
+        texts = [record["chunk"][: self.max_chars] if self.max_chars else record["chunk"] for record in records]
+        embeddings = np.asarray(self.encoder.get_document_embeddings(texts), dtype=np.float32)
+        if self.dim is not None:
+            embeddings = embeddings[:, : self.dim]
+        return embeddings
+
+    def build(self, xml_path: Path, output_dir: Path, output_jsonl_file: Path | None = None) -> StreamingBuildStats:
+        """
+        xml_path 配下の法令XMLからインデックスを作成して output_dir に保存する
+
+        output_jsonl_file を指定した場合は、すべてのチャンク（重複を含む）を article_chunks.jsonl と同じ形式で
+        書き出し、隣に構造の索引（article_chunks.structure.json）も作成する。
+        """
+        sources = sort_sources_by_file_date(list_xml_sources(xml_path))
+        return self.build_from_sources(sources, output_dir, output_jsonl_file=output_jsonl_file)
+
+    def build_from_sources(
+        self, sources: list[XmlSource], output_dir: Path, output_jsonl_file: Path | None = None
+    ) -> StreamingBuildStats:
+        self.stats = StreamingBuildStats()
+        stop = threading.Event()
+        record_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        embedding_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        fout = None
+        structure = None
+        write_record = None
+        if output_jsonl_file is not None:
+            output_jsonl_file.parent.mkdir(parents=True, exist_ok=True)
+            fout = open(output_jsonl_file.with_suffix(output_jsonl_file.suffix + ".tmp"), "w")
+            structure = StructureIndex()
+
+            def write_record(record: dict) -> None:
+                print(json.dumps(record, ensure_ascii=False), file=fout)
+                structure.add(record["file_name"], record["anchor"], record["chunk"])
+
+        def chunk_stage() -> None:
+            for batch in self.iter_record_batches(sources, on_record=write_record):
+                if stop.is_set():
+                    return
+                _put(record_queue, batch, stop)
+                self.stats.max_queued_batches = max(self.stats.max_queued_batches, record_queue.qsize())
+            _put(record_queue, _END, stop)
+
+        def embed_stage() -> None:
+            while True:
+                batch = _get(record_queue, stop)
+                if batch is _END:
+                    break
+                _put(embedding_queue, (batch, self._embed(batch)), stop)
+            _put(embedding_queue, _END, stop)
+
+        stages = [_Stage("chunk", chunk_stage, stop), _Stage("embed", embed_stage, stop)]
+        for stage in stages:
+            stage.start()
+        writer = None
+        completed = False
+        try:
+            for batch, embeddings in _iter_queue(embedding_queue, stop):
+                if writer is None:
+                    writer = FaissFlatIndexWriter(output_dir, dim=embeddings.shape[1])
+                writer.add(
+                    embeddings,
+                    [
+                        {"file_name": r["file_name"], "anchor": r["anchor"], "title": r["title"], "chunk": r["chunk"]}
+                        for r in batch
+                    ],
+                )
+                self.stats.num_indexed += len(batch)
+            completed = not stop.is_set()
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
+            if fout is not None:
+                fout.close()
+            if not completed or writer is None:
+                # 失敗した場合は既存のインデックスとチャンクを残し、一時ファイルだけを消す
+                if writer is not None:
+                    writer.abort()
+                if fout is not None:
+                    Path(fout.name).unlink(missing_ok=True)
+        errors = [stage.error for stage in stages if stage.error is not None]
+        if errors:
+            raise errors[0]
+        if writer is None:
+            raise ValueError("no chunks to index")
+        writer.close()
+        if output_jsonl_file is not None and structure is not None:
+            output_jsonl_file.with_suffix(output_jsonl_file.suffix + ".tmp").replace(output_jsonl_file)
+            # create-article-chunks のマニフェストのオフセットは書き換えた JSONL と合わないため削除する
+            remove_chunk_manifest(output_jsonl_file)
+            structure.save(get_structure_index_path(output_jsonl_file))
+        return self.stats
+
+
+def _iter_queue(q: queue.Queue, stop: threading.Event) -> Iterable:
+    while True:
+        item = _get(q, stop)
+        if item is _END:
+            return
+        yield item
@@ -0,0 +1,79 @@
+import hashlib
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# src ディレクトリをパスに追加
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+
+class EgovApiStub:
+    """テスト用のe-Gov法令API（v1）スタブ"""
+
+    def __init__(self) -> None:
+        self.laws: dict[str, bytes] = {}  # law_id -> lawdata のレスポンス
+        self.routes: dict[str, bytes] = {}  # パス（/api/1 以下） -> レスポンス
+        self.requests: list[tuple[str, dict]] = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._create_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/1"
+
+    def add_law(self, law_id: str, law_title: str, sentence: str = "この法律は、公布の日から施行する。") -> None:
+        """lawdata APIのレスポンス（DataRoot > ApplData > LawFullText > Law）を登録"""
+        self.laws[law_id] = f"""<?xml version="1.0" encoding="UTF-8"?>
+<DataRoot><Result><Code>0</Code><Message/></Result><ApplData><LawId>{law_id}</LawId><LawFullText>
+<Law Era="Heisei" Year="1" LawType="Act" Num="1" Lang="ja"><LawNum>平成元年法律第一号</LawNum><LawBody>
+<LawTitle>{law_title}</LawTitle><MainProvision><Article Num="1"><ArticleTitle>第一条</ArticleTitle>
+<Paragraph Num="1"><ParagraphNum/><ParagraphSentence><Sentence Num="1">{sentence}</Sentence></ParagraphSentence>
+</Paragraph></Article></MainProvision></LawBody></Law></LawFullText></ApplData></DataRoot>""".encode("utf-8")
+
+    def requested_paths(self) -> list[str]:
+        return [path for path, _ in self.requests]
+
+    def _create_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append((self.path, dict(self.headers)))
+                path = self.path.removeprefix("/api/1/")
+                if path.startswith("lawdata/") and path.removeprefix("lawdata/") in stub.laws:
+                    body = stub.laws[path.removeprefix("lawdata/")]
+                elif path in stub.routes:
+                    body = stub.routes[path]
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def egov_api_stub():
+    stub = EgovApiStub()
+    stub.thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
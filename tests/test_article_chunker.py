@@ -0,0 +1,69 @@
+from pathlib import Path
+
+from lawsy.chunker.article_chunker import ArticleChunker, MemoizedArticleChunker, SubArticleChunker
+from lawsy.parser.parser import parse_from_xml_file
+
+SAMPLE_LAW_XML = Path(__file__).parent / "data" / "sample_law.xml"
+SAMPLE_LAW_SUBSECTION_XML = Path(__file__).parent / "data" / "sample_law_subsection.xml"
+
+
+def test_memoized_article_chunker_matches_article_chunker():
+    law = parse_from_xml_file(SAMPLE_LAW_XML)
+    for indent in (0, 2, 4):
+        expected = list(ArticleChunker(indent=indent)(law))
+        actual = list(MemoizedArticleChunker(indent=indent)(law))
+        assert len(expected) > 0
+        assert [chunk["anchor"] for chunk in actual] == [chunk["anchor"] for chunk in expected]
+        assert [chunk["chunk"] for chunk in actual] == [chunk["chunk"] for chunk in expected]
+        assert [chunk["article_path"] for chunk in actual] == [chunk["article_path"] for chunk in expected]
+
+
+def test_article_chunkers_include_articles_under_subsections():
+    # 節 → 款 → 条、節 → 款 → 目 → 条 の条もチャンクになる
+    law = parse_from_xml_file(SAMPLE_LAW_SUBSECTION_XML)
+    expected_anchors = ["Mp-Ch_1-Se_1-Ss_1-At_1", "Mp-Ch_1-Se_1-Ss_1-At_2", "Mp-Ch_1-Se_1-Ss_2-At_3"]
+    for chunker in (ArticleChunker(), MemoizedArticleChunker(), SubArticleChunker(max_tokens=10000)):
+        chunks = list(chunker(law))
+        assert [chunk["anchor"] for chunk in chunks] == expected_anchors
+        assert chunks[2]["chunk"].split("\n")[4] == "        第二款　届出"
+    anchors = [chunk["anchor"] for chunk in MemoizedArticleChunker()(parse_from_xml_file(SAMPLE_LAW_XML))]
+    assert "Mp-Ch_2-Se_2-Ss_1-Di_1-At_4" in anchors
+
+
+def test_memoized_article_chunker_skips_amendment_suppl_provisions():
+    law = parse_from_xml_file(SAMPLE_LAW_XML)
+    anchors = [chunk["anchor"] for chunk in MemoizedArticleChunker()(law)]
+    assert anchors.count("Sp-At_1") == 1
+
+
+def test_sub_article_chunker_keeps_short_articles():
+    law = parse_from_xml_file(SAMPLE_LAW_XML)
+    expected = list(MemoizedArticleChunker()(law))
+    actual = list(SubArticleChunker(max_tokens=10000)(law))
+    assert [chunk["anchor"] for chunk in actual] == [chunk["anchor"] for chunk in expected]
+    assert [chunk["chunk"] for chunk in actual] == [chunk["chunk"] for chunk in expected]
+
+
+def test_sub_article_chunker_splits_long_articles():
+    law = parse_from_xml_file(SAMPLE_LAW_XML)
+    max_tokens = 100
+    article_chunks = {chunk["anchor"]: chunk for chunk in MemoizedArticleChunker()(law)}
+    chunks = list(SubArticleChunker(max_tokens=max_tokens)(law))
+    anchors = [chunk["anchor"] for chunk in chunks]
+    assert len(anchors) == len(set(anchors))
+    assert "Mp-Ch_1-At_2-Pr_2-It_1" in anchors
+    for anchor, article_chunk in article_chunks.items():
+        windows = [chunk for chunk in chunks if chunk["anchor"] == anchor or chunk["anchor"].startswith(anchor + "-")]
+        if len(windows) == 1:
+            assert windows[0]["chunk"] == article_chunk["chunk"]
+            continue
+        # 各ウィンドウは祖先と条の見出しを持ち、本文の行を重複・欠落なく分け合う
+        # Law と Article を除く祖先ノードが1行ずつ見出しになる
+        header_lines = article_chunk["chunk"].split("\n")[: len(article_chunk["article_path"]) - 2]
+        body_lines = []
+        for window in windows:
+            lines = window["chunk"].split("\n")
+            assert lines[: len(header_lines) + 1] == article_chunk["chunk"].split("\n")[: len(header_lines) + 1]
+            assert window["title_suffix"].startswith(" 第")
+            body_lines.extend(lines[len(header_lines) + 1 :])
+        assert body_lines == article_chunk["chunk"].split("\n")[len(header_lines) + 1 :]
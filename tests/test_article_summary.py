@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from lawsy.chunker.dedup import compute_chunk_hash
+from lawsy.chunker.summary import ArticleSummaryStore, attach_summaries, summarize_chunks
+
+META_DATA = [
+    {"file_name": "A_20200401", "anchor": "Mp-At_1", "title": "A 第一条", "chunk": "A\n  第一条\n  目的を定める。"},
+    {"file_name": "A_20240401", "anchor": "Mp-At_1", "title": "A 第一条", "chunk": "A\n  第一条\n  目的を定める。"},
+    {"file_name": "A_20240401", "anchor": "Mp-At_2", "title": "A 第二条", "chunk": "A\n  第二条\n  定義を定める。"},
+]
+
+
+def test_summarize_chunks_only_new_content(tmp_path):
+    calls = []
+
+    def summarize(title: str, chunk: str) -> str:
+        calls.append(title)
+        return f"{title}の要約"
+
+    store = ArticleSummaryStore(tmp_path / "summaries.jsonl")
+    assert summarize_chunks(META_DATA, summarize, store, max_workers=2) == 2
+    assert sorted(calls) == ["A 第一条", "A 第二条"]
+    meta_data = [dict(meta) for meta in META_DATA]
+    assert attach_summaries(meta_data, store) == 3
+    assert meta_data[1]["summary"] == "A 第一条の要約"
+
+    # 再実行では本文が変わったチャンクだけを要約する
+    changed = [dict(meta) for meta in META_DATA]
+    changed[2]["chunk"] = "A\n  第二条\n  用語の定義を定める。"
+    calls.clear()
+    store = ArticleSummaryStore(tmp_path / "summaries.jsonl")
+    assert len(store) == 2
+    assert summarize_chunks(changed, summarize, store) == 1
+    assert calls == ["A 第二条"]
+    assert store.get(compute_chunk_hash(changed[2]["chunk"])) == "A 第二条の要約"
+
+
+def test_summarize_chunks_failure_is_retried(tmp_path):
+    def summarize(title: str, chunk: str) -> str:
+        if title == "A 第二条":
+            raise RuntimeError("rate limited")
+        return "要約"
+
+    store = ArticleSummaryStore(tmp_path / "summaries.jsonl")
+    assert summarize_chunks(META_DATA, summarize, store) == 1
+    meta_data = [dict(meta, summary="古い要約") for meta in META_DATA]
+    assert attach_summaries(meta_data, store) == 2
+    assert "summary" not in meta_data[2]
+
+    # 書きかけの最終行は読み飛ばす
+    with open(tmp_path / "summaries.jsonl", "a") as fout:
+        fout.write('{"chunk_hash": "abc", "summ')
+    store = ArticleSummaryStore(tmp_path / "summaries.jsonl")
+    assert len(store) == 1
+    assert summarize_chunks(META_DATA, lambda title, chunk: "要約2", store) == 1
+    lines = (tmp_path / "summaries.jsonl").read_text().splitlines()
+    assert json.loads(lines[-1])["summary"] == "要約2"
+
+
+@pytest.mark.parametrize("max_workers", [0, -1])
+def test_summarize_chunks_invalid_workers(tmp_path, max_workers):
+    with pytest.raises(AssertionError):
+        summarize_chunks(META_DATA, lambda title, chunk: "", ArticleSummaryStore(tmp_path / "s.jsonl"), max_workers)
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+import lawsy.main
+from lawsy.encoder.async_engine import AsyncEmbeddingEngine, is_rate_limit_error
+from lawsy.encoder.batching import EmbeddingBatchPolicy
+from lawsy.main import embed_article_chunks
+from lawsy.utils.embedding_checkpoint import get_checkpoint_dir
+
+
+class _RateLimitError(Exception):
+    status_code = 429
+
+
+def _embed_lengths(texts: list[str]) -> np.ndarray:
+    return np.asarray([[float(len(text)), 1.0] for text in texts])
+
+
+def test_engine_bounds_in_flight_and_keeps_order():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def embed(texts):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _embed_lengths(texts)
+
+    texts = ["a" * (i + 1) for i in range(20)]
+    engine = AsyncEmbeddingEngine(embed, EmbeddingBatchPolicy(max_items=2, max_tokens=100), max_concurrency=3)
+    embeddings = asyncio.run(engine.get_embeddings(texts, [len(text) for text in texts]))
+    assert embeddings[:, 0].tolist() == [len(text) for text in texts]
+    assert max_in_flight == engine.stats.max_in_flight == 3
+    assert engine.stats.num_requests == 10
+
+
+def test_engine_backs_off_on_rate_limit():
+    num_calls = 0
+
+    async def embed(texts):
+        nonlocal num_calls
+        num_calls += 1
+        if num_calls <= 2:
+            raise _RateLimitError()
+        return _embed_lengths(texts)
+
+    texts = ["a", "bb", "ccc", "dddd"]
+    engine = AsyncEmbeddingEngine(
+        embed, EmbeddingBatchPolicy(max_items=1, max_tokens=100), max_concurrency=4, initial_backoff=0.01
+    )
+    embeddings = asyncio.run(engine.get_embeddings(texts, [1, 2, 3, 4]))
+    assert embeddings[:, 0].tolist() == [1, 2, 3, 4]
+    assert engine.stats.num_rate_limited == 2
+    assert engine.stats.num_requests == 6
+    assert engine.concurrency < 4
+
+
+def test_engine_raises_other_errors():
+    async def embed(texts):
+        raise ValueError("bad request")
+
+    engine = AsyncEmbeddingEngine(embed, EmbeddingBatchPolicy(max_items=1, max_tokens=100), initial_backoff=0.01)
+    with pytest.raises(ValueError):
+        asyncio.run(engine.get_embeddings(["a", "b"], [1, 1]))
+    assert not is_rate_limit_error(ValueError())
+
+
+class _FlakyAsyncEncoder:
+    def __init__(self, fail_after: int | None = None) -> None:
+        self.fail_after = fail_after
+        self.embedded: list[str] = []
+
+    def get_name(self) -> str:
+        return "flaky"
+
+    def get_dimension(self) -> int:
+        return 2
+
+    def get_document_embeddings(self, documents: list[str]) -> np.ndarray:
+        raise AssertionError("the async method should be used")
+
+    async def aget_document_embeddings(self, documents: list[str], max_concurrency: int = 8) -> np.ndarray:
+        if self.fail_after is not None and len(self.embedded) >= self.fail_after:
+            raise RuntimeError("connection lost")
+        self.embedded.extend(documents)
+        return _embed_lengths(documents)
+
+
+def test_embed_article_chunks_resumes_from_checkpoint(tmp_path, monkeypatch):
+    input_file = tmp_path / "article_chunks.jsonl"
+    with open(input_file, "w") as fout:
+        for i in range(10):
+            record = {"file_name": "a", "anchor": f"Mp-At_{i}", "chunk": f"第{i}条" + "あ" * i, "chunk_hash": f"h{i}"}
+            print(json.dumps(record, ensure_ascii=False), file=fout)
+    output_file = tmp_path / "embeddings.parquet"
+
+    encoder = _FlakyAsyncEncoder(fail_after=4)
+    monkeypatch.setattr(lawsy.main, "create_text_encoder", lambda *args, **kwargs: encoder)
+    with pytest.raises(RuntimeError):
+        embed_article_chunks(input_file, output_file, batch_size=4)
+    assert not output_file.exists()
+    assert get_checkpoint_dir(output_file).exists()
+
+    # 再実行では中断前に計算した4件を計算し直さない
+    encoder = _FlakyAsyncEncoder()
+    monkeypatch.setattr(lawsy.main, "create_text_encoder", lambda *args, **kwargs: encoder)
+    embed_article_chunks(input_file, output_file, batch_size=4)
+    assert encoder.embedded == [f"第{i}条" + "あ" * i for i in range(4, 10)]
+    rows = pq.read_table(output_file).to_pylist()
+    assert [row["anchor"] for row in rows] == [f"Mp-At_{i}" for i in range(10)]
+    assert [row["embedding"][0] for row in rows] == [float(len(f"第{i}条") + i) for i in range(10)]
+    assert not get_checkpoint_dir(output_file).exists()
+
+
+class _EmbeddingsStubHandler(BaseHTTPRequestHandler):
+    """OpenAI互換の /embeddings のスタブ（最初の1回だけ 429 を返す）"""
+
+    num_requests = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).num_requests += 1
+        if type(self).num_requests == 1:
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Retry-After", "0.01")
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": {"message": "rate limited", "type": "requests"}}).encode())
+            return
+        data = [
+            {"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0, 0.0]}
+            for i, text in enumerate(body["input"])
+        ]
+        response = {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(response).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_openai_async_embeddings_with_stub(monkeypatch):
+    pytest.importorskip("openai")
+    from lawsy.encoder.openai import OpenAITextEmbedding
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EmbeddingsStubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+        monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+        encoder = OpenAITextEmbedding(dim=2, batch_policy=EmbeddingBatchPolicy(max_items=2, max_tokens=1000))
+        texts = ["a" * (i + 1) for i in range(5)]
+        embeddings = asyncio.run(encoder.aget_document_embeddings(texts, max_concurrency=2))
+        assert embeddings.tolist() == [[float(i + 1), 1.0] for i in range(5)]
+        assert _EmbeddingsStubHandler.num_requests == 4
+    finally:
+        server.shutdown()
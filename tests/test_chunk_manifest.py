@@ -0,0 +1,78 @@
+import json
+import shutil
+from pathlib import Path
+
+from lawsy.chunker.manifest import get_chunk_manifest_path
+from lawsy.main import create_article_chunks
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def _read_records(jsonl_file: Path) -> list[dict]:
+    with open(jsonl_file) as fin:
+        return [json.loads(line) for line in fin]
+
+
+def _create_xml_dir(path: Path) -> Path:
+    xml_dir = path / "xml"
+    xml_dir.mkdir()
+    shutil.copy(DATA_DIR / "sample_law.xml", xml_dir / "a.xml")
+    shutil.copy(DATA_DIR / "sample_law_markup.xml", xml_dir / "b.xml")
+    shutil.copy(DATA_DIR / "sample_law.xml", xml_dir / "c.xml")
+    return xml_dir
+
+
+def _full_rebuild(xml_dir: Path, path: Path) -> list[dict]:
+    output_file = path / "full" / "article_chunks.jsonl"
+    create_article_chunks(xml_dir, output_file, incremental=False)
+    return _read_records(output_file)
+
+
+def test_incremental_rebuild_matches_full_rebuild(tmp_path):
+    xml_dir = _create_xml_dir(tmp_path)
+    output_file = tmp_path / "out" / "article_chunks.jsonl"
+    create_article_chunks(xml_dir, output_file)
+    assert get_chunk_manifest_path(output_file).exists()
+    assert _read_records(output_file) == _full_rebuild(xml_dir, tmp_path / "1")
+
+    # 変更がない場合は JSONL を書き換えない
+    mtime = output_file.stat().st_mtime_ns
+    create_article_chunks(xml_dir, output_file)
+    assert output_file.stat().st_mtime_ns == mtime
+
+    # 変更したファイルだけ作り直し、他のファイルのチャンクはそのまま残る
+    xml_file = xml_dir / "a.xml"
+    xml_file.write_text(xml_file.read_text().replace("この省令は、", "この省令は、改正により"))
+    create_article_chunks(xml_dir, output_file)
+    records = _read_records(output_file)
+    assert any("改正により" in record["chunk"] for record in records if record["file_name"] == "a")
+    assert records == _full_rebuild(xml_dir, tmp_path / "2")
+
+    # 削除したファイルのチャンクは残らない
+    (xml_dir / "b.xml").unlink()
+    create_article_chunks(xml_dir, output_file)
+    records = _read_records(output_file)
+    assert {record["file_name"] for record in records} == {"a", "c"}
+    assert records == _full_rebuild(xml_dir, tmp_path / "3")
+
+
+def test_incremental_rebuild_ignores_manifest_of_other_jsonl(tmp_path):
+    xml_dir = _create_xml_dir(tmp_path)
+    output_file = tmp_path / "out" / "article_chunks.jsonl"
+    create_article_chunks(xml_dir, output_file)
+
+    # 他のコマンドが同じ JSONL を書き換えた場合は、マニフェストのオフセットを使わずに作り直す
+    foreign = [{"file_name": "other", "anchor": "Mp-At_1", "title": "other", "chunk": "第一条", "chunk_hash": "h"}]
+    with open(output_file, "w") as fout:
+        for record in foreign:
+            print(json.dumps(record, ensure_ascii=False), file=fout)
+    create_article_chunks(xml_dir, output_file)
+    assert _read_records(output_file) == _full_rebuild(xml_dir, tmp_path / "1")
+
+    with open(output_file, "w") as fout:
+        for record in foreign:
+            print(json.dumps(record, ensure_ascii=False), file=fout)
+    xml_file = xml_dir / "c.xml"
+    xml_file.write_text(xml_file.read_text().replace("この省令は、", "この省令は、改正により"))
+    create_article_chunks(xml_dir, output_file)
+    assert _read_records(output_file) == _full_rebuild(xml_dir, tmp_path / "2")
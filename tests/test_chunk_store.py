@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+from lawsy.chunker.dedup import compute_chunk_hash
+from lawsy.chunker.store import ArrowChunkStore, is_chunk_store_stale, load_chunk_store, write_chunk_store
+
+RECORDS = [
+    {
+        "file_name": f"law{i % 3}_20240101_processed",
+        "anchor": f"Mp-At_{i}",
+        "title": f"法令{i % 3} 第{i}条",
+        "chunk": "条文" * i,
+        "chunk_hash": compute_chunk_hash("条文" * i),
+    }
+    for i in range(1, 21)
+]
+
+
+@pytest.mark.parametrize("suffix", [".arrow", ".parquet"])
+def test_chunk_store_roundtrip(tmp_path, suffix):
+    path = tmp_path / f"article_chunks{suffix}"
+    assert write_chunk_store(iter(RECORDS), path, batch_size=7) == len(RECORDS)
+
+    store = load_chunk_store(path)
+    assert isinstance(store, ArrowChunkStore)
+    assert len(store) == len(RECORDS)
+    assert list(store) == [(record["file_name"], record["anchor"]) for record in RECORDS]
+    assert list(store.iter_records()) == RECORDS
+    for record in RECORDS:
+        assert store[record["file_name"], record["anchor"]] == record
+    assert ("law0_20240101_processed", "Mp-At_100") not in store
+
+    keys = [(record["file_name"], record["anchor"]) for record in reversed(RECORDS)]
+    assert store.take(keys, columns=["anchor", "title"]) == [
+        {"anchor": record["anchor"], "title": record["title"]} for record in reversed(RECORDS)
+    ]
+
+
+def test_load_chunk_store_jsonl(tmp_path):
+    jsonl_file = tmp_path / "article_chunks.jsonl"
+    with open(jsonl_file, "w") as fout:
+        for record in RECORDS:
+            print(json.dumps(record, ensure_ascii=False), file=fout)
+    arrow_file = tmp_path / "article_chunks.arrow"
+    write_chunk_store(RECORDS, arrow_file)
+    assert dict(load_chunk_store(jsonl_file)) == dict(load_chunk_store(arrow_file))
+
+
+def test_chunk_store_with_duplicate_keys_matches_jsonl(tmp_path):
+    # 同じキーの行が複数ある場合も、件数・キー・値は JSONL を読み込んだ dict と一致する
+    records = RECORDS + [dict(RECORDS[0], chunk="改正後の条文")]
+    jsonl_file = tmp_path / "article_chunks.jsonl"
+    with open(jsonl_file, "w") as fout:
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False), file=fout)
+    arrow_file = tmp_path / "article_chunks.arrow"
+    write_chunk_store(records, arrow_file)
+    store = load_chunk_store(arrow_file)
+    expected = load_chunk_store(jsonl_file)
+    assert len(store) == len(list(store)) == len(expected) == len(RECORDS)
+    assert dict(store) == dict(expected)
+
+
+def test_is_chunk_store_stale(tmp_path):
+    jsonl_file = tmp_path / "article_chunks.jsonl"
+    arrow_file = tmp_path / "article_chunks.arrow"
+    write_chunk_store(RECORDS, arrow_file)
+    assert not is_chunk_store_stale(arrow_file, jsonl_file)
+    jsonl_file.write_text("")
+    mtime = arrow_file.stat().st_mtime_ns
+    os.utime(jsonl_file, ns=(mtime + 10**9, mtime + 10**9))
+    assert is_chunk_store_stale(arrow_file, jsonl_file)
+    write_chunk_store(RECORDS, arrow_file)
+    os.utime(arrow_file, ns=(mtime + 2 * 10**9, mtime + 2 * 10**9))
+    assert not is_chunk_store_stale(arrow_file, jsonl_file)
@@ -0,0 +1,89 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from lawsy.chunker.corpus import map_chunk_api_responses
+from lawsy.chunker.manifest import get_chunk_manifest_path
+from lawsy.chunker.structure import get_structure_index_path
+from lawsy.data.egov_xml_processor import EgovXmlProcessor
+from lawsy.data.pharma_law_downloader import PharmaLawDownloader
+from lawsy.main import create_article_chunks, create_article_chunks_from_api
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def _create_xml_dir(path: Path) -> Path:
+    xml_dir = path / "xml"
+    xml_dir.mkdir()
+    for i, xml_file in enumerate(sorted(DATA_DIR.glob("*.xml")) * 2):
+        shutil.copy(xml_file, xml_dir / f"{i:02d}_{xml_file.name}")
+    return xml_dir
+
+
+@pytest.mark.parametrize("strategy", ["article", "sub-article"])
+def test_parallel_output_is_identical_to_serial(tmp_path, strategy):
+    xml_dir = _create_xml_dir(tmp_path)
+    outputs = {}
+    for workers in [1, 2, 3]:
+        output_file = tmp_path / f"workers{workers}" / "article_chunks.jsonl"
+        create_article_chunks(xml_dir, output_file, workers=workers, incremental=False, strategy=strategy)
+        outputs[workers] = (output_file.read_bytes(), get_structure_index_path(output_file).read_bytes())
+    assert outputs[1][0]
+    assert outputs[2] == outputs[1]
+    assert outputs[3] == outputs[1]
+
+
+def _read_lines(jsonl_file: Path) -> list[str]:
+    return jsonl_file.read_text(encoding="utf-8").splitlines()
+
+
+def test_create_article_chunks_from_api_matches_processed_xml(tmp_path, egov_api_stub):
+    for law_info in PharmaLawDownloader.PHARMA_LAWS.values():
+        egov_api_stub.add_law(law_info["law_id"], law_info["title"])
+    # 同じ JSONL を create-article-chunks で作成済みの場合も、そのマニフェストは使えなくなる
+    output_file = tmp_path / "out" / "article_chunks.jsonl"
+    create_article_chunks(_create_xml_dir(tmp_path), output_file)
+    assert get_chunk_manifest_path(output_file).exists()
+
+    raw_dir = tmp_path / "raw"
+    create_article_chunks_from_api(
+        output_file, raw_archive_dir=raw_dir, base_url=egov_api_stub.base_url, requests_per_second=100
+    )
+    assert not get_chunk_manifest_path(output_file).exists()
+    assert get_structure_index_path(output_file).exists()
+    assert len(list(raw_dir.glob("*.xml"))) == len(PharmaLawDownloader.PHARMA_LAWS)
+
+    # 前処理済みXMLを介した場合と同じチャンクになる
+    processed_dir = tmp_path / "processed"
+    EgovXmlProcessor(str(raw_dir), str(processed_dir)).process_all_files()
+    expected_file = tmp_path / "expected" / "article_chunks.jsonl"
+    create_article_chunks(processed_dir, expected_file, incremental=False)
+    lines = _read_lines(output_file)
+    assert len(lines) == len(PharmaLawDownloader.PHARMA_LAWS)
+    assert sorted(lines) == sorted(_read_lines(expected_file))
+
+    # 並列に処理しても出力は変わらない
+    parallel_file = tmp_path / "parallel" / "article_chunks.jsonl"
+    create_article_chunks_from_api(parallel_file, workers=2, base_url=egov_api_stub.base_url, requests_per_second=100)
+    assert parallel_file.read_bytes() == output_file.read_bytes()
+
+
+def test_map_chunk_api_responses_reads_input_lazily():
+    law_xml = (DATA_DIR / "sample_law.xml").read_bytes().split(b"?>", 1)[-1]
+    response = b"<DataRoot><ApplData><LawFullText>" + law_xml + b"</LawFullText></ApplData></DataRoot>"
+    num_pulled = 0
+
+    def iter_responses():
+        nonlocal num_pulled
+        for i in range(10):
+            num_pulled += 1
+            yield f"law{i}", response
+
+    in_flight = []
+    for i, records in enumerate(map_chunk_api_responses(iter_responses(), workers=2)):
+        assert records[0]["file_name"] == f"law{i}"
+        in_flight.append(num_pulled - (i + 1))
+    assert len(in_flight) == 10
+    # レスポンスは一度にすべて読み出さず、処理中の workers * 2 件までに抑えられる
+    assert max(in_flight) <= 4
@@ -0,0 +1,117 @@
+from pathlib import Path
+
+import numpy as np
+
+from lawsy.chunker.corpus import chunk_xml_file
+from lawsy.chunker.cross_reference import (
+    ArticleReference,
+    CrossReferenceIndex,
+    kanji_to_int,
+    law_number_to_law_id,
+)
+from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
+
+DATA_DIR = Path(__file__).parent / "data"
+LAW_TITLE = "医薬品、医療機器等の品質、有効性及び安全性の確保等に関する法律"
+LAW = "薬機法_335AC0000000145_processed"
+ORDER = "336CO0000000011_20240401_506CO0000000001"
+
+
+def _record(file_name: str, anchor: str, title: str, body: str) -> dict:
+    return {"file_name": file_name, "anchor": anchor, "title": title, "chunk": f"{title}\n  本則\n{body}"}
+
+
+RECORDS = [
+    _record(LAW, "Mp-At_1", LAW_TITLE, "    第一条\n    この法律は、保健衛生の向上を図ることを目的とする。"),
+    _record(LAW, "Mp-At_2", LAW_TITLE, "    第二条\n    この法律で「医薬品」とは、次に掲げる物をいう。"),
+    _record(LAW, "Mp-At_12", LAW_TITLE, "    第十二条\n    製造販売業の許可を受けなければならない。"),
+    _record(LAW, "Mp-At_12_2", LAW_TITLE, "    第十二条の二\n    許可を与えないことができる。"),
+    _record(LAW, "Mp-At_13", LAW_TITLE, "    第十三条\n    製造業の許可を受けなければならない。"),
+    _record(
+        LAW,
+        "Mp-At_14",
+        LAW_TITLE,
+        "    第十四条\n    第二条第一項に規定する医薬品について、第十二条から第十三条までの許可を受けた者は、"
+        "第十四条第二項の承認を受けなければならない。",
+    ),
+    _record(LAW, "Mp-At_15", LAW_TITLE, "    第十五条\n    前条の規定は、医薬部外品について準用する。"),
+    _record(
+        ORDER,
+        "Mp-At_1",
+        LAW_TITLE + "施行令",
+        "    第一条\n    法第十四条第一項の政令で定める医薬品は、昭和三十五年法律第百四十五号第二条に規定するもの"
+        "及び同法第一条の目的に照らし、薬事法第五条及び第二条の規定によるものとする。",
+    ),
+    _record(ORDER, "Mp-At_2", LAW_TITLE + "施行令", "    第二条\n    同条の規定は適用しない。"),
+]
+
+
+def test_kanji_numbers():
+    assert kanji_to_int("百四十五") == 145
+    assert kanji_to_int("千二十") == 1020
+    assert kanji_to_int("十") == 10
+    assert law_number_to_law_id("昭和三十五年法律第百四十五号") == "335AC0000000145"
+    assert law_number_to_law_id("平成元年政令第十一号") == "401CO0000000011"
+    assert law_number_to_law_id("平成十六年厚生労働省令第百七十九号") is None
+
+
+def test_cross_reference_index(tmp_path):
+    references = CrossReferenceIndex.build(RECORDS)
+    assert references.get_references(LAW, "Mp-At_14") == [
+        ArticleReference(LAW, "Mp-At_2", "reference"),
+        ArticleReference(LAW, "Mp-At_12", "reference"),
+        ArticleReference(LAW, "Mp-At_12_2", "reference"),
+        ArticleReference(LAW, "Mp-At_13", "reference"),
+    ]
+    assert references.get_references(LAW, "Mp-At_15") == [ArticleReference(LAW, "Mp-At_14", "mutatis_mutandis")]
+    # 施行令の「法」は本体の法律、法令番号と「同法」も解決し、コーパスにない法令（薬事法）は無視する
+    assert references.get_references(ORDER, "Mp-At_1") == [
+        ArticleReference(LAW, "Mp-At_14", "reference"),
+        ArticleReference(LAW, "Mp-At_2", "reference"),
+        ArticleReference(LAW, "Mp-At_1", "reference"),
+        ArticleReference(ORDER, "Mp-At_2", "reference"),
+    ]
+    assert references.get_references(ORDER, "Mp-At_2") == []
+    assert ArticleReference(ORDER, "Mp-At_1", "reference") in references.get_referenced_by(LAW, "Mp-At_14")
+
+    references.save(tmp_path / "article_chunk_references.jsonl")
+    loaded = CrossReferenceIndex.load(tmp_path / "article_chunk_references.jsonl")
+    assert loaded.references == references.references
+    assert loaded.referenced_by == references.referenced_by
+
+    retriever = FaissFlatArticleRetriever.create(dim=len(RECORDS))
+    retriever.add(np.eye(len(RECORDS), dtype=np.float32), RECORDS)
+    hit = retriever.search(np.eye(len(RECORDS))[6], k=1)[0]
+    assert hit.anchor == "Mp-At_15"
+    referenced = retriever.get_referenced_articles(hit, loaded)
+    assert [(result.meta["file_name"], result.anchor) for result in referenced] == [(LAW, "Mp-At_14")]
+
+
+def test_add_referenced_articles():
+    references = CrossReferenceIndex.build(RECORDS)
+    retriever = FaissFlatArticleRetriever.create(dim=len(RECORDS))
+    retriever.add(np.eye(len(RECORDS), dtype=np.float32), RECORDS)
+    hits = [retriever.search(np.eye(len(RECORDS))[i], k=1)[0] for i in (6, 5)]
+    assert [hit.anchor for hit in hits] == ["Mp-At_15", "Mp-At_14"]
+
+    # 参照先のうち検索結果にない条を、1件あたり max_per_article 件まで後ろに加える
+    expanded = retriever.add_referenced_articles(hits, references, max_per_article=2)
+    assert [(result.meta["file_name"], result.anchor) for result in expanded] == [
+        (LAW, "Mp-At_15"),
+        (LAW, "Mp-At_14"),
+        (LAW, "Mp-At_2"),
+        (LAW, "Mp-At_12"),
+    ]
+    assert expanded[:2] == hits
+    assert expanded[2].score is None
+    # 加えた条もインデックスのベクトルでリランキングできる
+    np.testing.assert_allclose(retriever.get_vector(expanded[2]), np.eye(len(RECORDS))[1])
+
+
+def test_cross_reference_index_on_fixtures():
+    records = [record for xml_file in sorted(DATA_DIR.glob("*.xml")) for record in chunk_xml_file(xml_file)]
+    references = CrossReferenceIndex.build(records)
+    keys = {(record["file_name"], record["anchor"]) for record in records}
+    for file_name, anchor, target in references.iter_edges():
+        assert (file_name, anchor) in keys
+        assert (target.file_name, target.anchor) in keys
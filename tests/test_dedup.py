@@ -0,0 +1,22 @@
+from lawsy.chunker.dedup import compute_chunk_hash, normalize_chunk_text, parse_file_date, select_earliest_per_hash
+
+
+def test_compute_chunk_hash_ignores_width_and_whitespace():
+    assert normalize_chunk_text("第一条\n  （趣旨）　ＡＢＣ１ ") == "第一条 (趣旨) ABC1"
+    assert compute_chunk_hash("第一条\n  （趣旨）") == compute_chunk_hash("第一条 (趣旨)")
+    assert compute_chunk_hash("第一条") != compute_chunk_hash("第二条")
+
+
+def test_select_earliest_per_hash():
+    file_names = [
+        "335AC0000000145_20240401_506AC0000000001",
+        "335AC0000000145_20200901_501AC0000000063",
+        "335AC0000000145_20240401_506AC0000000001",
+        "薬機法_335AC0000000145_processed",
+        "薬機法_335AC0000000145_processed",
+    ]
+    chunk_hashes = ["a", "a", "b", "c", "c"]
+    assert parse_file_date(file_names[1]).isoformat() == "2020-09-01"  # type: ignore
+    assert parse_file_date(file_names[3]) is None
+    # 日付形式でないファイル名（薬事法データ）でも先に現れたものを残して重複排除する
+    assert select_earliest_per_hash(file_names, chunk_hashes) == [1, 2, 3]
@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from lawsy.chunker.document_chunker import DocumentChunker, iter_document_chunk_records
+from lawsy.chunker.store import write_chunk_store
+from lawsy.main import add_article_chunk_vector_index, create_article_chunk_vector_index, create_document_chunks
+from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
+
+MARKDOWN = """# 通知の取扱い
+
+## 概要
+
+本通知は製造販売業者を対象とする。
+
+## 手順
+
+### 申請
+
+```
+# コードブロック内は見出しではない
+```
+
+第一段落。
+
+第二段落。
+"""
+
+
+def test_document_chunker_splits_by_heading_and_budget(tmp_path):
+    path = tmp_path / "notice.md"
+    path.write_text(MARKDOWN, encoding="utf-8")
+    records = list(iter_document_chunk_records(path, "doc:notice", DocumentChunker(max_tokens=40)))
+    assert [(record["anchor"], record["title"]) for record in records] == [
+        ("Sec_1-1", "通知の取扱い 概要"),
+        ("Sec_1-2-1", "通知の取扱い 手順 申請"),
+        ("Sec_1-2-1_Pt_2", "通知の取扱い 手順 申請"),
+    ]
+    assert records[1]["chunk"].startswith("通知の取扱い\n手順\n申請\n```\n# コードブロック内は見出しではない")
+    assert records[2]["chunk"] == "通知の取扱い\n手順\n申請\n第一段落。\n第二段落。"
+
+    # プレーンテキストは見出しを解釈せず、ファイル名を文書名とする
+    path = tmp_path / "guidance.txt"
+    path.write_text("# 見出しではない\n\n本文。\n", encoding="utf-8")
+    records = list(iter_document_chunk_records(path, "doc:guidance", DocumentChunker(markdown=False)))
+    assert [(record["anchor"], record["title"]) for record in records] == [("Sec_0", "guidance")]
+
+
+def test_add_document_chunks_to_vector_index(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "notice.md").write_text(MARKDOWN, encoding="utf-8")
+    create_document_chunks(tmp_path / "docs", tmp_path / "document_chunks.jsonl", max_tokens=512)
+    records = [json.loads(line) for line in open(tmp_path / "document_chunks.jsonl")]
+    assert [record["file_name"] for record in records] == ["doc:notice", "doc:notice"]
+
+    retriever = FaissFlatArticleRetriever.create(dim=4)
+    law_meta = {"file_name": "335AC0000000145", "anchor": "Mp-At_1", "title": "薬機法 第一条", "chunk": "本文"}
+    retriever.add(np.array([[1, 0, 0, 0]], dtype=np.float32), [law_meta])
+    retriever.save(tmp_path / "index")
+
+    embeddings = [[0, 1, 0, 0], [0, 0, 1, 0]]
+    pq.write_table(
+        pa.table(
+            {
+                "file_name": [record["file_name"] for record in records],
+                "anchor": [record["anchor"] for record in records],
+                "chunk_hash": [record["chunk_hash"] for record in records],
+                "embedding": pa.array(embeddings, type=pa.list_(pa.float32())),
+            }
+        ),
+        tmp_path / "document_embeddings.parquet",
+    )
+    for _ in range(2):
+        # 2回目はすでに追加済みのため何も追加しない
+        add_article_chunk_vector_index(
+            tmp_path / "document_embeddings.parquet", tmp_path / "document_chunks.jsonl", tmp_path / "index"
+        )
+        retriever = FaissFlatArticleRetriever.load(tmp_path / "index")
+        assert len(retriever.meta_data) == 3
+
+    result = retriever.search(np.array([0, 0, 1, 0], dtype=np.float64), k=1)[0]
+    assert (result.rev_id, result.anchor) == ("doc:notice", records[1]["anchor"])
+    # 文書は参照できるURLを持たない（参照の表示ではリンクを出さない）
+    assert result.url == ""
+    assert retriever.search(np.array([1, 0, 0, 0], dtype=np.float64), k=1)[0].law_id == "335AC0000000145"
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".arrow"])
+def test_create_vector_index_skips_embeddings_not_in_chunks(tmp_path, suffix):
+    # add-documents の後のエンベディングには、法令のチャンクにない文書のキーが含まれる
+    law_records = [
+        {"file_name": "335AC0000000145", "anchor": f"Mp-At_{i}", "title": f"第{i}条", "chunk": f"本文{i}"}
+        for i in range(1, 3)
+    ]
+    chunks_file = tmp_path / f"article_chunks{suffix}"
+    if suffix == ".jsonl":
+        with open(chunks_file, "w") as fout:
+            for record in law_records:
+                print(json.dumps(record, ensure_ascii=False), file=fout)
+    else:
+        write_chunk_store(law_records, chunks_file)
+    keys = [(record["file_name"], record["anchor"]) for record in law_records] + [("doc:notice", "Sec_1-1")]
+    pq.write_table(
+        pa.table(
+            {
+                "file_name": [file_name for file_name, _ in keys],
+                "anchor": [anchor for _, anchor in keys],
+                "chunk_hash": ["h1", "h2", "h3"],
+                "embedding": pa.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]], type=pa.list_(pa.float32())),
+            }
+        ),
+        tmp_path / "embeddings.parquet",
+    )
+    create_article_chunk_vector_index(tmp_path / "embeddings.parquet", chunks_file, tmp_path / "index")
+    retriever = FaissFlatArticleRetriever.load(tmp_path / "index")
+    assert [(meta["file_name"], meta["anchor"]) for meta in retriever.meta_data] == keys[:2]
+    assert retriever.search(np.array([0, 1, 0], dtype=np.float64), k=1)[0].anchor == "Mp-At_2"
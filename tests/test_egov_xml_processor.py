@@ -0,0 +1,94 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from lawsy.data.egov_xml_processor import EgovXmlProcessor, LawXmlStructureError, stream_law_element
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# 属性の引用符・改行・タブ、実体参照、混在内容、空要素、Law要素のtail を含む
+TRICKY_LAW = """<Law Era="Reiwa" Note='say "hi"' Multi="a&#10;b&#9;c&#13;d"><LawNum>令和&amp;元年 &lt;1&gt;</LawNum>
+<LawBody><Sentence>前<Ruby>薬<Rt>やく</Rt></Ruby>後 &amp; "引用"<Line Style="dotted"/>末尾</Sentence>
+  <Empty/><Empty Num="1"></Empty>
+</LawBody></Law>
+"""
+
+
+def _wrap_api_response(law_xml: str, law_id: str) -> str:
+    law_xml = re.sub(r"^<\?xml[^>]*\?>\s*", "", law_xml)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f"<DataRoot><Result><Code>0</Code><Message/></Result><ApplData><LawId>{law_id}</LawId>"
+        f"<LawFullText>{law_xml}</LawFullText><ImageData>AAAA</ImageData></ApplData></DataRoot>"
+    )
+
+
+def _law_xmls() -> list[str]:
+    return [
+        (DATA_DIR / "sample_law.xml").read_text(encoding="utf-8"),
+        (DATA_DIR / "sample_law_markup.xml").read_text(encoding="utf-8"),
+        TRICKY_LAW,
+    ]
+
+
+@pytest.mark.parametrize("index", range(3))
+def test_stream_law_element_matches_tostring(index):
+    response = _wrap_api_response(_law_xmls()[index], f"LAW{index}").encode("utf-8")
+    law_element = ET.fromstring(response).find("ApplData/LawFullText/Law")
+    fout = io.StringIO()
+    law_id = stream_law_element(io.BytesIO(response), fout)
+    assert law_id == f"LAW{index}"
+    assert fout.getvalue() == ET.tostring(law_element, encoding="unicode", xml_declaration=False)
+
+
+def test_stream_law_element_raises_on_unexpected_structure():
+    with pytest.raises(LawXmlStructureError, match="LawFullText"):
+        stream_law_element(io.BytesIO(b"<DataRoot><ApplData><LawId>X</LawId></ApplData></DataRoot>"), io.StringIO())
+
+
+def _create_input_dir(path: Path) -> Path:
+    input_dir = path / "input"
+    input_dir.mkdir()
+    for i, law_xml in enumerate(_law_xmls()):
+        (input_dir / f"law{i}.xml").write_text(_wrap_api_response(law_xml, f"LAW{i}"), encoding="utf-8")
+    (input_dir / "broken.xml").write_text("<DataRoot><ApplData>", encoding="utf-8")
+    return input_dir
+
+
+def _read_outputs(output_dir: Path) -> dict[str, bytes]:
+    return {file.name: file.read_bytes() for file in sorted(output_dir.glob("*_processed.xml"))}
+
+
+def test_process_all_files_streaming_and_parallel_match_serial(tmp_path):
+    input_dir = _create_input_dir(tmp_path)
+    serial = EgovXmlProcessor(str(input_dir), str(tmp_path / "serial")).process_all_files()
+    expected = _read_outputs(tmp_path / "serial")
+    assert (serial["success"], serial["error"]) == (3, 1)
+    assert len(expected) == 3
+
+    for name, streaming, workers in [("streaming", True, 1), ("parallel", False, 2), ("both", True, 2)]:
+        output_dir = tmp_path / name
+        summary = EgovXmlProcessor(str(input_dir), str(output_dir), streaming=streaming).process_all_files(
+            workers=workers
+        )
+        assert _read_outputs(output_dir) == expected
+        assert (summary["success"], summary["error"]) == (3, 1)
+        assert [info["law_id"] for info in summary["processed_files"]] == [
+            info["law_id"] for info in serial["processed_files"]
+        ]
+        assert not list(output_dir.glob("*.tmp"))
+
+
+def test_process_all_files_rejects_inputs_with_the_same_output_name(tmp_path):
+    input_dir = _create_input_dir(tmp_path)
+    with zipfile.ZipFile(input_dir / "bulk.zip", "w") as zf:
+        zf.writestr("all_xml/law0.xml", _wrap_api_response(TRICKY_LAW, "OTHER"))
+    output_dir = tmp_path / "output"
+    # 後から処理したもので law0_processed.xml が上書きされないように、何も書き出さずに失敗する
+    with pytest.raises(ValueError, match=r"law0: bulk\.zip!all_xml/law0\.xml, law0\.xml"):
+        EgovXmlProcessor(str(input_dir), str(output_dir)).process_all_files()
+    assert not list(output_dir.iterdir())
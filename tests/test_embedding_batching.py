@@ -0,0 +1,106 @@
+import json
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+import lawsy.main
+from lawsy.encoder.batching import EmbeddingBatchPolicy, embed_in_batches, iter_batches
+from lawsy.main import embed_article_chunks
+
+
+def test_iter_batches_by_items_and_tokens():
+    policy = EmbeddingBatchPolicy(max_items=3, max_tokens=10)
+    assert list(iter_batches([1, 1, 1, 1, 1], policy)) == [(0, 3), (3, 5)]
+    assert list(iter_batches([4, 4, 4, 1], policy)) == [(0, 2), (2, 4)]
+    # 1件で上限を超えるテキストは単独のバッチになる
+    assert list(iter_batches([2, 20, 2], policy)) == [(0, 1), (1, 2), (2, 3)]
+    assert list(iter_batches([], policy)) == []
+
+
+def test_iter_batches_padded():
+    policy = EmbeddingBatchPolicy(max_items=10, max_tokens=12, padded=True)
+    # 2件目までは 2 × 5 = 10、3件目を加えると 3 × 5 = 15 で上限を超える
+    assert list(iter_batches([5, 1, 1, 1], policy)) == [(0, 2), (2, 4)]
+
+
+def test_embed_in_batches_keeps_order():
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return np.asarray([[float(len(text))] for text in texts])
+
+    texts = ["a" * n for n in [3, 1, 4, 1, 5, 9, 2, 6]]
+    embeddings = embed_in_batches(
+        texts, embed, [len(text) for text in texts], EmbeddingBatchPolicy(max_items=3, max_tokens=10)
+    )
+    assert embeddings[:, 0].tolist() == [3, 1, 4, 1, 5, 9, 2, 6]
+    assert sum(calls) == len(texts)
+    assert all(n <= 3 for n in calls)
+
+
+def test_embed_in_batches_sorted_by_length():
+    batches = []
+
+    def embed(texts):
+        batches.append(texts)
+        return np.asarray([[float(len(text))] for text in texts])
+
+    texts = ["a" * n for n in [9, 1, 8, 2, 7, 1]]
+    policy = EmbeddingBatchPolicy(max_items=10, max_tokens=16, padded=True, sort_by_length=True)
+    embeddings = embed_in_batches(texts, embed, [len(text) for text in texts], policy)
+    # 短いものから順にまとめ、結果は入力の順序に戻す
+    assert [[len(text) for text in batch] for batch in batches] == [[1, 1, 2], [7, 8], [9]]
+    assert embeddings[:, 0].tolist() == [9, 1, 8, 2, 7, 1]
+
+
+class _BatchEncoder:
+    def __init__(self) -> None:
+        self.calls: list[list[str]] = []
+
+    def get_name(self) -> str:
+        return "batch"
+
+    def get_dimension(self) -> int:
+        return 2
+
+    def get_document_embeddings(self, documents: list[str]) -> np.ndarray:
+        self.calls.append(documents)
+        return np.asarray([[len(document), 1.0] for document in documents])
+
+
+@pytest.fixture
+def batch_encoder(monkeypatch):
+    encoder = _BatchEncoder()
+    monkeypatch.setattr(lawsy.main, "create_text_encoder", lambda *args, **kwargs: encoder)
+    return encoder
+
+
+def test_embed_article_chunks_batches_distinct_texts(tmp_path, batch_encoder):
+    records = [
+        {"file_name": "a", "anchor": f"Mp-At_{i}", "chunk": f"第{i % 3}条 本文" + "あ" * i, "chunk_hash": f"h{i % 3}"}
+        for i in range(7)
+    ]
+    input_file = tmp_path / "article_chunks.jsonl"
+    with open(input_file, "w") as fout:
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False), file=fout)
+
+    output_file = tmp_path / "embeddings.parquet"
+    embed_article_chunks(input_file, output_file, batch_size=4)
+
+    # 4件ずつまとめて、まだエンベディングのない本文だけを渡す
+    assert [len(documents) for documents in batch_encoder.calls] == [3]
+    table = pq.read_table(output_file).to_pylist()
+    assert [row["anchor"] for row in table] == [record["anchor"] for record in records]
+    embeddings = {row["chunk_hash"]: row["embedding"] for row in table}
+    for row in table:
+        assert row["embedding"] == embeddings[row["chunk_hash"]]
+    assert not (tmp_path / "embeddings.parquet.tmp").exists()
+
+    # 前のまとまりで計算したエンベディングは、同じ本文が残っている間は使い回す
+    batch_encoder.calls.clear()
+    embed_article_chunks(input_file, output_file, batch_size=2)
+    assert [len(documents) for documents in batch_encoder.calls] == [2, 1]
+    assert pq.read_table(output_file).to_pylist() == table
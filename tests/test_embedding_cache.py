@@ -0,0 +1,136 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from lawsy.encoder.cache import EmbeddingCache, embed_with_cache, make_cache_key, open_embedding_cache
+
+
+def test_make_cache_key():
+    key = make_cache_key("OpenAI-text-embedding-3-small", "", "第一条")
+    assert key == make_cache_key("OpenAI-text-embedding-3-small", "", "第一条")
+    assert key != make_cache_key("OpenAI-text-embedding-3-large", "", "第一条")
+    assert key != make_cache_key("OpenAI-text-embedding-3-small", "Retrieve passages", "第一条")
+    assert key != make_cache_key("OpenAI-text-embedding-3-small", "", "第二条")
+
+
+def test_cache_persists(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite3")
+    cache.put_many({"a": np.asarray([1.0, 2.0]), "b": np.asarray([3.0, 4.0])})
+    cache.close()
+
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite3")
+    found = cache.get_many(["a", "c", "a"])
+    assert list(found.keys()) == ["a"]
+    assert found["a"].dtype == np.float32
+    assert found["a"].tolist() == [1.0, 2.0]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(cache) == 2
+    assert cache.get_total_bytes() == 2 * 2 * 4
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # 1件 4次元 × 4バイト = 16バイト、上限は 3件分
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite3", max_bytes=48)
+    for key in ["a", "b", "c"]:
+        cache.put_many({key: np.zeros(4)})
+    cache.get_many(["a"])
+    cache.put_many({"d": np.zeros(4)})
+    assert cache.get_total_bytes() <= 48
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "d"}
+
+
+def test_get_many_defers_last_access_updates(tmp_path, monkeypatch):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite3")
+    cache.put_many({"a": np.zeros(2), "b": np.zeros(2)})
+
+    def read_last_access() -> dict[str, float]:
+        conn = sqlite3.connect(tmp_path / "embeddings.sqlite3")
+        try:
+            return dict(conn.execute("SELECT key, last_access FROM embeddings").fetchall())
+        finally:
+            conn.close()
+
+    before = read_last_access()
+    # 読み出しだけでは書き込まない
+    cache.get_many(["a"])
+    cache.get_many(["a", "b"])
+    assert read_last_access() == before
+    # 一定時間が経った後の読み出しで、まとめて書き込む
+    monkeypatch.setattr("lawsy.encoder.cache.ACCESS_FLUSH_SECONDS", 0.0)
+    cache.get_many(["b"])
+    after = read_last_access()
+    assert after["a"] > before["a"] and after["b"] > before["b"]
+    # 閉じるときにも書き込む
+    monkeypatch.setattr("lawsy.encoder.cache.ACCESS_FLUSH_SECONDS", 3600.0)
+    cache.get_many(["a"])
+    cache.close()
+    assert read_last_access()["a"] > after["a"]
+
+
+def test_embed_with_cache(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite3")
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        return np.asarray([[float(len(text)), 1.0] for text in texts])
+
+    texts = ["あ", "いい", "あ"]
+    embeddings = embed_with_cache(cache, texts, texts, embed)
+    assert embeddings.tolist() == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert calls == [["あ", "いい"]]
+
+    texts = ["ううう", "いい"]
+    embeddings = embed_with_cache(cache, texts, texts, embed)
+    assert embeddings.tolist() == [[3.0, 1.0], [2.0, 1.0]]
+    assert calls[-1] == ["ううう"]
+
+    # すべてキャッシュにある場合は呼ばない
+    embed_with_cache(cache, ["あ"], ["あ"], embed)
+    assert len(calls) == 2
+    # キャッシュがない場合はそのまま計算する
+    assert embed_with_cache(None, ["あ"], ["あ"], embed).tolist() == [[1.0, 1.0]]
+    # 切り詰める前のものを保存し、返すときに切り詰める
+    assert embed_with_cache(cache, ["ええええ"], ["ええええ"], embed, dim=1).tolist() == [[4.0]]
+    assert cache.get_many(["ええええ"])["ええええ"].tolist() == [4.0, 1.0]
+    assert embed_with_cache(None, ["あ"], ["あ"], embed, dim=1).tolist() == [[1.0]]
+
+
+def test_open_embedding_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("LAWSY_EMBEDDING_CACHE_DIR", raising=False)
+    assert open_embedding_cache() is None
+    monkeypatch.setenv("LAWSY_EMBEDDING_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("LAWSY_EMBEDDING_CACHE_MAX_MB", "1")
+    cache = open_embedding_cache()
+    assert cache is not None
+    assert cache.max_bytes == 1024 * 1024
+    assert cache.path.parent == tmp_path / "cache"
+
+
+def test_openai_encoder_uses_cache(tmp_path, monkeypatch):
+    pytest.importorskip("openai")
+    from lawsy.encoder.openai import OpenAITextEmbedding
+
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    encoder = OpenAITextEmbedding(dim=2, cache=EmbeddingCache(tmp_path / "embeddings.sqlite3"))
+    requests = []
+
+    def create(input, model):
+        requests.append(input)
+        data = [type("Embedding", (), {"embedding": [float(len(text)), 1.0, 0.0]}) for text in input]
+        return type("Response", (), {"data": data})
+
+    monkeypatch.setattr(encoder.client.embeddings, "create", create)
+    assert encoder.get_document_embeddings(["第一条", "第二条の二"]).tolist() == [[3.0, 1.0], [5.0, 1.0]]
+    assert encoder.get_document_embeddings(["第二条の二"]).tolist() == [[5.0, 1.0]]
+    assert len(requests) == 1
+    # クエリーは指示文が異なるため、同じテキストでも別に計算する
+    encoder.get_query_embeddings(["第一条"])
+    encoder.get_query_embeddings(["第一条"])
+    assert len(requests) == 2
+    # 次元だけが異なるエンコーダは、同じエントリーを切り詰めて使う
+    other = OpenAITextEmbedding(dim=3, cache=encoder.cache)
+    monkeypatch.setattr(other.client.embeddings, "create", create)
+    assert other.get_document_embeddings(["第一条"]).tolist() == [[3.0, 1.0, 0.0]]
+    assert len(requests) == 2
@@ -0,0 +1,80 @@
+from pathlib import Path
+
+import numpy as np
+
+from lawsy.data.xml_source import list_xml_sources
+from lawsy.utils.ingest_bench import IngestBenchmark
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+class _HashEncoder:
+    def __init__(self) -> None:
+        self.cache = object()
+        self.calls: list[tuple[list[str], object]] = []
+
+    def get_name(self) -> str:
+        return "hash"
+
+    def get_dimension(self) -> int:
+        return 3
+
+    def get_document_embeddings(self, documents: list[str]) -> np.ndarray:
+        self.calls.append((documents, self.cache))
+        return np.asarray([[len(document), hash(document) % 7, 1.0] for document in documents])
+
+
+def test_ingest_benchmark_report():
+    sources = list_xml_sources(DATA_DIR)
+    report = IngestBenchmark(sources, scale=3, repeat=2, dim=8).run()
+    assert [stage["name"] for stage in report["stages"]] == [
+        "read",
+        "parse",
+        "list_paths",
+        "render",
+        "serialize",
+        "index",
+    ]
+    stages = {stage["name"]: stage for stage in report["stages"]}
+    assert stages["read"]["num_laws"] == len(sources)
+    assert report["num_laws"] == stages["parse"]["num_laws"] == 3 * len(sources)
+    assert report["num_chunks"] == stages["render"]["num_chunks"] == stages["index"]["num_chunks"] > 0
+    assert report["num_articles"] == report["num_chunks"]
+    for stage in report["stages"]:
+        assert len(stage["seconds"]) == 2
+        assert stage["peak_traced_mb"] >= 0
+    assert stages["parse"]["peak_traced_mb"] > 0
+    assert stages["serialize"]["mb_per_sec"] > 0
+    assert report["peak_rss_mb"] > 0
+    assert report["options"]["dim"] == 8
+
+
+def test_ingest_benchmark_with_encoder():
+    encoder = _HashEncoder()
+    cache = encoder.cache
+    report = IngestBenchmark(list_xml_sources(DATA_DIR), scale=3, repeat=2, encoder=encoder, embed_sample=5).run()
+    stages = {stage["name"]: stage for stage in report["stages"]}
+    # エンベディングは repeat, scale によらず、重複を除いた標本について1回だけキャッシュを使わずに計算する
+    assert len(encoder.calls) == 1
+    documents, used_cache = encoder.calls[0]
+    assert len(documents) == len(set(documents)) == 5
+    assert used_cache is None and encoder.cache is cache
+    assert stages["embed"]["num_chunks"] == 5
+    assert stages["embed"]["seconds"] and len(stages["embed"]["seconds"]) == 1
+    assert stages["embed"]["peak_traced_mb"] is None
+    assert stages["index"]["num_chunks"] == report["num_chunks"] > 5
+    assert report["options"]["encoder"] == "hash"
+    assert report["options"]["embed_sample"] == 5
+    assert report["options"]["dim"] == 3
+
+
+def test_ingest_benchmark_without_embed_sample(tmp_path):
+    # 標本が空の場合はエンベディングの段階を省略し、エンコーダの次元でインデックスを作成する
+    for sources, embed_sample in [(list_xml_sources(DATA_DIR), 0), (list_xml_sources(tmp_path), 5)]:
+        encoder = _HashEncoder()
+        report = IngestBenchmark(sources, repeat=1, encoder=encoder, embed_sample=embed_sample).run()
+        stages = {stage["name"]: stage for stage in report["stages"]}
+        assert not encoder.calls
+        assert "embed" not in stages
+        assert stages["index"]["num_chunks"] == report["num_chunks"]
+        assert report["options"]["dim"] == 3
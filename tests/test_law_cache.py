@@ -0,0 +1,42 @@
+from pathlib import Path
+
+from lawsy.chunker.corpus import chunk_xml_file, create_chunker, iter_article_chunk_records
+from lawsy.parser.law_cache import LawCache, dump_law, load_law
+from lawsy.parser.parser import parse_from_xml_bytes
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def _chunk(law) -> list[dict]:
+    return list(iter_article_chunk_records(law, "sample_law_markup", create_chunker()))
+
+
+def test_law_cache_round_trip(tmp_path):
+    content = (DATA_DIR / "sample_law_markup.xml").read_bytes()
+    law = parse_from_xml_bytes(content)
+    expected = _chunk(law)
+    assert _chunk(load_law(dump_law(law))) == expected
+
+    cache = LawCache(tmp_path)
+    assert _chunk(cache.parse(content)) == expected
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert _chunk(cache.parse(content)) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+    # 内容が変わったXMLはパースし直す
+    cache.parse(content.replace("医薬品".encode(), "医療機器".encode()))
+    assert cache.misses == 2
+
+    # 壊れたキャッシュはパースし直して上書きする
+    cached_files = sorted(cache.cache_dir.glob("*/*.pkl"))
+    assert len(cached_files) == 2
+    for cached_file in cached_files:
+        cached_file.write_bytes(b"broken")
+    assert _chunk(LawCache(tmp_path).parse(content)) == expected
+
+
+def test_chunk_xml_file_with_law_cache(tmp_path):
+    for options in [{"indent": 2}, {"indent": 4}, {"strategy": "sub-article", "max_tokens": 80}]:
+        for xml_file in sorted(DATA_DIR.glob("*.xml")):
+            expected = chunk_xml_file(xml_file, options)
+            assert chunk_xml_file(xml_file, options, law_cache_dir=tmp_path) == expected
+            assert chunk_xml_file(xml_file, options, law_cache_dir=tmp_path) == expected
@@ -0,0 +1,20 @@
+from pathlib import Path
+
+import pytest
+
+from lawsy.chunker.corpus import chunk_xml_file
+from lawsy.chunker.lxml_extractor import chunk_xml_file_lxml
+
+DATA_DIR = Path(__file__).parent / "data"
+# make pharma-process-xml で作成される薬事関連法令（存在する場合のみ検証する）
+PHARMA_XML_DIR = Path(__file__).parent.parent / "data" / "pharma_xml_processed"
+XML_FILES = sorted(DATA_DIR.glob("*.xml")) + sorted(PHARMA_XML_DIR.glob("*.xml"))
+
+
+@pytest.mark.parametrize("xml_file", XML_FILES, ids=[xml_file.name for xml_file in XML_FILES])
+@pytest.mark.parametrize("indent", [0, 2])
+def test_lxml_extractor_matches_article_chunker(xml_file, indent):
+    expected = chunk_xml_file(xml_file, {"indent": indent, "strategy": "article"})
+    actual = chunk_xml_file_lxml(xml_file, indent=indent)
+    assert len(expected) > 0
+    assert actual == expected
@@ -0,0 +1,148 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+ort = pytest.importorskip("onnxruntime")
+onnx = pytest.importorskip("onnx")
+tokenizers = pytest.importorskip("tokenizers")
+
+from lawsy.encoder.batching import EmbeddingBatchPolicy  # noqa: E402
+from lawsy.encoder.me5_onnx import (  # noqa: E402
+    CONFIG_FILE_NAME,
+    EXTERNAL_DATA_SUFFIX,
+    MODEL_FILE_NAME,
+    QUANTIZED_MODEL_FILE_NAME,
+    TOKENIZER_FILE_NAME,
+    ME5InstructOnnx,
+    quantize_onnx_model,
+    save_onnx_model_with_external_data,
+)
+
+TEXTS = [
+    "Instruct: Given a query, return the relevant law documents.\nQuery: 薬局 の 開設 の 許可",
+    "第一条 この 法律 は 医薬品 の 品質 を 確保 する",
+    "薬局 を 開設 しよう と する 者 は 都道府県知事 の 許可 を 受け なければ ならない",
+    "許可",
+]
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / np.linalg.norm(a, axis=1) / np.linalg.norm(b, axis=1)
+
+
+def _create_tiny_model_dir(path, vocab_size: int = 64, dim: int = 16, hidden: int = 32):
+    """埋め込み → 2層のMLP → 平均プーリング の小さなモデルを、export_me5_onnx と同じ形式で保存する"""
+    from onnx import TensorProto, helper, numpy_helper
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+
+    words = sorted({word for text in TEXTS for word in text.split()})
+    vocab = {"<s>": 0, "<pad>": 1, "</s>": 2, "<unk>": 3}
+    for word in words:
+        vocab.setdefault(word, len(vocab))
+    assert len(vocab) <= vocab_size
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>", special_tokens=[("<s>", 0), ("</s>", 2)]
+    )
+    tokenizer.save(str(path / TOKENIZER_FILE_NAME))
+
+    rng = np.random.default_rng(0)
+    weights = {
+        "embeddings": rng.standard_normal((vocab_size, dim)).astype(np.float32),
+        "w1": (rng.standard_normal((dim, hidden)) / np.sqrt(dim)).astype(np.float32),
+        "w2": (rng.standard_normal((hidden, dim)) / np.sqrt(hidden)).astype(np.float32),
+    }
+    nodes = [
+        helper.make_node("Gather", ["embeddings", "input_ids"], ["x"]),
+        helper.make_node("MatMul", ["x", "w1"], ["h1"]),
+        helper.make_node("Relu", ["h1"], ["a1"]),
+        helper.make_node("MatMul", ["a1", "w2"], ["h2"]),
+        helper.make_node("Add", ["x", "h2"], ["hidden"]),
+        helper.make_node("Cast", ["attention_mask"], ["mask"], to=TensorProto.FLOAT),
+        helper.make_node("Unsqueeze", ["mask", "axis2"], ["mask3"]),
+        helper.make_node("Mul", ["hidden", "mask3"], ["masked"]),
+        helper.make_node("ReduceSum", ["masked", "axis1"], ["summed"], keepdims=0),
+        helper.make_node("ReduceSum", ["mask3", "axis1"], ["count"], keepdims=0),
+        helper.make_node("Div", ["summed", "count"], ["embedding"]),
+    ]
+    initializers = [numpy_helper.from_array(value, name) for name, value in weights.items()]
+    initializers += [
+        numpy_helper.from_array(np.asarray([2], dtype=np.int64), "axis2"),
+        numpy_helper.from_array(np.asarray([1], dtype=np.int64), "axis1"),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "tiny_e5",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"]),
+        ],
+        [helper.make_tensor_value_info("embedding", TensorProto.FLOAT, ["batch", dim])],
+        initializers,
+    )
+    # onnxruntime が読める IR のバージョンに合わせる（opset 17 は IR 8）
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8)
+    save_onnx_model_with_external_data(model, path / MODEL_FILE_NAME)
+    quantize_onnx_model(path / MODEL_FILE_NAME, path / QUANTIZED_MODEL_FILE_NAME)
+    with open(path / CONFIG_FILE_NAME, "w") as fout:
+        json.dump({"model_name": "tiny-e5", "dim": dim, "pad_token_id": 1}, fout)
+
+    def reference(texts: list[str]) -> np.ndarray:
+        embeddings = []
+        for encoding in tokenizer.encode_batch(texts):
+            x = weights["embeddings"][encoding.ids]
+            hidden = x + np.maximum(x @ weights["w1"], 0) @ weights["w2"]
+            embeddings.append(hidden.mean(axis=0))
+        return np.asarray(embeddings)
+
+    return reference
+
+
+def test_onnx_encoder_matches_reference(tmp_path):
+    reference = _create_tiny_model_dir(tmp_path)
+    encoder = ME5InstructOnnx(
+        tmp_path, quantized=False, batch_policy=EmbeddingBatchPolicy(max_items=2, max_tokens=64, sort_by_length=True)
+    )
+    assert encoder.get_dimension() == 16
+    embeddings = encoder.get_document_embeddings(TEXTS)
+    # パディングしたバッチで計算しても、1件ずつ計算したものと同じで、入力の順序に並ぶ
+    np.testing.assert_allclose(embeddings, reference(TEXTS), rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(encoder.get_document_embeddings(TEXTS[3:]), embeddings[3:], rtol=1e-4, atol=1e-5)
+    assert encoder.get_document_embeddings([]).shape == (0, 16)
+
+
+def test_quantized_onnx_encoder_parity(tmp_path):
+    reference = _create_tiny_model_dir(tmp_path)
+    # 重みは protobuf の2GBの上限を超えないように外部データに保存する
+    assert (tmp_path / (MODEL_FILE_NAME + EXTERNAL_DATA_SUFFIX)).exists()
+    assert (tmp_path / (QUANTIZED_MODEL_FILE_NAME + EXTERNAL_DATA_SUFFIX)).exists()
+    encoder = ME5InstructOnnx(tmp_path, quantized=True)
+    assert encoder.get_name() == "E5InstructONNX-int8-tiny-e5"
+    cosines = _cosine(encoder.get_document_embeddings(TEXTS), reference(TEXTS))
+    assert cosines.min() > 0.99
+
+
+@pytest.mark.skipif(
+    not os.getenv("LAWSY_TEST_ME5_ONNX_DIR"),
+    reason="LAWSY_TEST_ME5_ONNX_DIR (a directory written by export-onnx-encoder) is not set",
+)
+def test_quantized_me5_parity_with_transformers():
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from lawsy.encoder.me5 import ME5Instruct
+
+    onnx_encoder = ME5InstructOnnx(os.environ["LAWSY_TEST_ME5_ONNX_DIR"], quantized=True)
+    encoder = ME5Instruct(onnx_encoder.model_name, device="cpu")
+    queries = ["薬局の開設に必要な許可", "医薬品の広告の規制"]
+    documents = [
+        "薬局は、その所在地の都道府県知事の許可を受けなければ、開設してはならない。",
+        "何人も、医薬品等の名称、製造方法、効能、効果又は性能に関して、虚偽又は誇大な記事を広告してはならない。",
+    ]
+    assert _cosine(onnx_encoder.get_query_embeddings(queries), encoder.get_query_embeddings(queries)).min() > 0.98
+    assert (
+        _cosine(onnx_encoder.get_document_embeddings(documents), encoder.get_document_embeddings(documents)).min()
+        > 0.98
+    )
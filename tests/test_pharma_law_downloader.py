@@ -0,0 +1,190 @@
+import asyncio
+import time
+from datetime import date
+
+from lawsy.data.law_discovery import LawGraph, extract_law_numbers
+from lawsy.data.law_download_engine import TokenBucket
+from lawsy.data.pharma_law_downloader import PharmaLawDownloader
+
+
+def _add_pharma_laws(stub) -> None:
+    for law_info in PharmaLawDownloader.PHARMA_LAWS.values():
+        stub.add_law(law_info["law_id"], law_info["title"])
+
+
+def test_token_bucket_limits_request_rate():
+    async def acquire_all(bucket: TokenBucket, n: int) -> float:
+        start = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 容量1・秒間20リクエストなら、5回目の取得までに少なくとも 4/20 秒かかる
+    elapsed = asyncio.run(acquire_all(TokenBucket(rate=20), 5))
+    assert elapsed >= 0.19
+
+
+def test_async_download_skips_unchanged_laws(tmp_path, egov_api_stub):
+    _add_pharma_laws(egov_api_stub)
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    results = downloader.download_all_pharma_laws_async(requests_per_second=100, max_concurrency=3)
+    assert all(success for success, _ in results.values())
+    xml_files = sorted(tmp_path.glob("*.xml"))
+    assert len(xml_files) == len(PharmaLawDownloader.PHARMA_LAWS)
+    log_text = downloader.log_file.read_text(encoding="utf-8")
+    mtimes = {xml_file: xml_file.stat().st_mtime_ns for xml_file in xml_files}
+
+    # 2回目は条件付きGETで304になり、ファイルもログも書き換えない
+    egov_api_stub.requests.clear()
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    results = downloader.download_all_pharma_laws_async(requests_per_second=100, max_concurrency=3)
+    assert all(success for success, _ in results.values())
+    assert all("If-None-Match" in headers for _, headers in egov_api_stub.requests)
+    assert downloader.log_file.read_text(encoding="utf-8") == log_text
+    assert {xml_file: xml_file.stat().st_mtime_ns for xml_file in xml_files} == mtimes
+
+    # 改正された法令だけが再保存される
+    law_info = PharmaLawDownloader.PHARMA_LAWS["gmp_ordinance"]
+    egov_api_stub.add_law(law_info["law_id"], law_info["title"], sentence="この省令は、令和七年四月一日から施行する。")
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    downloader.download_all_pharma_laws_async(requests_per_second=100, max_concurrency=3)
+    changed = [xml_file for xml_file in xml_files if xml_file.stat().st_mtime_ns != mtimes[xml_file]]
+    assert [xml_file.name for xml_file in changed] == [f"GMP省令_{law_info['law_id']}.xml"]
+    assert "令和七年" in changed[0].read_text(encoding="utf-8")
+
+
+def test_async_download_uses_content_hash_of_existing_files(tmp_path, egov_api_stub):
+    # 同期版でダウンロード済みのファイルは、ログにETagがなくても内容のハッシュで変更なしと判定する
+    _add_pharma_laws(egov_api_stub)
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    downloader.download_all_pharma_laws(delay=0)
+    downloader.download_log.pop("validators")
+    downloader._save_log()
+    num_downloads = len(downloader.download_log["downloads"])
+    xml_files = sorted(tmp_path.glob("*.xml"))
+    mtimes = {xml_file: xml_file.stat().st_mtime_ns for xml_file in xml_files}
+
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    results = downloader.download_all_pharma_laws_async(requests_per_second=100, max_concurrency=3)
+    assert all(success for success, _ in results.values())
+    assert {xml_file: xml_file.stat().st_mtime_ns for xml_file in xml_files} == mtimes
+    assert len(downloader.download_log["downloads"]) == num_downloads
+    # 新しいETagは記録し、次回は条件付きGETで304になる
+    validators = downloader.download_log["validators"]
+    assert all(validators[law_info["law_id"]]["etag"] for law_info in PharmaLawDownloader.PHARMA_LAWS.values())
+    log_text = downloader.log_file.read_text(encoding="utf-8")
+
+    egov_api_stub.requests.clear()
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    downloader.download_all_pharma_laws_async(requests_per_second=100, max_concurrency=3)
+    assert all("If-None-Match" in headers for _, headers in egov_api_stub.requests)
+    assert downloader.log_file.read_text(encoding="utf-8") == log_text
+
+
+def _update_law_list(law_ids: list[str]) -> bytes:
+    infos = "".join(f"<LawNameListInfo><LawId>{law_id}</LawId></LawNameListInfo>" for law_id in law_ids)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<DataRoot><Result><Code>0</Code><Message/></Result><ApplData>{infos}</ApplData></DataRoot>""".encode("utf-8")
+
+
+def test_sync_fetches_only_updated_laws(tmp_path, egov_api_stub):
+    _add_pharma_laws(egov_api_stub)
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    # 初回は全ての対象法令を取得する
+    results = downloader.sync_laws(until=date(2025, 4, 1), requests_per_second=100)
+    assert len(results) == len(PharmaLawDownloader.PHARMA_LAWS)
+    assert downloader.download_log["last_sync"] == "20250401"
+
+    # 2回目は前回の同期日から until までの更新法令一覧に現れた対象法令だけを取得する
+    gcp_law_id = PharmaLawDownloader.PHARMA_LAWS["gcp_ordinance"]["law_id"]
+    egov_api_stub.add_law(gcp_law_id, "GCP", sentence="この省令は、令和七年四月二日から施行する。")
+    egov_api_stub.routes["updatelawlists/20250401"] = _update_law_list([])
+    egov_api_stub.routes["updatelawlists/20250402"] = _update_law_list(["999AC0000000001", gcp_law_id])
+    egov_api_stub.routes["updatelawlists/20250403"] = _update_law_list([])
+    egov_api_stub.requests.clear()
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    results = downloader.sync_laws(until=date(2025, 4, 3), requests_per_second=100)
+    assert list(results.keys()) == ["gcp_ordinance"]
+    assert sorted(egov_api_stub.requested_paths()) == [
+        f"/api/1/lawdata/{gcp_law_id}",
+        "/api/1/updatelawlists/20250401",
+        "/api/1/updatelawlists/20250402",
+        "/api/1/updatelawlists/20250403",
+    ]
+    assert downloader.download_log["last_sync"] == "20250403"
+    assert downloader.download_log["syncs"][-1]["files"] == [f"GCP省令_{gcp_law_id}.xml"]
+
+    # 一覧の取得に失敗した日があれば last_sync を進めない
+    egov_api_stub.routes.pop("updatelawlists/20250403")
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    downloader.sync_laws(until=date(2025, 4, 4), requests_per_second=100)
+    assert downloader.download_log["last_sync"] == "20250403"
+
+
+def test_extract_law_numbers():
+    text = (
+        "昭和三十五年法律第百四十五号第二条及び平成十六年厚生労働省令第百七十九号の規定により、"
+        "昭和三十五年法律第百四十五号"
+    )
+    assert extract_law_numbers(text) == ["昭和三十五年法律第百四十五号", "平成十六年厚生労働省令第百七十九号"]
+
+
+def test_discover_related_laws(tmp_path, egov_api_stub):
+    _add_pharma_laws(egov_api_stub)
+    yakki = PharmaLawDownloader.PHARMA_LAWS["yakki_law"]
+    gmp = PharmaLawDownloader.PHARMA_LAWS["gmp_ordinance"]
+    related = {
+        # (法令ID, 法令名, 法令番号, 本文)
+        "order": (
+            "336CO0000000011",
+            yakki["title"] + "施行令",
+            "昭和三十六年政令第十一号",
+            "昭和二十三年法律第二百五号の規定による。",
+        ),
+        "rule": ("336M50000100001", yakki["title"] + "施行規則", "昭和三十六年厚生省令第一号", ""),
+        "iryo": ("323AC0000000205", "医療法", "昭和二十三年法律第二百五号", ""),
+    }
+    for law_id, law_name, _, sentence in related.values():
+        egov_api_stub.add_law(law_id, law_name, sentence=sentence or "この法律は、公布の日から施行する。")
+    sentence = "昭和三十六年厚生省令第一号及び平成十六年厚生労働省令第百七十九号"
+    egov_api_stub.add_law(yakki["law_id"], yakki["title"], sentence=sentence)
+    law_list = [(gmp["law_id"], gmp["title"], "平成十六年厚生労働省令第百七十九号")] + [
+        (law_id, law_name, law_no) for law_id, law_name, law_no, _ in related.values()
+    ]
+    infos = "".join(
+        f"<LawNameListInfo><LawId>{law_id}</LawId><LawName>{law_name}</LawName><LawNo>{law_no}</LawNo></LawNameListInfo>"
+        for law_id, law_name, law_no in law_list
+    )
+    law_list_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
+<DataRoot><Result><Code>0</Code><Message/></Result><ApplData><Category>1</Category>{infos}</ApplData></DataRoot>"""
+    egov_api_stub.routes["lawlists/1"] = law_list_xml.encode("utf-8")
+
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    results = downloader.discover_related_laws(max_depth=1, requests_per_second=100)
+    assert all(success for success, _ in results.values())
+    graph = LawGraph.load(downloader.graph_file)
+    # 深さ1までなので、施行令が参照する医療法は辿らない
+    assert set(graph.nodes) == {law_info["law_id"] for law_info in PharmaLawDownloader.PHARMA_LAWS.values()} | {
+        related["order"][0],
+        related["rule"][0],
+    }
+    assert sorted(graph.edges) == sorted(
+        [
+            (yakki["law_id"], related["order"][0], "enforcement"),
+            (yakki["law_id"], related["rule"][0], "enforcement"),
+            (yakki["law_id"], related["rule"][0], "reference"),
+            (yakki["law_id"], gmp["law_id"], "reference"),
+        ]
+    )
+    assert graph.nodes[related["order"][0]]["category"] == "cabinet_order"
+    assert (tmp_path / f"{related['order'][1]}_{related['order'][0]}.xml").exists()
+    # 見つかった関連法令は差分同期の対象にも含まれる
+    assert related["rule"][0] in downloader.get_target_laws()
+
+    downloader = PharmaLawDownloader(output_dir=str(tmp_path), base_url=egov_api_stub.base_url)
+    downloader.discover_related_laws(max_depth=2, requests_per_second=100)
+    assert related["iryo"][0] in LawGraph.load(downloader.graph_file).nodes
+
+    # 法令数の上限を超えて探索しない
+    downloader.discover_related_laws(max_depth=2, max_laws=6, requests_per_second=100)
+    assert len(LawGraph.load(downloader.graph_file).nodes) == 6
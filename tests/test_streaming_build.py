@@ -0,0 +1,105 @@
+import json
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from lawsy.data.xml_source import list_xml_sources
+from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
+from lawsy.utils.streaming_build import StreamingIndexBuilder
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+class _LengthEncoder:
+    def __init__(self, fail_after: int | None = None) -> None:
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def get_document_embeddings(self, documents: list[str]) -> np.ndarray:
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("encoder failed")
+        return np.asarray([[len(document), document.count("条"), 1.0, 0.5] for document in documents])
+
+
+def _create_xml_dir(tmp_path: Path) -> Path:
+    xml_dir = tmp_path / "xml"
+    xml_dir.mkdir()
+    # 同じ内容の2つの版（日付の新しいものがファイル名順では先）
+    shutil.copy(DATA_DIR / "sample_law.xml", xml_dir / "A_20240401_new.xml")
+    shutil.copy(DATA_DIR / "sample_law.xml", xml_dir / "B_20200401_old.xml")
+    shutil.copy(DATA_DIR / "sample_law_markup.xml", xml_dir / "sample_law_markup.xml")
+    return xml_dir
+
+
+def test_streaming_build(tmp_path):
+    xml_dir = _create_xml_dir(tmp_path)
+    # create-article-chunks のマニフェストは書き換えた JSONL と合わないため削除される
+    (tmp_path / "article_chunks.manifest.json").write_text("{}")
+    builder = StreamingIndexBuilder(_LengthEncoder(), batch_size=2, queue_size=1, dim=3)
+    stats = builder.build(xml_dir, tmp_path / "index", output_jsonl_file=tmp_path / "article_chunks.jsonl")
+
+    records = [json.loads(line) for line in open(tmp_path / "article_chunks.jsonl")]
+    assert stats.num_chunks == len(records) == 6 + 6 + 4
+    assert stats.num_duplicates == 6
+    assert stats.num_indexed == 10
+    assert stats.max_queued_batches <= 1
+    assert (tmp_path / "article_chunks.structure.json").exists()
+    assert not (tmp_path / "article_chunks.manifest.json").exists()
+
+    retriever = FaissFlatArticleRetriever.load(tmp_path / "index")
+    assert retriever.vector_dim == 3
+    assert len(retriever.meta_data) == 10
+    # 重複するチャンクは日付の古い版のものが残る
+    assert {meta["file_name"] for meta in retriever.meta_data} == {"B_20200401_old", "sample_law_markup"}
+    article = retriever.get_article("B_20200401_old", "Mp-Ch_1-At_1")
+    assert article is not None
+    hit = retriever.search(retriever.get_vector(article), k=1)[0]
+    assert hit.snippet == article.snippet
+
+
+def test_streaming_build_failure_keeps_existing_outputs(tmp_path):
+    xml_dir = _create_xml_dir(tmp_path)
+    StreamingIndexBuilder(_LengthEncoder(), batch_size=2).build(xml_dir, tmp_path / "index")
+    before = (tmp_path / "index" / "meta.jsonl").read_text()
+
+    with pytest.raises(RuntimeError, match="encoder failed"):
+        StreamingIndexBuilder(_LengthEncoder(fail_after=1), batch_size=2, queue_size=1).build(
+            xml_dir, tmp_path / "index", output_jsonl_file=tmp_path / "article_chunks.jsonl"
+        )
+    assert (tmp_path / "index" / "meta.jsonl").read_text() == before
+    assert not (tmp_path / "index" / "meta.jsonl.tmp").exists()
+    assert not (tmp_path / "article_chunks.jsonl").exists()
+    assert not (tmp_path / "article_chunks.jsonl.tmp").exists()
+
+
+class _CountingSources:
+    """読み出された（ワーカーに投入された）ソースの数を数える"""
+
+    def __init__(self, sources) -> None:
+        self.sources = sources
+        self.num_pulled = 0
+
+    def __iter__(self):
+        for source in self.sources:
+            self.num_pulled += 1
+            yield source
+
+
+def test_parallel_chunking_keeps_files_in_flight_bounded(tmp_path):
+    xml_dir = tmp_path / "xml"
+    xml_dir.mkdir()
+    for i in range(12):
+        shutil.copy(DATA_DIR / "sample_law.xml", xml_dir / f"law{i:02d}.xml")
+    sources = _CountingSources(list_xml_sources(xml_dir))
+    builder = StreamingIndexBuilder(_LengthEncoder(), batch_size=1, workers=2)
+    in_flight = []
+    for _ in builder.iter_record_batches(sources):  # type: ignore[arg-type]
+        in_flight.append(sources.num_pulled - builder.stats.num_files)
+        # 消費側が遅くても、投入済みで未消費のファイルは workers * 2 件までに抑えられる
+        time.sleep(0.01)
+    assert builder.stats.num_files == 12
+    assert max(in_flight) <= 4
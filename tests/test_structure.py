@@ -0,0 +1,92 @@
+from pathlib import Path
+
+import numpy as np
+
+from lawsy.chunker.corpus import chunk_xml_file
+from lawsy.chunker.structure import StructureIndex
+from lawsy.retriever.article_search.faiss import FaissFlatArticleRetriever
+
+DATA_DIR = Path(__file__).parent / "data"
+FILE_NAME = "sample_law"
+
+
+def test_structure_index_paths_and_siblings(tmp_path):
+    records = chunk_xml_file(DATA_DIR / "sample_law.xml", {"strategy": "sub-article", "max_tokens": 80})
+    structure = StructureIndex.build(records)
+    assert len(structure) == len(records)
+
+    path = structure.get_path(FILE_NAME, "Mp-Ch_2-Se_1-At_3")
+    assert [node.anchor for node in path] == ["", "Mp", "Mp-Ch_2", "Mp-Ch_2-Se_1", "Mp-Ch_2-Se_1-At_3"]
+    assert path[1].title == "本則"
+    assert path[2].title.startswith("第二章")
+    assert path[3].title.startswith("第一節")
+
+    # 条単位のチャンクは同じ章・節の条、項単位のチャンクは同じ条の項が兄弟になる
+    assert structure.get_siblings(FILE_NAME, "Mp-Ch_2-Se_1-At_3") == ["Mp-Ch_2-Se_1-At_3", "Mp-Ch_2-Se_1-At_3_2"]
+    assert structure.get_siblings(FILE_NAME, "Mp-Ch_1-At_2-Pr_2") == [
+        "Mp-Ch_1-At_2-Pr_1",
+        "Mp-Ch_1-At_2-Pr_2",
+        "Mp-Ch_1-At_2-Pr_2-It_1",
+        "Mp-Ch_1-At_2-Pr_2-It_2",
+    ]
+    assert structure.get_siblings(FILE_NAME, "Mp-Ch_1-At_2-Pr_2", level=2)[0] == "Mp-Ch_1-At_1"
+
+    # 前後のチャンクは本則・附則をまたがない
+    assert structure.get_neighbors(FILE_NAME, "Mp-Ch_1-At_2-Pr_2") == ["Mp-Ch_1-At_2-Pr_1", "Mp-Ch_1-At_2-Pr_2-It_1"]
+    assert structure.get_neighbors(FILE_NAME, "Mp-Ch_2-Se_1-At_3_2", before=2) == [
+        "Mp-Ch_1-At_2-Pr_2-It_2",
+        "Mp-Ch_2-Se_1-At_3",
+        "Mp-Ch_2-Se_2-Ss_1-Di_1-At_4-Pr_1",
+    ]
+    assert structure.get_neighbors(FILE_NAME, "Sp-At_1") == []
+    assert structure.get_neighbors(FILE_NAME, "Mp-At_99") == []
+
+    structure.save(tmp_path / "article_chunks.structure.json")
+    loaded = StructureIndex.load(tmp_path / "article_chunks.structure.json")
+    assert loaded.get_path(FILE_NAME, "Mp-Ch_2-Se_1-At_3") == path
+    assert loaded.get_siblings(FILE_NAME, "Mp-Ch_1-At_2-Pr_2", level=2) == structure.get_siblings(
+        FILE_NAME, "Mp-Ch_1-At_2-Pr_2", level=2
+    )
+
+    retriever = FaissFlatArticleRetriever.create(dim=len(records))
+    retriever.add(np.eye(len(records), dtype=np.float32), records)
+    hit = retriever.search(np.eye(len(records))[5], k=1)[0]
+    assert hit.anchor == "Mp-Ch_2-Se_1-At_3"
+    context = retriever.get_context_articles(hit, loaded, scope="siblings")
+    assert [result.anchor for result in context] == ["Mp-Ch_2-Se_1-At_3_2"]
+    context = retriever.get_context_articles(hit, loaded, scope="neighbors", window=1)
+    assert [result.anchor for result in context] == ["Mp-Ch_1-At_2-Pr_2-It_2", "Mp-Ch_2-Se_1-At_3_2"]
+
+
+def test_add_context_articles():
+    records = chunk_xml_file(DATA_DIR / "sample_law.xml", {"strategy": "sub-article", "max_tokens": 80})
+    structure = StructureIndex.build(records)
+    retriever = FaissFlatArticleRetriever.create(dim=len(records))
+    retriever.add(np.eye(len(records), dtype=np.float32), records)
+    hits = [retriever.search(np.eye(len(records))[i], k=1)[0] for i in (5, 6)]
+    assert [hit.anchor for hit in hits] == ["Mp-Ch_2-Se_1-At_3", "Mp-Ch_2-Se_1-At_3_2"]
+
+    # 前後のチャンクのうち検索結果にないものを後ろに加える
+    expanded = retriever.add_context_articles(hits, structure, scope="neighbors")
+    assert [result.anchor for result in expanded] == [
+        "Mp-Ch_2-Se_1-At_3",
+        "Mp-Ch_2-Se_1-At_3_2",
+        "Mp-Ch_1-At_2-Pr_2-It_2",
+        "Mp-Ch_2-Se_2-Ss_1-Di_1-At_4-Pr_1",
+    ]
+    assert expanded[2].score is None
+    expanded = retriever.add_context_articles(hits[:1], structure, scope="siblings")
+    assert [result.anchor for result in expanded] == ["Mp-Ch_2-Se_1-At_3", "Mp-Ch_2-Se_1-At_3_2"]
+    expanded = retriever.add_context_articles(hits[:1], structure, scope="neighbors", window=3, max_per_article=1)
+    assert [result.anchor for result in expanded] == ["Mp-Ch_2-Se_1-At_3", "Mp-Ch_1-At_2-Pr_2"]
+
+
+def test_structure_index_nested_divisions():
+    records = chunk_xml_file(DATA_DIR / "sample_law_markup.xml")
+    structure = StructureIndex.build(records)
+    file_name = records[0]["file_name"]
+    path = structure.get_path(file_name, "Mp-Pa_1-Ch_1-Se_1-Di_1-At_2")
+    assert [node.title for node in path[2:6]] == ["第一編　総則", "第一章　定義", "第一節　用語", "第一目　医薬品"]
+    assert path[-1].title == "第二条"
+    # 編の配下には、章に属さない条も含まれる
+    assert structure.get_siblings(file_name, "Mp-Pa_1-At_1") == [record["anchor"] for record in records]
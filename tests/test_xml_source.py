@@ -0,0 +1,58 @@
+import zipfile
+from pathlib import Path
+
+from lawsy.chunker.corpus import chunk_xml_file, map_chunk_xml_files
+from lawsy.data import xml_source
+from lawsy.data.xml_source import close_archives, find_stem_collisions, list_xml_sources, open_archive
+
+DATA_DIR = Path(__file__).parent / "data"
+SAMPLE_LAW_XML = DATA_DIR / "sample_law.xml"
+
+
+def test_list_xml_sources_reads_zip_members_without_extracting(tmp_path):
+    (tmp_path / "laws").mkdir()
+    (tmp_path / "laws" / "a.xml").write_bytes(SAMPLE_LAW_XML.read_bytes())
+    with zipfile.ZipFile(tmp_path / "laws" / "bulk.zip", "w") as zf:
+        zf.write(SAMPLE_LAW_XML, "all_xml/sample_law.xml")
+        zf.writestr("all_xml/readme.txt", "not a law")
+
+    sources = list_xml_sources(tmp_path / "laws")
+    assert [source.key for source in sources] == ["a.xml", "bulk.zip!all_xml/sample_law.xml"]
+    assert sources[1].stem == "sample_law"
+    assert sources[1].compute_fingerprint().startswith("crc32:")
+    assert sources[1].read_bytes() == SAMPLE_LAW_XML.read_bytes()
+
+    expected = chunk_xml_file(SAMPLE_LAW_XML)
+    assert chunk_xml_file(sources[1]) == expected
+    assert chunk_xml_file(sources[1], extractor="lxml") == expected
+    # ワーカーにはアーカイブのパスとメンバー名だけが渡される
+    assert list(map_chunk_xml_files(list_xml_sources(tmp_path / "laws" / "bulk.zip"), workers=2)) == [expected]
+
+
+def test_open_archive_closes_evicted_archives(tmp_path, monkeypatch):
+    monkeypatch.setattr(xml_source, "MAX_OPEN_ARCHIVES", 2)
+    close_archives()
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / f"bulk{i}.zip")
+        with zipfile.ZipFile(paths[-1], "w") as zf:
+            zf.write(SAMPLE_LAW_XML, "sample_law.xml")
+    archives = [open_archive(path) for path in paths]
+    # 上限を超えて追い出されたアーカイブは閉じられる
+    assert archives[0].fp is None
+    assert archives[1].fp is not None and archives[2].fp is not None
+    assert open_archive(paths[2]) is archives[2]
+    close_archives()
+    assert all(archive.fp is None for archive in archives)
+
+
+def test_find_stem_collisions(tmp_path):
+    (tmp_path / "sample_law.xml").write_bytes(SAMPLE_LAW_XML.read_bytes())
+    with zipfile.ZipFile(tmp_path / "bulk.zip", "w") as zf:
+        zf.write(SAMPLE_LAW_XML, "a/sample_law.xml")
+        zf.write(SAMPLE_LAW_XML, "b/sample_law.xml")
+        zf.write(SAMPLE_LAW_XML, "b/other_law.xml")
+    collisions = find_stem_collisions(list_xml_sources(tmp_path))
+    assert {stem: [source.key for source in group] for stem, group in collisions.items()} == {
+        "sample_law": ["bulk.zip!a/sample_law.xml", "bulk.zip!b/sample_law.xml", "sample_law.xml"]
+    }